@@ -1,11 +1,227 @@
-from flask import Flask, jsonify, request, Response
-from database import MovieDatabase
-import random
-import requests
+from flask import Flask, jsonify, request, Response, send_file, stream_with_context, g
+from database import MovieDatabase, ConnectionPool, sort_key_of, project_columns, iter_json_array, MOVIE_COLUMNS, MOVIE_FILTERS, SORT_KEYS
+from image_cache import ImageCache
+from image_proxy import ImageProxy, UpstreamBusy
+from random_picker import RandomPicker
+from similarity import SimilarityIndex, NEIGHBORS
+from response_cache import ResponseCache
+from json_provider import FastJSONProvider
+from compression import negotiate, compress, MIN_COMPRESS_BYTES, COMPRESSIBLE_MIMETYPES
+from fetcher import IMAGE_HEADERS
+from metrics import REGISTRY, METRICS_ENABLED, histogram, counter, gauge, callback_counter
+import thumbnails
+import base64
+import csv
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import time
+import zlib
+
+# 数据库文件与只读连接池大小
+DB_FILE = 'movies.db'
+READ_POOL_SIZE = 8
+
+# 列表和详情接口的响应缓存：最多缓存的响应数、有效期（秒）
+RESPONSE_CACHE_SIZE = 256
+RESPONSE_CACHE_TTL = 300
+
+# 导出接口每次发送的文本块大小（字符数）
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# 搜索接口每页最多返回的电影数
+MAX_SEARCH_PER_PAGE = 100
+
+# 随机接口一次最多返回的电影数
+MAX_RANDOM_COUNT = 50
+
+# 批量查询接口一次最多查询的电影数
+MAX_BATCH_IDS = 500
+
+# 电影 ID 的上限（SQLite INTEGER 为 64 位有符号整数，更大的数无法作为查询参数）
+MAX_MOVIE_ID = 2 ** 63 - 1
+
+# 分页游标中各排序方式的排序键类型（见 database.sort_key_of）
+CURSOR_KEY_TYPES = {
+    'time': int,
+    'rating': (int, float),
+    'title': str,
+}
+
+# 相似电影接口默认返回的电影数（最多 similarity.NEIGHBORS 部）
+DEFAULT_SIMILAR_COUNT = 10
+
+# 图片磁盘缓存目录、容量上限、重新验证周期
+IMAGE_CACHE_DIR = 'image_cache'
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_CACHE_TTL = 7 * 24 * 3600
+
+# 访问图片源站：连接和读取超时（秒）、keep-alive 连接数、同时进行的下载数
+IMAGE_CONNECT_TIMEOUT = 3
+IMAGE_READ_TIMEOUT = 10
+IMAGE_MAX_CONNECTIONS = 32
+IMAGE_MAX_CONCURRENCY = 16
+
+# 日志级别，可用环境变量 DOULIE_LOG_LEVEL 调整（如 DEBUG、WARNING）
+LOG_LEVEL = os.environ.get('DOULIE_LOG_LEVEL', 'INFO')
+
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
 
 # 创建 Flask 应用实例
 app = Flask(__name__)
 
+# jsonify 和响应缓存使用更快的 JSON 编码（见 json_provider.JSON_BACKEND）
+app.json = FastJSONProvider(app)
+
+# 只读连接池，由应用持有，所有接口共享（写入由 main.py 的爬虫负责）
+read_pool = ConnectionPool(DB_FILE, size=READ_POOL_SIZE, readonly=True)
+
+def init_db():
+    """启动时用一次写连接确保表结构为最新版本（旧数据库会原地迁移）"""
+    db = MovieDatabase(DB_FILE)
+    try:
+        db.create_table()
+    finally:
+        db.close()
+
+init_db()
+
+# 列表和详情接口的响应缓存，数据版本号变化后自动失效
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+# 随机选片器（按筛选条件缓存 ID 数组）
+random_picker = RandomPicker()
+
+# 相似电影索引（由爬虫构建，更新后自动切换）
+similarity_index = SimilarityIndex()
+
+# 代理图片的磁盘缓存
+image_cache = ImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL)
+
+# 访问图片源站的共享客户端
+image_proxy = ImageProxy(IMAGE_HEADERS, IMAGE_MAX_CONNECTIONS, IMAGE_MAX_CONCURRENCY, IMAGE_CONNECT_TIMEOUT, IMAGE_READ_TIMEOUT)
+
+# 接口耗时（请求开始到视图返回响应，流式响应不含发送时间）
+REQUEST_SECONDS = histogram('doulie_request_seconds', '接口处理耗时（秒）', ('route', 'method', 'status'))
+
+# 图片代理各请求的处理结果：thumbnail、hit、shared（等待其他请求下载后读取缓存）、revalidated、miss、stale、error
+IMAGE_REQUESTS = counter('doulie_image_requests_total', '图片代理请求数（按处理结果）', ('result',))
+
+# 不需要从源站下载图片内容的结果
+IMAGE_CACHED_RESULTS = ('thumbnail', 'hit', 'shared', 'revalidated')
+
+def cache_request_counts():
+    """各缓存的命中/未命中次数"""
+    image_hits = sum(IMAGE_REQUESTS.value(result) for result in IMAGE_CACHED_RESULTS)
+    image_misses = sum(IMAGE_REQUESTS.value(result) for result in ('miss', 'stale', 'error'))
+    return {
+        'response': (response_cache.hits, response_cache.misses),
+        'image': (image_hits, image_misses),
+    }
+
+def cache_request_samples():
+    """doulie_cache_requests_total 的各条数据"""
+    return [((cache, result), count) for cache, counts in cache_request_counts().items() for result, count in zip(('hit', 'miss'), counts)]
+
+def cache_hit_ratio_samples():
+    """doulie_cache_hit_ratio 的各条数据（尚无访问的缓存不输出）"""
+    return [((cache,), hits / (hits + misses)) for cache, (hits, misses) in cache_request_counts().items() if hits + misses]
+
+callback_counter('doulie_cache_requests_total', '缓存访问次数', ('cache', 'result'), cache_request_samples)
+gauge('doulie_cache_hit_ratio', '缓存命中率', ('cache',), cache_hit_ratio_samples)
+gauge('doulie_db_pool_connections', '只读连接池中的连接数', ('state',),
+      lambda: [(('open',), read_pool.open_count), (('idle',), read_pool.idle_count)])
+
+def encode_cursor(sort_by, order, movie):
+    """把最后一条记录的排序键和 id 编码成不透明的分页游标"""
+    payload = json.dumps([sort_by, order, sort_key_of(movie, sort_by), movie['id']], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """解析分页游标，返回 (sort_by, order, 排序键, id)，格式不正确时抛出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_by, order, key, movie_id = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+    except Exception:
+        raise ValueError('无效的分页游标')
+    if not isinstance(sort_by, str) or sort_by not in SORT_KEYS or order not in ('asc', 'desc'):
+        raise ValueError('无效的分页游标')
+    if not is_movie_id(movie_id) or not is_sort_key(sort_by, key):
+        raise ValueError('无效的分页游标')
+    return sort_by, order, key, movie_id
+
+def in_integer_range(value):
+    """整数是否在 SQLite INTEGER 的范围内（可以作为查询参数）"""
+    return -MAX_MOVIE_ID - 1 <= value <= MAX_MOVIE_ID
+
+def is_movie_id(value):
+    """是否为有效范围内的电影 ID（0 到 MAX_MOVIE_ID 的整数）"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0 and in_integer_range(value)
+
+def is_sort_key(sort_by, key):
+    """游标中的排序键是否符合该排序方式的类型：整数须在 INTEGER 范围内，浮点数须为有限值"""
+    if isinstance(key, bool) or not isinstance(key, CURSOR_KEY_TYPES[sort_by]):
+        return False
+    if isinstance(key, int):
+        return in_integer_range(key)
+    if isinstance(key, float):
+        return math.isfinite(key)
+    return True
+
+def movie_filter_args():
+    """从查询参数中读取年份范围和分面筛选条件（database.MOVIE_FILTERS），未传的为 None"""
+    return {
+        name: request.args.get(name, type=int) if name.startswith('year_') else request.args.get(name) or None
+        for name in MOVIE_FILTERS
+    }
+
+def parse_movie_ids(value):
+    """把批量查询的 ids（逗号分隔的字符串或整数数组）转换为去重后的 ID 列表（保持顺序），格式不正确时抛出 ValueError"""
+    if isinstance(value, str):
+        value = [item for item in value.split(',') if item.strip()]
+    if not isinstance(value, list) or not all(isinstance(item, (int, str)) and not isinstance(item, bool) for item in value):
+        raise ValueError('ids 应为逗号分隔的电影 ID 或电影 ID 数组')
+    try:
+        movie_ids = list(dict.fromkeys(int(item) for item in value))
+    except ValueError:
+        raise ValueError('ids 中含有无效的电影 ID')
+    if not all(is_movie_id(movie_id) for movie_id in movie_ids):
+        raise ValueError('ids 中含有超出范围的电影 ID')
+    return movie_ids
+
+def send_cached_json(entry):
+    """发送缓存的 JSON 响应；浏览器带着相同 ETag 重新验证时返回 304
+
+    按 Accept-Encoding 压缩，压缩结果随缓存记录保存，每种压缩方式只压缩一次。
+    """
+    encoding = negotiate(request.accept_encodings, len(entry.body))
+    if encoding:
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = entry.encoded[encoding] = compress(entry.body, encoding)
+        response = Response(body, mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+        # 不同压缩方式的响应体不同，ETag 也要区分
+        response.set_etag(f'{entry.etag}-{encoding}')
+    else:
+        response = Response(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # 允许浏览器缓存，但每次使用前都要重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def cache_json(cache_key, version, payload):
+    """序列化响应数据，按数据版本号放入响应缓存后发送；读取版本号失败时不缓存"""
+    if version is None:
+        return jsonify(payload)
+    body = app.json.dumps_bytes(payload)
+    return send_cached_json(response_cache.put(cache_key, version, body))
+
 # 添加根路径处理器
 @app.route('/', methods=['GET'])
 def index():
@@ -15,9 +231,16 @@ def index():
         'version': '1.0',
         'endpoints': {
             'movies_list': '/api/movies',
+            'movies_export': '/api/movies/export?format=ndjson|json|csv',
             'movie_detail': '/api/movies/<movie_id>',
+            'movies_batch': '/api/movies/batch?ids=<movie_id>,<movie_id>',
             'random_movie': '/api/movies/random',
+            'similar_movies': '/api/movies/<movie_id>/similar',
+            'search': '/api/search?q=<keyword>',
+            'doulists': '/api/doulists',
+            'stats': '/api/stats',
             'health_check': '/api/health',
+            'metrics': '/api/metrics',
             'proxy_image': '/api/proxy-image'
         },
         'documentation': '访问 /api/movies 获取电影列表'
@@ -25,18 +248,40 @@ def index():
 
 @app.route('/api/movies', methods=['GET'])
 def get_movies():
-    """获取电影列表，支持分页和排序"""
+    """获取电影列表，支持分页和排序；传入 cursor 时使用游标分页
+
+    可按 doulist_id、year_from/year_to、genre、country、director、actor 筛选；
+    传入 facets=1 时附带当前筛选结果中各分面的计数；
+    fields 为逗号分隔的字段列表（如 id,title,rating,image），只查询并返回这些字段（总是包含 id）。
+    """
     # 获取查询参数
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 10))
     sort_by = request.args.get('sort_by', 'time')  # 默认按时间排序
     order = request.args.get('order', 'desc')  # 默认降序
+    cursor = request.args.get('cursor')
+    # doulist_id 为空时不按豆列筛选（空字符串是统计表中代表全部电影的 ALL_MOVIES）
+    doulist_id = request.args.get('doulist_id') or None
+    filters = movie_filter_args()
+    with_facets = request.args.get('facets') == '1'
+    try:
+        columns = project_columns(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # 游标中自带排序方式，以游标为准
+    after_key = after_id = None
+    if cursor:
+        try:
+            sort_by, order, after_key, after_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
     
     # 计算偏移量
     offset = (page - 1) * per_page
     
     # 连接数据库
-    db = MovieDatabase()
+    db = MovieDatabase(pool=read_pool)
     try:
         # 构建排序条件
         if sort_by not in ['time', 'rating', 'title']:
@@ -45,18 +290,36 @@ def get_movies():
         if order not in ['asc', 'desc']:
             order = 'desc'  # 默认降序
         
+        # 数据未变化时直接返回缓存的响应
+        version = db.get_data_version()
+        cache_key = ('movies', doulist_id, tuple(filters.values()), with_facets, columns,
+                     sort_by, order, cursor if cursor is not None else page, per_page)
+        cached = response_cache.get(cache_key, version)
+        if cached:
+            return send_cached_json(cached)
+        
         # 获取电影总数
-        total_count = db.count_movies()
+        total_count = db.count_movies(doulist_id, **filters)
         
-        # 获取排序后的电影列表
-        movies = db.get_sorted_movies(sort_by, order, per_page, offset)
+        # 获取排序后的电影列表；游标分页需要排序列来生成下一页游标，没有请求该字段时额外查询、生成游标后去掉
+        extra_column = cursor is not None and sort_by not in columns
+        query_columns = tuple(name for name in MOVIE_COLUMNS if name in columns or name == sort_by) if extra_column else columns
+        if cursor is not None:
+            movies = db.get_sorted_movies_after(sort_by, order, after_key, after_id, per_page, doulist_id=doulist_id,
+                                                columns=query_columns, **filters)
+        else:
+            movies = db.get_sorted_movies(sort_by, order, per_page, offset, doulist_id=doulist_id, columns=query_columns, **filters)
         
         # 计算总页数
         total_pages = (total_count + per_page - 1) // per_page
         
-        # 在返回响应前添加调试代码
-        for movie in movies:
-            print(f"Movie: {movie['title']}, Image URL: {movie['image']}")
+        # 下一页游标（仅游标分页模式，cursor 传空值即从第一页开始）；不足一页说明已经到底
+        next_cursor = None
+        if cursor is not None and len(movies) == per_page and movies:
+            next_cursor = encode_cursor(sort_by, order, movies[-1])
+        if extra_column:
+            for movie in movies:
+                del movie[sort_by]
         
         # 构建响应数据
         response = {
@@ -65,53 +328,273 @@ def get_movies():
                 'total_count': total_count,
                 'total_pages': total_pages,
                 'current_page': page,
-                'per_page': per_page
+                'per_page': per_page,
+                'next_cursor': next_cursor
             },
             'sort': {
                 'sort_by': sort_by,
                 'order': order
-            }
+            },
+            'doulist_id': doulist_id,
+            'filters': {name: value for name, value in filters.items() if value is not None}
         }
+        if with_facets:
+            response['facets'] = db.get_facet_counts(doulist_id, **filters)
         
-        return jsonify(response)
+        return cache_json(cache_key, version, response)
+    finally:
+        db.close()
+
+def gzip_stream(chunks):
+    """把文本片段流式压缩为 gzip，压缩器内部缓冲，攒够一块才产出"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def batch_text(pieces, size=EXPORT_CHUNK_SIZE):
+    """把逐行的文本拼接成约 size 字符的块再产出，减少分块传输的次数"""
+    buffer = []
+    length = 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def ndjson_lines(rows):
+    """每部电影编码为一行 JSON"""
+    for row in rows:
+        yield json.dumps(dict(zip(MOVIE_COLUMNS, row)), ensure_ascii=False) + '\n'
+
+def json_array(rows):
+    """把全部电影编码为一个 JSON 数组，逐条产出文本片段"""
+    return iter_json_array(rows, MOVIE_COLUMNS, app.json.dumps)
+
+def csv_lines(rows):
+    """先输出表头，再把每部电影编码为一行 CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in itertools.chain([MOVIE_COLUMNS], rows):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+# 导出格式：编码函数、MIME 类型、文件扩展名
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson', 'ndjson'),
+    'json': (json_array, 'application/json', 'json'),
+    'csv': (csv_lines, 'text/csv', 'csv'),
+}
+
+@app.route('/api/movies/export', methods=['GET'])
+def export_movies():
+    """导出全部电影（筛选参数同 /api/movies），format 为 ndjson（默认）、json（一个数组）或 csv
+
+    从数据库游标逐批读取并以分块传输发送，客户端支持时用 gzip 压缩，内存占用与电影数量无关。
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'不支持的导出格式: {fmt}'}), 400
+    encode, mimetype, ext = EXPORT_FORMATS[fmt]
+    doulist_id = request.args.get('doulist_id') or None
+
+    db = MovieDatabase(pool=read_pool)
+    chunks = batch_text(encode(db.iter_movies(doulist_id, row_format='tuple', **movie_filter_args())))
+
+    headers = {'Content-Disposition': f'attachment; filename=movies.{ext}'}
+    # 按 q 值协商（gzip;q=0 表示不接受 gzip）
+    if request.accept_encodings.best_match(('gzip',)):
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    response = Response(chunks, mimetype=mimetype, headers=headers)
+    response.vary.add('Accept-Encoding')
+    # 响应发送完毕（或客户端断开）后再把连接还给连接池
+    response.call_on_close(db.close)
+    return response
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """全文搜索电影标题和简介，按相关度排序并返回高亮片段，支持分页（per_page 最多 MAX_SEARCH_PER_PAGE），可按 doulist_id 限定范围"""
+    keyword = request.args.get('q', '').strip()
+    if not keyword:
+        return jsonify({'error': '缺少搜索关键词'}), 400
+    
+    # 无法解析的页码按默认值处理，超出范围的取最近的有效值
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), MAX_SEARCH_PER_PAGE)
+    doulist_id = request.args.get('doulist_id') or None
+    
+    db = MovieDatabase(pool=read_pool)
+    try:
+        total_count = db.count_search_results(keyword, doulist_id)
+        movies = db.search_movies(keyword, per_page, (page - 1) * per_page, doulist_id=doulist_id)
+        
+        return jsonify({
+            'movies': movies,
+            'pagination': {
+                'total_count': total_count,
+                'total_pages': (total_count + per_page - 1) // per_page,
+                'current_page': page,
+                'per_page': per_page
+            },
+            'query': keyword,
+            'doulist_id': doulist_id
+        })
     finally:
         db.close()
 
 @app.route('/api/movies/random', methods=['GET'])
 def get_random_movie():
-    """随机获取一部电影"""
-    db = MovieDatabase()
+    """随机获取电影
+
+    可选参数：count（一次返回多部不重复的电影）、min_rating、doulist_id，
+    以及 session（客户端生成的会话标识，同一会话内不重复推荐）。
+    """
+    count = min(max(request.args.get('count', 1, type=int), 1), MAX_RANDOM_COUNT)
+    min_rating = request.args.get('min_rating', type=float)
+    doulist_id = request.args.get('doulist_id') or None
+    session = request.args.get('session')
+    
+    db = MovieDatabase(pool=read_pool)
     try:
-        # 获取所有电影ID
-        movie_ids = db.get_all_movie_ids()
+        movies = random_picker.pick(db, count, doulist_id, min_rating, session)
         
-        if not movie_ids:
+        if not movies:
             return jsonify({'error': '数据库中没有电影'}), 404
-            
-        # 随机选择一个ID
-        random_id = random.choice(movie_ids)
         
-        # 获取电影详情
-        movie = db.get_movie_by_id(random_id)
+        # 指定 count 时返回列表，否则保持原来的单部电影格式
+        if 'count' in request.args:
+            return jsonify({'movies': movies})
+        return jsonify({'movie': movies[0]})
+    finally:
+        db.close()
+
+@app.route('/api/movies/batch', methods=['GET', 'POST'])
+def get_movies_batch():
+    """批量获取电影详情，一次请求代替逐部请求 /api/movies/<id>
+
+    GET 传 ids=1,2,3；ID 较多时用 POST，请求体为 JSON {"ids": [1, 2, 3]} 或表单字段 ids。
+    按请求的顺序返回找到的电影（重复的 ID 只返回一次），not_found 列出不存在的 ID；fields 参数同 /api/movies。
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        value = data.get('ids') if isinstance(data, dict) else request.form.get('ids')
+    else:
+        value = request.args.get('ids')
+    try:
+        movie_ids = parse_movie_ids(value or '')
+        columns = project_columns(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not movie_ids:
+        return jsonify({'error': '缺少电影 ID'}), 400
+    if len(movie_ids) > MAX_BATCH_IDS:
+        return jsonify({'error': f'一次最多查询 {MAX_BATCH_IDS} 部电影'}), 400
+    
+    db = MovieDatabase(pool=read_pool)
+    try:
+        version = db.get_data_version()
+        cache_key = ('batch', tuple(movie_ids), columns)
+        cached = response_cache.get(cache_key, version)
+        if cached:
+            return send_cached_json(cached)
+        
+        movies = db.get_movies_by_ids(movie_ids, columns)
+        found = {movie['id'] for movie in movies}
+        not_found = [movie_id for movie_id in movie_ids if movie_id not in found]
         
-        if not movie:
-            return jsonify({'error': '获取电影信息失败'}), 500
-            
-        return jsonify({'movie': movie})
+        return cache_json(cache_key, version, {'movies': movies, 'not_found': not_found})
     finally:
         db.close()
 
-@app.route('/api/movies/<int:movie_id>', methods=['GET'])
+@app.route(f'/api/movies/<int(max={MAX_MOVIE_ID}):movie_id>', methods=['GET'])
 def get_movie_detail(movie_id):
     """获取电影详情"""
-    db = MovieDatabase()
+    db = MovieDatabase(pool=read_pool)
     try:
+        version = db.get_data_version()
+        cache_key = ('movie', movie_id)
+        cached = response_cache.get(cache_key, version)
+        if cached:
+            return send_cached_json(cached)
+        
         movie = db.get_movie_by_id(movie_id)
         
         if not movie:
             return jsonify({'error': '电影不存在'}), 404
             
-        return jsonify({'movie': movie})
+        return cache_json(cache_key, version, {'movie': movie})
+    finally:
+        db.close()
+
+@app.route(f'/api/movies/<int(max={MAX_MOVIE_ID}):movie_id>/similar', methods=['GET'])
+def get_similar_movies(movie_id):
+    """相似电影：按标题和简介的文本相似度（兼顾评分）排序，来自爬取后预先计算的索引
+
+    可选参数 limit（默认 DEFAULT_SIMILAR_COUNT，最多 similarity.NEIGHBORS）；
+    索引构建之后新增的电影在下次更新索引前返回空列表。
+    """
+    limit = min(max(request.args.get('limit', DEFAULT_SIMILAR_COUNT, type=int), 1), NEIGHBORS)
+    if not similarity_index.available:
+        return jsonify({'error': '相似电影索引尚未构建'}), 503
+    
+    db = MovieDatabase(pool=read_pool)
+    try:
+        # 索引更新后数据版本号不一定变化，缓存键中带上索引版本
+        version = db.get_data_version()
+        cache_key = ('similar', similarity_index.generation, movie_id, limit)
+        cached = response_cache.get(cache_key, version)
+        if cached:
+            return send_cached_json(cached)
+        
+        neighbors = similarity_index.neighbors(movie_id)
+        if not neighbors and not db.get_movie_by_id(movie_id):
+            return jsonify({'error': '电影不存在'}), 404
+        
+        # 多取出全部候选，跳过索引构建后已被删除的电影
+        scores = dict(neighbors)
+        movies = db.get_movies_by_ids(list(scores))[:limit]
+        for movie in movies:
+            movie['similarity'] = round(scores[movie['id']], 4)
+        
+        return cache_json(cache_key, version, {'movie_id': movie_id, 'movies': movies})
+    finally:
+        db.close()
+
+@app.route('/api/doulists', methods=['GET'])
+def get_doulists():
+    """全部豆列：名称、电影数和最近一次爬取的状态（爬取状态随时变化，不走响应缓存）"""
+    db = MovieDatabase(pool=read_pool)
+    try:
+        return jsonify({'doulists': db.get_doulists()})
+    finally:
+        db.close()
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """电影库统计：总数、平均评分、评分分布和各豆列的电影数（读取统计表，不扫描电影表）"""
+    db = MovieDatabase(pool=read_pool)
+    try:
+        version = db.get_data_version()
+        cache_key = ('stats',)
+        cached = response_cache.get(cache_key, version)
+        if cached:
+            return send_cached_json(cached)
+        
+        stats = db.get_stats()
+        if stats is None:
+            return jsonify({'error': '获取统计信息失败'}), 500
+        
+        return cache_json(cache_key, version, {'stats': stats})
     finally:
         db.close()
 
@@ -120,6 +603,27 @@ def get_movie_detail(movie_id):
 def health_check():
     return jsonify({'status': 'ok'})
 
+# 记录各接口的处理耗时（关闭指标采集时不注册）
+if METRICS_ENABLED:
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method, response.status_code)
+        return response
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的运行指标：接口耗时、数据库方法耗时、缓存命中率等"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': '指标采集未开启'}), 404
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # 启用CORS（跨域资源共享）
 @app.after_request
 def add_cors_headers(response):
@@ -128,44 +632,124 @@ def add_cors_headers(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
     return response
 
+@app.after_request
+def compress_response(response):
+    """按 Accept-Encoding 压缩 JSON 和文本响应
+
+    已声明 Vary 的响应已经协商过压缩方式（send_cached_json、导出接口），流式响应和文件不处理。
+    """
+    # 先做不需要解析请求头的检查，小响应直接返回
+    size = response.content_length or 0
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed or size < MIN_COMPRESS_BYTES
+            or 'Vary' in response.headers or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings, size)
+    if encoding:
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+# 浏览器端缓存一天
+IMAGE_RESPONSE_HEADERS = {
+    'Cache-Control': 'public, max-age=86400',
+    'Access-Control-Allow-Origin': '*'
+}
+
+def send_cached_image(entry):
+    """直接从磁盘缓存发送图片（由服务器使用 sendfile 传输，支持浏览器的条件请求）"""
+    response = send_file(entry.path, mimetype=entry.content_type, etag=entry.digest, conditional=True, max_age=86400)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+def send_thumbnail(path, mimetype):
+    """发送预生成的缩略图，格式随 Accept 请求头变化"""
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=86400)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.vary.add('Accept')
+    return response
+
 @app.route('/api/proxy-image', methods=['GET'])
 def proxy_image():
-    """代理图片请求，绕过CORS限制"""
+    """代理图片请求，绕过CORS限制；图片缓存到本地磁盘，过期后向源站条件请求重新验证
+
+    传入 w=宽度 时优先返回预生成的缩略图（支持 WebP 的客户端返回 WebP），尚未生成时退回原图。
+    同一张图片的并发请求只访问一次源站，其余请求等待其写入缓存后直接读取。
+    """
     url = request.args.get('url')
     if not url:
         return jsonify({'error': '缺少URL参数'}), 400
+    
+    width = request.args.get('w', type=int)
+    if width:
+        variant = thumbnails.find_variant(url, width, 'image/webp' in request.headers.get('Accept', ''))
+        if variant:
+            IMAGE_REQUESTS.inc('thumbnail')
+            return send_thumbnail(*variant)
+    
+    # 缓存命中且未过期：不访问源站
+    entry = image_cache.get(url)
+    if entry and entry.fresh:
+        IMAGE_REQUESTS.inc('hit')
+        return send_cached_image(entry)
+    
+    # 已有请求在下载这张图片时，等它完成后读取缓存；它失败时再尝试一次由自己下载
+    for _ in range(2):
+        if image_proxy.begin(url):
+            break
+        entry = image_cache.get(url) or entry
+        if entry and entry.fresh:
+            IMAGE_REQUESTS.inc('shared')
+            return send_cached_image(entry)
+    else:
+        if entry:
+            IMAGE_REQUESTS.inc('stale')
+            return send_cached_image(entry)
+        IMAGE_REQUESTS.inc('error')
+        return jsonify({'error': '图片正在下载，请稍后重试'}), 503
         
     try:
-        # 添加请求头，模拟浏览器请求
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Referer': 'https://movie.douban.com/',
-            'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-        }
-        
-        response = requests.get(url, headers=headers, stream=True)
-        print(f"Proxy image response status: {response.status_code}")
-        
-        if response.status_code != 200:
-            print(f"Failed to fetch image: {url}")
-            return jsonify({'error': '无法获取图片'}), 404
-            
-        # 打印响应头信息，帮助调试
-        print(f"Response headers: {dict(response.headers)}")
-            
-        return Response(
-            response.content, 
-            content_type=response.headers.get('content-type', 'image/jpeg'),
-            headers={
-                'Cache-Control': 'public, max-age=86400',  # 缓存一天
-                'Access-Control-Allow-Origin': '*'
-            }
-        )
+        headers = entry.conditional_headers() if entry else None
+        response = image_proxy.get(url, headers)
+        logger.debug('图片源站响应 %s: %s', response.status_code, url)
     except Exception as e:
-        print(f"Error proxying image: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        image_proxy.finish(url)
+        logger.warning('代理图片出错: %s - %s', url, e)
+        # 源站超时或并发已满时退回使用过期的缓存
+        if entry:
+            IMAGE_REQUESTS.inc('stale')
+            return send_cached_image(entry)
+        IMAGE_REQUESTS.inc('error')
+        return jsonify({'error': str(e)}), 503 if isinstance(e, UpstreamBusy) else 502
+    
+    # 源站确认图片未变化，继续使用缓存
+    if response.status_code == 304 and entry:
+        image_cache.mark_validated(entry, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        image_proxy.finish(url, response)
+        IMAGE_REQUESTS.inc('revalidated')
+        return send_cached_image(entry)
+    
+    if response.status_code != 200:
+        image_proxy.finish(url, response)
+        logger.warning('无法获取图片 (%s): %s', response.status_code, url)
+        # 源站出错时退回使用过期的缓存
+        if entry:
+            IMAGE_REQUESTS.inc('stale')
+            return send_cached_image(entry)
+        IMAGE_REQUESTS.inc('error')
+        return jsonify({'error': '无法获取图片'}), 404
+    
+    # 边从源站读取边转发给客户端，同时写入缓存，内存占用与图片大小无关
+    IMAGE_REQUESTS.inc('miss')
+    proxied = Response(
+        stream_with_context(image_cache.stream_and_store(url, response)),
+        content_type=response.headers.get('content-type', 'image/jpeg'),
+        headers=IMAGE_RESPONSE_HEADERS
+    )
+    # 发送完毕（图片已写入缓存）或客户端断开后，归还并发名额并唤醒等待的请求
+    proxied.call_on_close(lambda: image_proxy.finish(url, response))
+    return proxied
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8080) 
\ No newline at end of file
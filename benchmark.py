@@ -0,0 +1,439 @@
+"""性能基准：生成指定规模的合成数据库，测量数据库查询、接口吞吐和页面解析，结果输出为 JSON
+
+用法：
+    python benchmark.py                                # 1k / 100k / 1M 三种规模
+    python benchmark.py --sizes 1000,100000 --output bench.json
+    python benchmark.py --baseline old.json            # 与之前提交的结果对比
+    python benchmark.py --html saved_doulist.html      # 用保存的豆列页面测量解析速度
+
+合成数据库缓存在 --data-dir 目录中，规模不变时重复运行不会重新生成。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from bs4 import BeautifulSoup
+from database import MovieDatabase, ConnectionPool, sort_key_of, TIME_FORMAT
+import main
+import similarity
+import snapshot
+
+# 默认的数据库规模和数据目录
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_DATA_DIR = 'bench_data'
+
+# 每项测量至少运行的次数、最多运行的次数和目标总时长（秒）
+MIN_RUNS = 5
+MAX_RUNS = 200
+TARGET_SECONDS = 0.5
+
+# 与基准结果相比，中位数变慢超过该比例时标记为退化
+REGRESSION_THRESHOLD = 0.1
+
+# 列表接口每页条数
+PER_PAGE = 20
+
+# 列表接口按字段投影时请求的字段（与前端列表卡片一致）
+LIST_FIELDS = 'id,title,rating,image,time'
+
+# 测量压缩响应时的请求头
+GZIP_HEADERS = {'Accept-Encoding': 'gzip'}
+
+# 批量查询接口一次查询的电影数（对比逐部请求详情接口）
+BATCH_IDS = 200
+
+# 相似电影索引的全量构建是 O(n²)，只在不超过该规模的数据库上构建和测量
+SIMILARITY_MAX_ROWS = 100000
+
+# 合成数据使用的词表
+TITLE_WORDS = ('星际', '穿越', '肖申克', '救赎', '千与千寻', '霸王别姬', '这个杀手', '不太冷', '教父', '泰坦尼克',
+               '盗梦空间', '海上钢琴师', '楚门', '世界', '忠犬', '八公', '辛德勒', '名单', '活着', '东京物语')
+TITLE_LATIN = ('Interstellar', 'Redemption', 'Spirited', 'Away', 'Farewell', 'Leon', 'Godfather', 'Titanic',
+               'Inception', 'Legend', 'Truman', 'Show', 'Hachi', 'Schindler', 'List', 'Tokyo', 'Story')
+PEOPLE = ('克里斯托弗·诺兰', '宫崎骏', '陈凯歌', '吕克·贝松', '弗朗西斯·福特·科波拉', '詹姆斯·卡梅隆', '张艺谋',
+          '小津安二郎', '马修·麦康纳', '蒂姆·罗宾斯', '张国荣', '巩俐', '让·雷诺', '莱昂纳多·迪卡普里奥')
+GENRES = ('剧情', '爱情', '科幻', '动画', '犯罪', '悬疑', '冒险', '历史', '战争', '喜剧')
+COUNTRIES = ('美国', '中国大陆', '日本', '法国', '英国', '中国香港', '意大利', '韩国')
+DOULIST_IDS = ('157902238', '100000001', '100000002', '100000003', '100000004')
+
+def synthetic_movie(i, rng):
+    """第 i 部合成电影（与 movies 表写入的列顺序一致）"""
+    title = f'{rng.choice(TITLE_WORDS)}{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_LATIN)} {i}'
+    rated = rng.random() > 0.1
+    rating_num = round(rng.uniform(2.0, 9.9), 1) if rated else 0.0
+    lines = [
+        f'导演: {rng.choice(PEOPLE)}',
+        f"主演: {' / '.join(rng.sample(PEOPLE, 3))}",
+        f"类型: {' / '.join(rng.sample(GENRES, 2))}",
+        f'制片国家/地区: {rng.choice(COUNTRIES)}',
+    ]
+    year = rng.randint(1930, 2025)
+    abstract = '\n'.join(lines + [f'年份: {year}'])
+    added_at = 1262304000 + rng.randrange(15 * 365 * 86400)
+    return (
+        title,
+        str(rating_num) if rated else '',
+        f'https://img{rng.choice((1, 3, 9))}.doubanio.com/view/photo/s_ratio_poster/public/p{1000000 + i}.webp',
+        abstract,
+        time.strftime(TIME_FORMAT, time.gmtime(added_at)),
+        DOULIST_IDS[i % len(DOULIST_IDS)],
+        rating_num,
+        added_at,
+        year,
+        str(1000000 + i),
+    )
+
+def generate_database(path, rows, seed=42):
+    """生成有 rows 部电影的合成数据库；已存在且行数相同时迁移到当前表结构后复用"""
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute('SELECT COUNT(*) FROM movies').fetchone()[0] == rows:
+                db = MovieDatabase(path)
+                db.create_table()
+                db.close()
+                return path
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+        os.remove(path)
+
+    print(f'生成 {rows} 行的合成数据库: {path}', file=sys.stderr)
+    db = MovieDatabase(path)
+    db.create_table()
+    conn = db.conn
+
+    # 先去掉触发器、二级索引、全文索引、统计表、豆列关联和简介字段关联，批量写入后由 create_table() 一次性重建，比逐行维护快得多
+    objects = conn.execute("SELECT type, name FROM sqlite_master WHERE type IN ('trigger', 'index') AND sql IS NOT NULL").fetchall()
+    for kind, name in objects:
+        conn.execute(f'DROP {kind.upper()} IF EXISTS {name}')
+    conn.execute('DROP TABLE IF EXISTS movies_fts')
+    conn.execute('DROP TABLE IF EXISTS movie_stats')
+    conn.execute('DROP TABLE IF EXISTS doulist_movies')
+    conn.execute('DROP TABLE IF EXISTS doulists')
+    for table in ('facet_stats', 'movie_people', 'movie_genres', 'movie_countries', 'people', 'genres', 'countries'):
+        conn.execute(f'DROP TABLE IF EXISTS {table}')
+    conn.execute('PRAGMA synchronous=OFF')
+
+    rng = random.Random(seed)
+    conn.executemany('''
+    INSERT INTO movies (title, rating, image, abstract, time, doulist_id, rating_num, added_at, year, subject_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (synthetic_movie(i, rng) for i in range(rows)))
+    conn.commit()
+
+    db.create_table()
+    conn.execute('ANALYZE')
+    conn.commit()
+    db.close()
+    return path
+
+def synthetic_doulist_page(start=0, count=25, total_pages=10):
+    """结构与豆列页面一致的合成 HTML（含侧栏等与电影无关的内容）"""
+    rng = random.Random(start)
+    items = []
+    for i in range(start, start + count):
+        title, rating, image, abstract, added, _, _, _, _, subject_id = synthetic_movie(i, rng)
+        items.append(f'''<div class="doulist-item" id="item{subject_id}"><div class="mod"><div class="hd"><span class="pos">{i + 1}</span></div>
+<div class="bd doulist-subject"><div class="source">来自：豆瓣电影</div>
+<div class="post"><a href="https://movie.douban.com/subject/{subject_id}/" target="_blank"><img width="100" src="{image}"/></a></div>
+<div class="title"><a href="https://movie.douban.com/subject/{subject_id}/" target="_blank"> {title} </a></div>
+<div class="rating"><span class="allstar40"></span><span class="rating_nums">{rating}</span><span>(12345人评价)</span></div>
+<div class="abstract">{abstract.replace(chr(10), ' <br/>')}</div></div>
+<div class="ft"><div class="actions"><time class="time"> {added} </time><a href="#">回应</a></div></div></div></div>''')
+    aside = '<div class="aside">' + '<p>相关豆列 <a href="#">链接</a></p>' * 300 + '</div>'
+    paginator = f'<div class="paginator"><span class="thispage" data-total-page="{total_pages}">1</span><a href="?start=25">2</a></div>'
+    return f'<html><head><title>豆列</title></head><body><div id="wrapper"><div class="article">{"".join(items)}{paginator}</div>{aside}</div></body></html>'
+
+def measure(func, min_runs=MIN_RUNS, max_runs=MAX_RUNS, target_seconds=TARGET_SECONDS):
+    """预热一次后重复运行 func，直到达到目标总时长或最大次数，返回耗时统计（毫秒）"""
+    func()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < min_runs or (len(samples) < max_runs and time.perf_counter() - started < target_seconds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'runs': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'median_ms': round(median, 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        'min_ms': round(samples[0], 4),
+        'ops_per_sec': round(1000 / median, 1) if median else None,
+    }
+
+def bench_database(path, rows):
+    """数据库查询：三种排序在首页和深分页的读取、游标分页、搜索、ID 列表和计数"""
+    db = MovieDatabase(path)
+    db.connect()
+    results = {}
+    try:
+        offsets = {'first': 0, 'middle': rows // 2, 'last': max(rows - PER_PAGE, 0)}
+        for sort_by in ('time', 'rating', 'title'):
+            for order in ('desc', 'asc'):
+                for name, offset in offsets.items():
+                    results[f'sorted_{sort_by}_{order}_{name}'] = measure(
+                        lambda: db.get_sorted_movies(sort_by, order, PER_PAGE, offset))
+
+            # 游标分页从中间位置继续读取，与同位置的 OFFSET 分页对比
+            anchor = db.get_sorted_movies(sort_by, 'desc', 1, offsets['middle'])
+            if anchor:
+                after_key = sort_key_of(anchor[0], sort_by)
+                after_id = anchor[0]['id']
+                results[f'cursor_{sort_by}_desc_middle'] = measure(
+                    lambda: db.get_sorted_movies_after(sort_by, 'desc', after_key, after_id, PER_PAGE))
+
+        results['sorted_time_desc_first_records'] = measure(
+            lambda: db.get_sorted_movies('time', 'desc', PER_PAGE, 0, row_format='record'))
+        results['sorted_time_desc_1000_dict'] = measure(lambda: db.get_sorted_movies('time', 'desc', 1000, 0))
+        results['sorted_time_desc_1000_tuple'] = measure(
+            lambda: db.get_sorted_movies('time', 'desc', 1000, 0, row_format='tuple'))
+
+        results['sorted_time_desc_doulist'] = measure(
+            lambda: db.get_sorted_movies('time', 'desc', PER_PAGE, 0, doulist_id=DOULIST_IDS[0]))
+        results['sorted_rating_desc_doulist'] = measure(
+            lambda: db.get_sorted_movies('rating', 'desc', PER_PAGE, 0, doulist_id=DOULIST_IDS[0]))
+
+        results['search_trigram'] = measure(lambda: db.search_movies('肖申克', PER_PAGE))
+        results['search_trigram_two_terms'] = measure(lambda: db.search_movies('千与千寻 Spirited', PER_PAGE))
+        results['search_short_term'] = measure(lambda: db.search_movies('活着', PER_PAGE))
+        results['count_search_results'] = measure(lambda: db.count_search_results('肖申克'))
+        results['search_trigram_doulist'] = measure(lambda: db.search_movies('肖申克', PER_PAGE, doulist_id=DOULIST_IDS[0]))
+
+        results['all_movie_ids'] = measure(lambda: db.get_all_movie_ids())
+        results['all_movie_ids_doulist'] = measure(lambda: db.get_all_movie_ids(DOULIST_IDS[0]))
+        results['all_movie_ids_min_rating'] = measure(lambda: db.get_all_movie_ids(min_rating=8.0))
+
+        results['count_movies'] = measure(lambda: db.count_movies())
+        results['count_movies_doulist'] = measure(lambda: db.count_movies(DOULIST_IDS[0]))
+        results['stats'] = measure(lambda: db.get_stats())
+
+        results['sorted_rating_desc_genre'] = measure(lambda: db.get_sorted_movies('rating', 'desc', PER_PAGE, 0, genre=GENRES[0]))
+        results['sorted_rating_desc_director'] = measure(
+            lambda: db.get_sorted_movies('rating', 'desc', PER_PAGE, 0, director=PEOPLE[0]))
+        results['sorted_time_desc_year_range'] = measure(
+            lambda: db.get_sorted_movies('time', 'desc', PER_PAGE, 0, year_from=1990, year_to=1999))
+        results['sorted_rating_desc_genre_year'] = measure(
+            lambda: db.get_sorted_movies('rating', 'desc', PER_PAGE, 0, genre=GENRES[0], year_from=2000))
+        results['count_movies_genre'] = measure(lambda: db.count_movies(genre=GENRES[0]))
+        results['count_movies_genre_year'] = measure(lambda: db.count_movies(genre=GENRES[0], year_from=2000))
+        results['facet_counts'] = measure(lambda: db.get_facet_counts())
+        results['facet_counts_genre'] = measure(lambda: db.get_facet_counts(genre=GENRES[0]))
+    finally:
+        db.close()
+    return results
+
+def build_similarity(path, rows, data_dir):
+    """为合成数据库构建相似电影索引（已构建且行数相同时复用），返回 (索引目录, 构建耗时秒数或 None)"""
+    index_dir = os.path.join(data_dir, f'similarity_{rows}')
+    current = similarity.read_current(index_dir)
+    if current and current['rows'] == rows:
+        return index_dir, None
+    print(f'构建 {rows} 行的相似电影索引...', file=sys.stderr)
+    start = time.perf_counter()
+    similarity.build_index(path, index_dir, full=True)
+    return index_dir, round(time.perf_counter() - start, 3)
+
+def bench_similarity(index_dir, build_seconds):
+    """相似电影：全量构建耗时和从内存映射的索引中查询一部电影的相似电影"""
+    index = similarity.SimilarityIndex(index_dir)
+    results = {'neighbors': measure(lambda: index.neighbors(1, PER_PAGE))}
+    if build_seconds is not None:
+        results['build_seconds'] = build_seconds
+    return results
+
+def bench_snapshot(path):
+    """爬虫的快照流程（各运行一次）：备份为暂存快照、重建推迟的索引、发布前检查；只测量，不发布"""
+    results = {}
+    start = time.perf_counter()
+    staging = snapshot.stage_snapshot(path)
+    try:
+        results['stage_seconds'] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        snapshot.finish_snapshot(staging)
+        results['finish_seconds'] = round(time.perf_counter() - start, 3)
+        start = time.perf_counter()
+        problem = snapshot.validate_snapshot(staging, path)
+        results['validate_seconds'] = round(time.perf_counter() - start, 3)
+        if problem:
+            raise RuntimeError(problem)
+    finally:
+        snapshot.discard_snapshot(staging)
+    return results
+
+def bench_api(path, rows, similarity_dir=None):
+    """通过 Flask 测试客户端测量接口端到端吞吐"""
+    import app as app_module
+
+    # 让应用读取本次的合成数据库和相似电影索引，并清空上一规模留下的缓存
+    app_module.read_pool = ConnectionPool(path, size=app_module.READ_POOL_SIZE)
+    if similarity_dir:
+        app_module.similarity_index = similarity.SimilarityIndex(similarity_dir)
+    app_module.response_cache.clear()
+    app_module.random_picker = type(app_module.random_picker)()
+    client = app_module.app.test_client()
+
+    def get(url, clear_cache=False, headers=None):
+        def run():
+            if clear_cache:
+                app_module.response_cache.clear()
+            response = client.get(url, headers=headers)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} 返回 {response.status_code}')
+            response.close()
+        return run
+
+    def payload_bytes(url, headers=None):
+        response = client.get(url, headers=headers)
+        size = len(response.get_data())
+        response.close()
+        return size
+
+    deep_page = max(rows // PER_PAGE // 2, 1)
+    list_url = f'/api/movies?per_page={PER_PAGE}'
+    fields_url = f'{list_url}&fields={LIST_FIELDS}'
+    results = {
+        'api_movies_cached': measure(get(list_url)),
+        'api_movies_uncached': measure(get(list_url, clear_cache=True)),
+        'api_movies_fields_uncached': measure(get(fields_url, clear_cache=True)),
+        'api_movies_fields_gzip_cached': measure(get(fields_url, headers=GZIP_HEADERS)),
+        'api_movies_fields_gzip_uncached': measure(get(fields_url, clear_cache=True, headers=GZIP_HEADERS)),
+        'api_movies_payload_bytes': {
+            'full': payload_bytes(list_url),
+            'fields': payload_bytes(fields_url),
+            'fields_gzip': payload_bytes(fields_url, GZIP_HEADERS),
+        },
+        'api_movies_rating_deep_uncached': measure(
+            get(f'/api/movies?per_page={PER_PAGE}&sort_by=rating&page={deep_page}', clear_cache=True)),
+        'api_movies_cursor_first': measure(get(f'/api/movies?per_page={PER_PAGE}&cursor=', clear_cache=True)),
+        'api_movie_detail': measure(get('/api/movies/1', clear_cache=True)),
+        'api_random': measure(get('/api/movies/random')),
+        'api_random_filtered': measure(get('/api/movies/random?count=10&min_rating=8')),
+        'api_search': measure(get('/api/search?q=肖申克')),
+    }
+    # 同一批电影：一次批量请求，与逐部请求详情接口对比
+    batch_ids = [(i * 7919) % rows + 1 for i in range(min(BATCH_IDS, rows))]
+    results['api_movies_batch'] = measure(get(f"/api/movies/batch?ids={','.join(map(str, batch_ids))}", clear_cache=True))
+    details = [get(f'/api/movies/{movie_id}', clear_cache=True) for movie_id in batch_ids]
+    results['api_movie_detail_each'] = measure(lambda: [run() for run in details], max_runs=20)
+    if similarity_dir:
+        results['api_similar'] = measure(get(f'/api/movies/1/similar?limit={PER_PAGE}', clear_cache=True))
+    app_module.read_pool.close_all()
+    return results
+
+def bench_parse(pages):
+    """页面解析吞吐：两种解析后端的整页解析，以及 parse_movie_item 单条解析"""
+    items_per_page = [len(BeautifulSoup(html, 'html.parser').find_all('div', class_='doulist-item')) for html in pages]
+    total_items = sum(items_per_page)
+    results = {}
+
+    for backend, parse_page in main.PARSER_BACKENDS.items():
+        stats = measure(lambda: [parse_page(html) for html in pages])
+        stats['items_per_sec'] = round(total_items * 1000 / stats['median_ms'], 1) if stats['median_ms'] else None
+        results[f'parse_page_{backend}'] = stats
+
+    items = [item for html in pages for item in BeautifulSoup(html, 'html.parser').find_all('div', class_='doulist-item')]
+    stats = measure(lambda: [main.parse_movie_item(item) for item in items])
+    stats['items_per_sec'] = round(len(items) * 1000 / stats['median_ms'], 1) if stats['median_ms'] else None
+    results['parse_movie_item'] = stats
+    results['pages'] = len(pages)
+    results['items'] = total_items
+    return results
+
+def environment():
+    """记录运行环境，便于对比不同提交的结果"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        'commit': commit or None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare(baseline, current):
+    """对比两次结果的中位数耗时，返回 [(名称, 基准毫秒, 当前毫秒, 变化比例)]"""
+    rows = []
+    for group, benches in current['results'].items():
+        for name, stats in benches.items():
+            old = baseline.get('results', {}).get(group, {}).get(name)
+            if isinstance(stats, dict) and isinstance(old, dict) and old.get('median_ms'):
+                change = (stats['median_ms'] - old['median_ms']) / old['median_ms']
+                rows.append((f'{group}.{name}', old['median_ms'], stats['median_ms'], change))
+    return rows
+
+def run(sizes, data_dir=DEFAULT_DATA_DIR, html_files=()):
+    """运行全部基准，返回结果字典"""
+    data_dir = os.path.abspath(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+
+    if html_files:
+        pages = []
+        for html_file in html_files:
+            with open(html_file, encoding='utf-8') as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_doulist_page(start) for start in range(0, 250, 25)]
+
+    report = {'environment': environment(), 'results': {}}
+    paths = {rows: generate_database(os.path.join(data_dir, f'movies_{rows}.db'), rows) for rows in sizes}
+
+    # 应用在导入时会在当前目录初始化 movies.db 和图片缓存，放到数据目录中，避免影响项目目录
+    os.chdir(data_dir)
+    for rows, path in paths.items():
+        similarity_dir = None
+        if similarity.np is not None and rows <= SIMILARITY_MAX_ROWS:
+            similarity_dir, build_seconds = build_similarity(path, rows, data_dir)
+        print(f'测量 {rows} 行...', file=sys.stderr)
+        report['results'][f'db_{rows}'] = bench_database(path, rows)
+        if similarity_dir:
+            report['results'][f'similarity_{rows}'] = bench_similarity(similarity_dir, build_seconds)
+        report['results'][f'api_{rows}'] = bench_api(path, rows, similarity_dir)
+        report['results'][f'snapshot_{rows}'] = bench_snapshot(path)
+    report['results']['parse'] = bench_parse(pages)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='豆列电影库性能基准')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES), help='合成数据库的行数，逗号分隔')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='合成数据库的存放目录')
+    parser.add_argument('--html', nargs='*', default=(), help='用于测量解析速度的豆列页面 HTML 文件')
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    parser.add_argument('--baseline', help='之前的结果 JSON 文件，输出中位数耗时的对比')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_file = os.path.abspath(args.baseline) if args.baseline else None
+
+    report = run([int(size) for size in args.sizes.split(',') if size], args.data_dir, args.html)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if baseline_file:
+        with open(baseline_file, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = 0
+        for name, old, new, change in compare(baseline, report):
+            flag = '  <-- 退化' if change > REGRESSION_THRESHOLD else ''
+            regressions += bool(flag)
+            print(f'{name:50s} {old:10.3f} ms -> {new:10.3f} ms  {change:+.1%}{flag}', file=sys.stderr)
+        print(f'共 {regressions} 项变慢超过 {REGRESSION_THRESHOLD:.0%}', file=sys.stderr)
@@ -0,0 +1,40 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的响应不压缩（压缩后节省的字节抵不过 CPU 开销和额外的响应头）
+MIN_COMPRESS_BYTES = 1024
+
+# gzip 压缩级别和 brotli 压缩质量：接口响应在请求路径上压缩，取速度与压缩率的折中
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# 需要压缩的响应类型（图片等已压缩的内容不再压缩）
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain')
+
+def gzip_compress(body):
+    """gzip 压缩，文件头时间戳固定为 0，相同内容的压缩结果相同"""
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+def brotli_compress(body):
+    """brotli 压缩（按文本模式）"""
+    return brotli.compress(body, mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+
+# 支持的 Content-Encoding，按优先顺序排列（客户端同等接受时优先使用靠前的）；未安装 brotli 时只有 gzip
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS['br'] = brotli_compress
+ENCODERS['gzip'] = gzip_compress
+
+def negotiate(accept_encodings, size):
+    """根据请求的 Accept-Encoding（werkzeug 的 Accept 对象）选择压缩方式，不压缩时返回 None"""
+    if size < MIN_COMPRESS_BYTES:
+        return None
+    return accept_encodings.best_match(tuple(ENCODERS))
+
+def compress(body, encoding):
+    """按 negotiate 选出的方式压缩响应体"""
+    return ENCODERS[encoding](body)
@@ -1,27 +1,422 @@
 import sqlite3
 import os
+import re
+import calendar
+import math
+import time
+import threading
+import json
+import logging
+from collections import namedtuple
+from functools import lru_cache
+from metrics import histogram, timed
 
-class MovieDatabase:
-    def __init__(self, db_file='movies.db'):
-        """初始化数据库连接"""
+logger = logging.getLogger(__name__)
+
+# MovieDatabase 各方法的耗时
+DB_QUERY_SECONDS = histogram('doulie_db_query_seconds', 'MovieDatabase 方法耗时（秒）', ('method',))
+
+# 每个连接建立时执行一次的 PRAGMA
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',  # 256MB 内存映射
+    'PRAGMA cache_size=-65536',  # 64MB 页缓存
+    'PRAGMA temp_store=MEMORY',
+)
+
+# 爬虫写入暂存快照时的 PRAGMA：快照发布前不对外可见，中途失败直接丢弃，不需要 WAL 和落盘同步
+# （写入时会回滚到保存点，日志不能完全关闭，保留在内存中）
+BULK_PRAGMAS = (
+    'PRAGMA journal_mode=MEMORY',
+    'PRAGMA synchronous=OFF',
+)
+
+# 可由 create_table() 从电影表和关联表重新生成的派生表（批量写入前可以先删除，写完后一次性重建）
+DERIVED_TABLES = ('movies_fts', 'movie_stats', 'facet_stats')
+
+# 各排序方式对应的排序列（每个都有 (排序列, id) 复合索引）
+SORT_KEYS = {
+    'time': 'added_at',
+    'rating': 'rating_num',
+    'title': 'title',
+}
+
+# 豆瓣页面上的时间格式
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 按豆瓣条目 ID upsert 一条电影记录（条目 ID 为空时总是插入新行）
+UPSERT_SQL = '''
+INSERT INTO movies (title, rating, image, abstract, time, doulist_id, rating_num, added_at, year, subject_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (subject_id) DO UPDATE SET
+    title = excluded.title,
+    rating = excluded.rating,
+    image = excluded.image,
+    abstract = excluded.abstract,
+    time = excluded.time,
+    rating_num = excluded.rating_num,
+    added_at = excluded.added_at,
+    year = excluded.year
+'''
+
+# 记录电影属于某个豆列（同一部电影可以属于多个豆列，电影本身只存一行）
+MEMBERSHIP_UPSERT_SQL = '''
+INSERT INTO doulist_movies (doulist_id, movie_id, added_at) VALUES (?, ?, ?)
+ON CONFLICT (doulist_id, movie_id) DO UPDATE SET added_at = excluded.added_at
+'''
+
+# 按豆列筛选电影的条件：先取出豆列的全部电影（走 (doulist_id, added_at, movie_id) 索引）
+DOULIST_FILTER = '{column} IN (SELECT movie_id FROM doulist_movies WHERE doulist_id = ?)'
+
+# 按豆列筛选电影的条件：逐行探测关联表主键，配合排序索引按顺序扫描，读够一页即停止
+DOULIST_PROBE = 'EXISTS (SELECT 1 FROM doulist_movies WHERE doulist_id = ? AND movie_id = {column})'
+
+# 先取出筛选集合再排序时，每行的开销约相当于沿排序索引探测关联表的行数（实测约 4～7 倍）
+FILTER_SORT_COST = 4
+
+# 简介中各行的标签对应的结构化字段，例如 "导演: 冯小刚"、"类型: 喜剧 / 爱情"
+ABSTRACT_FIELDS = {
+    '导演': 'directors',
+    '主演': 'actors',
+    '类型': 'genres',
+    '制片国家/地区': 'countries',
+    '年份': 'year',
+}
+
+# 简介中年份一行里的四位数字
+YEAR_PATTERN = re.compile(r'\d{4}')
+
+# 分面筛选：参数名 -> (维表, 关联表, 关联表中的维表 ID 列, 人物关联的角色)
+FACETS = {
+    'genre': ('genres', 'movie_genres', 'genre_id', None),
+    'country': ('countries', 'movie_countries', 'country_id', None),
+    'director': ('people', 'movie_people', 'person_id', 'director'),
+    'actor': ('people', 'movie_people', 'person_id', 'actor'),
+}
+
+# 列表接口可用的筛选参数（doulist_id 之外）
+MOVIE_FILTERS = ('year_from', 'year_to') + tuple(FACETS)
+
+# 每个分面返回的选项数
+FACET_LIMIT = 20
+
+# 统计表中的评分区间：评分的整数部分，没有评分时为 -1
+STATS_BUCKET = 'CASE WHEN {row}.rating_num > 0 THEN CAST({row}.rating_num AS INTEGER) ELSE -1 END'
+
+# 统计表中代表全部电影的豆列 ID
+ALL_MOVIES = ''
+
+# 排序索引在 (排序列, id) 之后附带的列，覆盖前端列表页请求的字段（fields=id,title,rating,image,time），
+# 按这些字段投影的列表查询只读索引、不回表
+SORT_INDEX_COLUMNS = ('title', 'rating', 'image', 'time')
+
+# 电影查询统一选取的列，与接口返回的字段一一对应
+MOVIE_COLUMNS = ('id', 'title', 'rating', 'image', 'abstract', 'time', 'doulist_id', 'created_at')
+MOVIE_SELECT = ', '.join(MOVIE_COLUMNS)
+
+# 搜索结果在电影列之后额外带有高亮标题和简介片段
+SEARCH_COLUMNS = MOVIE_COLUMNS + ('title_highlight', 'snippet')
+
+# 生成器按批读取时每次 fetchmany 的行数
+FETCH_BATCH_SIZE = 500
+
+# 按 ID 批量查询时每条语句的 ID 数（SQLite 限制单条语句的参数个数，ID 较多时分批查询）
+ID_BATCH_SIZE = 500
+
+def split_search_terms(keyword):
+    """把搜索关键词按空白拆分为多个词，所有词都需命中"""
+    return (keyword or '').split()
+
+def fts_query(terms):
+    """把搜索词转换为 FTS5 查询：每个词作为带引号的短语，避免用户输入被当作查询语法"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def like_clause(terms):
+    """为不能使用全文索引的短词构建 LIKE 条件，返回 (条件, 参数)"""
+    conditions = []
+    params = []
+    for term in terms:
+        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append("(title LIKE ? ESCAPE '\\' OR abstract LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern]
+    return ' AND '.join(conditions), params
+
+def snippet_around(text, terms, width=24):
+    """截取文本中第一个命中词附近的片段，与 FTS5 的 snippet() 效果相近"""
+    lowered = text.lower()
+    positions = [lowered.find(term.lower()) for term in terms]
+    positions = [pos for pos in positions if pos >= 0]
+    if not positions:
+        return text[:width * 2]
+    start = max(0, min(positions) - width // 2)
+    end = start + width * 2
+    return ('…' if start > 0 else '') + text[start:end] + ('…' if end < len(text) else '')
+
+def highlight_terms(text, terms):
+    """用 <mark> 标出文本中命中的词（不区分大小写）"""
+    if not text:
+        return text
+    pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    return pattern.sub(lambda match: f'<mark>{match.group(0)}</mark>', text)
+
+def parse_rating(rating):
+    """把文本评分转换为数值，缺失或无法解析时为 0"""
+    try:
+        return float(rating)
+    except (TypeError, ValueError):
+        return 0.0
+
+def parse_time(time_text):
+    """把 'YYYY-MM-DD HH:MM:SS' 转换为整数时间戳（按 UTC 解释，只用于排序），无法解析时为 0"""
+    try:
+        return calendar.timegm(time.strptime(time_text, TIME_FORMAT))
+    except (TypeError, ValueError):
+        return 0
+
+def parse_abstract(abstract):
+    """把简介拆成结构化字段：directors/actors/genres/countries 为去重后的名称列表，year 为整数（没有时为 None）"""
+    fields = {'directors': [], 'actors': [], 'genres': [], 'countries': [], 'year': None}
+    for line in (abstract or '').replace('：', ':').split('\n'):
+        label, sep, value = line.partition(':')
+        key = ABSTRACT_FIELDS.get(label.strip())
+        if not sep or key is None:
+            continue
+        if key == 'year':
+            match = YEAR_PATTERN.search(value)
+            fields['year'] = int(match.group()) if match else None
+        else:
+            fields[key] = list(dict.fromkeys(name.strip() for name in value.split('/') if name.strip()))
+    return fields
+
+def role_condition(role, column='role'):
+    """人物关联按角色筛选的 SQL 条件片段（以 AND 开头），类型和地区分面没有角色时为空字符串"""
+    return f"AND {column} = '{role}'" if role else ''
+
+def sort_key_of(movie, sort_by):
+    """取出电影记录在指定排序方式下的排序键，用于生成分页游标"""
+    if sort_by == 'rating':
+        return parse_rating(movie['rating'])
+    if sort_by == 'time':
+        return parse_time(movie['time'])
+    return movie[sort_by]
+
+def project_columns(fields):
+    """把逗号分隔的字段列表（接口的 fields 参数）转换为要查询的列名元组
+
+    按 MOVIE_COLUMNS 的顺序排列并总是包含 id；为空时返回全部列，含未知字段时抛出 ValueError。
+    """
+    names = {name.strip() for name in (fields or '').split(',') if name.strip()}
+    if not names:
+        return MOVIE_COLUMNS
+    unknown = names.difference(MOVIE_COLUMNS)
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(sorted(unknown))}")
+    names.add('id')
+    return tuple(name for name in MOVIE_COLUMNS if name in names)
+
+def doulist_scope(doulist_id, column='id', keyword='AND'):
+    """按豆列筛选的 SQL 条件片段和参数；doulist_id 为 None 时不筛选"""
+    if doulist_id is None:
+        return '', []
+    return f'{keyword} {DOULIST_FILTER.format(column=column)}', [doulist_id]
+
+@lru_cache(maxsize=None)
+def record_type(columns):
+    """列名元组对应的记录类型（namedtuple，实例没有 __dict__，按属性或下标访问）"""
+    return namedtuple('MovieRecord', columns)
+
+def row_decoder(columns=MOVIE_COLUMNS, row_format='dict'):
+    """返回把一行元组解码为指定格式的函数
+
+    row_format 为 dict（字典，接口默认）、record（namedtuple）或 tuple（原样返回，此时为 None）。
+    """
+    if row_format == 'tuple':
+        return None
+    if row_format == 'record':
+        return record_type(columns)._make
+    return lambda row: dict(zip(columns, row))
+
+def decode_rows(rows, columns=MOVIE_COLUMNS, row_format='dict'):
+    """按 row_format 解码一批查询结果"""
+    decoder = row_decoder(columns, row_format)
+    return rows if decoder is None else list(map(decoder, rows))
+
+def iter_json_array(rows, columns=MOVIE_COLUMNS, dumps=json.dumps):
+    """把元组行逐条编码为 JSON 数组的文本片段，整个数组不会同时留在内存中"""
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + dumps(dict(zip(columns, row)))
+        separator = ','
+    yield ']'
+
+def open_connection(db_file, readonly=False, bulk=False):
+    """打开一个已配置好 PRAGMA 的数据库连接，bulk=True 时使用批量写入设置（仅用于暂存快照）"""
+    if readonly:
+        # 只读连接：不能修改 journal_mode，WAL 由写连接负责开启
+        conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_file, check_same_thread=False)
+        if not bulk:
+            conn.execute('PRAGMA journal_mode=WAL')
+    for pragma in CONNECTION_PRAGMAS + (BULK_PRAGMAS if bulk else ()):
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """线程安全的有界连接池，连接按需创建并复用
+
+    db_file 可以是指向快照文件的符号链接（见 snapshot.py）：发布新快照后，
+    新建的连接打开新快照，正在使用的连接读完旧快照、归还时关闭。
+    空闲连接和名额由同一个条件变量保护，归还或关闭连接后都会唤醒等待的线程。
+    """
+    def __init__(self, db_file='movies.db', size=8, readonly=True, timeout=10):
         self.db_file = db_file
+        self.size = size
+        self.readonly = readonly
+        self.timeout = timeout
+        self._idle = []  # 空闲连接，后进先出
+        self._created = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._inherited = []
+        self._link = self._read_link()
+        self._path = os.path.realpath(db_file)
+        self._paths = {}  # 连接 -> 打开的快照文件
+
+    def _check_fork(self):
+        """多进程部署时，fork 出的子进程不能使用父进程打开的 SQLite 连接，需要重新建池"""
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                # 保留引用而不关闭：在子进程中关闭继承来的连接会影响父进程
+                self._inherited.extend(self._idle)
+                self._idle = []
+                self._created = 0
+                self._paths = {}
+                self._pid = os.getpid()
+
+    def _read_link(self):
+        """db_file 符号链接的目标（每个快照的文件名都不同），不是符号链接时返回 None"""
+        try:
+            return os.readlink(self.db_file)
+        except OSError:
+            return None
+
+    def _check_snapshot(self):
+        """db_file 指向的快照变化后，关闭仍连着旧快照的空闲连接"""
+        link = self._read_link()
+        if link == self._link:
+            return
+        with self._cond:
+            if link == self._link:
+                return
+            self._link = link
+            self._path = os.path.realpath(self.db_file)
+            stale, self._idle = self._idle, []
+        for conn in stale:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        """关闭一个连接，腾出名额并唤醒一个等待的线程"""
+        conn.close()
+        with self._cond:
+            self._paths.pop(conn, None)
+            self._created -= 1
+            self._cond.notify()
+
+    def acquire(self):
+        """取出一个连接，池满时最多等待 timeout 秒
+
+        等待期间有连接归还时直接取用，有名额腾出（旧快照的连接被关闭）时新建连接。
+        """
+        self._check_fork()
+        self._check_snapshot()
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    # 直接打开解析后的快照文件，连接与快照一一对应
+                    path = self._path
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError('等待数据库连接超时')
+                self._cond.wait(remaining)
+
+        try:
+            conn = open_connection(path, self.readonly)
+        except sqlite3.Error:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._paths[conn] = path
+        return conn
+
+    def release(self, conn):
+        """归还连接，未结束的事务会被回滚；连着旧快照的连接直接关闭"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if self._paths.get(conn) == self._path:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    @property
+    def open_count(self):
+        """已创建且未关闭的连接数"""
+        return self._created
+
+    @property
+    def idle_count(self):
+        """当前空闲的连接数"""
+        return len(self._idle)
+
+    def close_all(self):
+        """关闭池中所有空闲连接"""
+        with self._cond:
+            conns, self._idle = self._idle, []
+        for conn in conns:
+            self._discard(conn)
+
+class MovieDatabase:
+    def __init__(self, db_file='movies.db', pool=None, bulk=False):
+        """初始化数据库连接，传入 pool 时从连接池借用连接；bulk=True 时使用批量写入设置（仅用于暂存快照）"""
+        self.pool = pool
+        self.db_file = pool.db_file if pool else db_file
+        self.bulk = bulk
         self.conn = None
         self.cursor = None
         
     def connect(self):
         """连接到数据库"""
         try:
-            self.conn = sqlite3.connect(self.db_file)
+            if self.pool:
+                self.conn = self.pool.acquire()
+            else:
+                self.conn = open_connection(self.db_file, bulk=self.bulk)
             self.cursor = self.conn.cursor()
             return True
         except sqlite3.Error as e:
-            print(f"数据库连接错误: {e}")
+            logger.error('数据库连接错误: %s', e)
             return False
             
     def close(self):
-        """关闭数据库连接"""
+        """关闭数据库连接（连接池模式下归还连接）"""
         if self.conn:
-            self.conn.close()
+            if self.pool:
+                self.cursor.close()
+                self.pool.release(self.conn)
+            else:
+                self.conn.close()
             self.conn = None
             self.cursor = None
             
@@ -41,15 +436,593 @@ class MovieDatabase:
                 abstract TEXT,
                 time TEXT,
                 doulist_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                rating_num REAL NOT NULL DEFAULT 0,
+                added_at INTEGER NOT NULL DEFAULT 0,
+                subject_id TEXT,
+                year INTEGER
             )
             ''')
+            self.migrate()
+            self.create_indexes()
+            self.create_doulist_tables()
+            self.create_metadata_tables()
+            self.create_search_index()
+            self.create_meta_table()
+            self.create_stats_table()
             self.conn.commit()
             return True
         except sqlite3.Error as e:
-            print(f"创建表错误: {e}")
+            logger.error('创建表错误: %s', e)
             return False
-            
+
+    def migrate(self):
+        """原地升级旧版数据库：补充数值评分和时间戳列并回填，无需重新爬取"""
+        self.cursor.execute('PRAGMA table_info(movies)')
+        columns = {row[1] for row in self.cursor.fetchall()}
+
+        if 'rating_num' not in columns:
+            self.cursor.execute('ALTER TABLE movies ADD COLUMN rating_num REAL NOT NULL DEFAULT 0')
+            self.cursor.execute('SELECT id, rating FROM movies')
+            self.cursor.executemany(
+                'UPDATE movies SET rating_num = ? WHERE id = ?',
+                [(parse_rating(rating), movie_id) for movie_id, rating in self.cursor.fetchall()]
+            )
+
+        if 'added_at' not in columns:
+            self.cursor.execute('ALTER TABLE movies ADD COLUMN added_at INTEGER NOT NULL DEFAULT 0')
+            self.cursor.execute('SELECT id, time FROM movies')
+            self.cursor.executemany(
+                'UPDATE movies SET added_at = ? WHERE id = ?',
+                [(parse_time(time_text), movie_id) for movie_id, time_text in self.cursor.fetchall()]
+            )
+
+        if 'subject_id' not in columns:
+            # 旧数据没有条目链接，留空，之后爬取时按标题认领
+            self.cursor.execute('ALTER TABLE movies ADD COLUMN subject_id TEXT')
+
+        if 'year' not in columns:
+            self.cursor.execute('ALTER TABLE movies ADD COLUMN year INTEGER')
+            self.cursor.execute('SELECT id, abstract FROM movies')
+            self.cursor.executemany(
+                'UPDATE movies SET year = ? WHERE id = ?',
+                [(parse_abstract(abstract)['year'], movie_id) for movie_id, abstract in self.cursor.fetchall()]
+            )
+
+        # 旧版基于 TEXT/CAST 表达式的排序索引，以及改由 doulist_movies 表承担的豆列索引
+        for name in ('idx_movies_time_id', 'idx_movies_rating_id', 'idx_movies_title_id', 'idx_movies_doulist'):
+            self.cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+    def create_indexes(self):
+        """为每种排序方式创建 (排序列, id) 复合索引，并附带列表页所需的列，使排序和游标定位都走索引"""
+        # 索引可以双向扫描，同一排序列的升序和降序共用一个索引
+        for sort_by, key in SORT_KEYS.items():
+            name = f'idx_movies_sort_{sort_by}'
+            columns = [column for column in SORT_INDEX_COLUMNS if column != key]
+            sql = f"CREATE INDEX {name} ON movies ({key}, id, {', '.join(columns)})"
+            self.cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (name,))
+            row = self.cursor.fetchone()
+            if row and row[0] != sql:
+                # 旧版索引附带的列不同，重建
+                self.cursor.execute(f'DROP INDEX {name}')
+                row = None
+            if row is None:
+                self.cursor.execute(sql)
+        # 豆瓣条目 ID 作为自然键，用于增量爬取时的 upsert
+        self.cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_movies_subject ON movies (subject_id)')
+        # 按年份范围筛选
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_year ON movies (year, id)')
+
+    def create_doulist_tables(self):
+        """创建豆列表（元数据和最近一次爬取的状态）和豆列-电影关联表
+
+        movies.doulist_id 只记录电影最早出现的豆列，电影属于哪些豆列以 doulist_movies 为准。
+        """
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS doulists (
+            doulist_id TEXT PRIMARY KEY,
+            title TEXT,
+            url TEXT,
+            total_pages INTEGER,
+            last_crawl_started TEXT,
+            last_crawl_finished TEXT,
+            last_crawl_status TEXT,
+            last_crawl_saved INTEGER,
+            last_crawl_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'doulist_movies'")
+        exists = self.cursor.fetchone() is not None
+
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS doulist_movies (
+            doulist_id TEXT NOT NULL,
+            movie_id INTEGER NOT NULL,
+            added_at INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (doulist_id, movie_id)
+        ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_doulist_movies_movie ON doulist_movies (movie_id)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_doulist_movies_added ON doulist_movies (doulist_id, added_at, movie_id)')
+
+        # 删除电影时先删除它的豆列关联（BEFORE 触发器，关联表的统计触发器还能读到电影的评分）
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_membership_delete BEFORE DELETE ON movies BEGIN
+            DELETE FROM doulist_movies WHERE movie_id = old.id;
+        END
+        ''')
+
+        # 旧数据库第一次创建关联表时，按每部电影记录的豆列建立关联
+        if not exists:
+            self.cursor.execute('''
+            INSERT OR IGNORE INTO doulist_movies (doulist_id, movie_id, added_at)
+            SELECT doulist_id, id, added_at FROM movies WHERE doulist_id IS NOT NULL AND doulist_id != ''
+            ''')
+            self.cursor.execute('INSERT OR IGNORE INTO doulists (doulist_id) SELECT DISTINCT doulist_id FROM doulist_movies')
+
+    def create_metadata_tables(self):
+        """创建从简介中解析出的人物、类型、地区维表及其与电影的关联表
+
+        关联表以电影 ID 开头作主键，另有以维表 ID 开头的索引，按导演/类型/地区筛选时直接走索引。
+        """
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movie_people'")
+        exists = self.cursor.fetchone() is not None
+
+        for table in ('people', 'genres', 'countries'):
+            self.cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)')
+
+        # 人物关联：role 为 director 或 actor，position 为在简介中的先后顺序
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS movie_people (
+            movie_id INTEGER NOT NULL,
+            person_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            position INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (movie_id, role, person_id)
+        ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_movie_people_person ON movie_people (person_id, role, movie_id)')
+
+        for link, key in (('movie_genres', 'genre_id'), ('movie_countries', 'country_id')):
+            self.cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {link} (
+                movie_id INTEGER NOT NULL,
+                {key} INTEGER NOT NULL,
+                PRIMARY KEY (movie_id, {key})
+            ) WITHOUT ROWID
+            ''')
+            self.cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{link}_{key} ON {link} ({key}, movie_id)')
+
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_metadata_delete AFTER DELETE ON movies BEGIN
+            DELETE FROM movie_people WHERE movie_id = old.id;
+            DELETE FROM movie_genres WHERE movie_id = old.id;
+            DELETE FROM movie_countries WHERE movie_id = old.id;
+        END
+        ''')
+
+        self.create_facet_stats_table()
+
+        # 旧数据库第一次创建关联表时，解析已有电影的简介
+        if not exists:
+            self.cursor.execute('SELECT id, abstract FROM movies')
+            self._write_metadata(self.cursor.fetchall())
+
+    def create_facet_stats_table(self):
+        """创建分面统计表（不带筛选时各类型、地区、导演、演员和年份的电影数），由触发器随关联表和 movies 表更新"""
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'facet_stats'")
+        exists = self.cursor.fetchone() is not None
+
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS facet_stats (
+            facet TEXT NOT NULL,
+            value_id INTEGER NOT NULL,
+            movie_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (facet, value_id)
+        ) WITHOUT ROWID
+        ''')
+
+        add = '''
+            INSERT INTO facet_stats (facet, value_id, movie_count) VALUES ('{facet}', {value}, 1)
+            ON CONFLICT (facet, value_id) DO UPDATE SET movie_count = movie_count + 1;
+        '''
+        remove = "UPDATE facet_stats SET movie_count = movie_count - 1 WHERE facet = '{facet}' AND value_id = {value};"
+
+        for name, (_, link, key, role) in FACETS.items():
+            new_when = f"WHEN new.role = '{role}'" if role else ''
+            old_when = f"WHEN old.role = '{role}'" if role else ''
+            self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS facet_stats_{name}_insert AFTER INSERT ON {link} {new_when} BEGIN
+                {add.format(facet=name, value=f'new.{key}')}
+            END
+            ''')
+            self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS facet_stats_{name}_delete AFTER DELETE ON {link} {old_when} BEGIN
+                {remove.format(facet=name, value=f'old.{key}')}
+            END
+            ''')
+
+        self.cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS facet_stats_year_insert AFTER INSERT ON movies WHEN new.year IS NOT NULL BEGIN
+            {add.format(facet='year', value='new.year')}
+        END
+        ''')
+        self.cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS facet_stats_year_delete AFTER DELETE ON movies WHEN old.year IS NOT NULL BEGIN
+            {remove.format(facet='year', value='old.year')}
+        END
+        ''')
+        self.cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS facet_stats_year_update AFTER UPDATE OF year ON movies
+        WHEN old.year IS NOT new.year BEGIN
+            {remove.format(facet='year', value='old.year')}
+            INSERT INTO facet_stats (facet, value_id, movie_count)
+            SELECT 'year', new.year, 1 WHERE new.year IS NOT NULL
+            ON CONFLICT (facet, value_id) DO UPDATE SET movie_count = movie_count + 1;
+        END
+        ''')
+
+        # 统计表第一次创建时按已有数据汇总
+        if not exists:
+            for name, (_, link, key, role) in FACETS.items():
+                where = f"WHERE role = '{role}'" if role else ''
+                self.cursor.execute(f'''
+                INSERT INTO facet_stats (facet, value_id, movie_count)
+                SELECT '{name}', {key}, COUNT(*) FROM {link} {where} GROUP BY {key}
+                ''')
+            self.cursor.execute('''
+            INSERT INTO facet_stats (facet, value_id, movie_count)
+            SELECT 'year', year, COUNT(*) FROM movies WHERE year IS NOT NULL GROUP BY year
+            ''')
+
+    def _write_metadata(self, movies):
+        """按简介重写电影的导演、演员、类型和地区关联，movies 为 [(电影 ID, 简介)]（调用方负责事务）"""
+        movie_ids = [(movie_id,) for movie_id, _ in movies]
+        for link in ('movie_people', 'movie_genres', 'movie_countries'):
+            self.cursor.executemany(f'DELETE FROM {link} WHERE movie_id = ?', movie_ids)
+
+        people, genres, countries = [], [], []
+        for movie_id, abstract in movies:
+            fields = parse_abstract(abstract)
+            for role, key in (('director', 'directors'), ('actor', 'actors')):
+                people.extend((movie_id, role, position, name) for position, name in enumerate(fields[key]))
+            genres.extend((movie_id, name) for name in fields['genres'])
+            countries.extend((movie_id, name) for name in fields['countries'])
+
+        # 先补齐维表中的名称，再按名称查出 ID 写入关联表
+        for table, link, key, rows in (('genres', 'movie_genres', 'genre_id', genres),
+                                       ('countries', 'movie_countries', 'country_id', countries)):
+            self.cursor.executemany(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', {(row[-1],) for row in rows})
+            self.cursor.executemany(
+                f'INSERT OR IGNORE INTO {link} (movie_id, {key}) SELECT ?, id FROM {table} WHERE name = ?', rows
+            )
+        self.cursor.executemany('INSERT OR IGNORE INTO people (name) VALUES (?)', {(row[-1],) for row in people})
+        self.cursor.executemany('''
+        INSERT OR IGNORE INTO movie_people (movie_id, role, position, person_id)
+        SELECT ?, ?, ?, id FROM people WHERE name = ?
+        ''', people)
+
+    def create_search_index(self):
+        """创建标题和简介的 FTS5 全文索引（三元组分词，适用于中文），由触发器与 movies 表保持同步"""
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movies_fts'")
+        exists = self.cursor.fetchone() is not None
+
+        self.cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            title, abstract,
+            content='movies', content_rowid='id',
+            tokenize='trigram'
+        )
+        ''')
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+        END
+        ''')
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title, abstract) VALUES ('delete', old.id, old.title, old.abstract);
+        END
+        ''')
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF title, abstract ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title, abstract) VALUES ('delete', old.id, old.title, old.abstract);
+            INSERT INTO movies_fts (rowid, title, abstract) VALUES (new.id, new.title, new.abstract);
+        END
+        ''')
+
+        # 旧数据库第一次创建索引时，为已有数据建立索引
+        if not exists:
+            self.cursor.execute("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+
+    def create_meta_table(self):
+        """创建元数据表，并用触发器在 movies 表每次变化时递增数据版本号，供读取端判断缓存是否过期"""
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        ''')
+        self.cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS movies_version_{event.lower()} AFTER {event} ON movies BEGIN
+                UPDATE meta SET value = value + 1 WHERE key = 'data_version';
+            END
+            ''')
+        # 已有电影加入或移出豆列也会改变按豆列筛选的结果
+        for event in ('INSERT', 'DELETE'):
+            self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS doulist_movies_version_{event.lower()} AFTER {event} ON doulist_movies BEGIN
+                UPDATE meta SET value = value + 1 WHERE key = 'data_version';
+            END
+            ''')
+        # 豆列名称会出现在统计结果中；只记录爬取状态的更新不影响缓存
+        self.cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS doulists_version_title AFTER UPDATE OF title ON doulists
+        WHEN old.title IS NOT new.title BEGIN
+            UPDATE meta SET value = value + 1 WHERE key = 'data_version';
+        END
+        ''')
+
+    @timed(DB_QUERY_SECONDS)
+    def get_data_version(self):
+        """获取当前数据版本号，movies 表有任何写入时都会变化"""
+        if not self.conn:
+            if not self.connect():
+                return None
+
+        try:
+            self.cursor.execute("SELECT value FROM meta WHERE key = 'data_version'")
+            row = self.cursor.fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error('查询数据版本错误: %s', e)
+            return None
+
+    def create_stats_table(self):
+        """创建统计表（按豆列和评分区间汇总的电影数与评分和），由触发器在同一事务中随 movies 和 doulist_movies 更新
+
+        评分区间为评分的整数部分，没有评分的电影记在 -1 区间；豆列 ID 为空字符串的行汇总全部电影
+        （每部电影只计一次），其余行按 doulist_movies 汇总各豆列的电影。
+        """
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS movie_stats (
+            doulist_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            movie_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (doulist_id, bucket)
+        )
+        ''')
+
+        # 统计表第一次创建，或者仍是按 movies.doulist_id 汇总的旧版时，重建触发器并重新汇总
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'movie_stats_member_insert'")
+        if self.cursor.fetchone() is None:
+            for name in ('movie_stats_insert', 'movie_stats_delete', 'movie_stats_update'):
+                self.cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            self.cursor.execute('DELETE FROM movie_stats')
+            self.cursor.execute(f'''
+            INSERT INTO movie_stats (doulist_id, bucket, movie_count, rating_sum)
+            SELECT '{ALL_MOVIES}', {STATS_BUCKET.format(row='movies')}, COUNT(*), SUM(rating_num)
+            FROM movies
+            GROUP BY 2
+            ''')
+            self.cursor.execute(f'''
+            INSERT INTO movie_stats (doulist_id, bucket, movie_count, rating_sum)
+            SELECT dm.doulist_id, {STATS_BUCKET.format(row='m')}, COUNT(*), SUM(m.rating_num)
+            FROM doulist_movies dm JOIN movies m ON m.id = dm.movie_id
+            GROUP BY 1, 2
+            ''')
+
+        # 全部电影：随 movies 表的写入增减
+        add_new = f'''
+            INSERT INTO movie_stats (doulist_id, bucket, movie_count, rating_sum)
+            VALUES ('{ALL_MOVIES}', {STATS_BUCKET.format(row='new')}, 1, new.rating_num)
+            ON CONFLICT (doulist_id, bucket) DO UPDATE SET
+                movie_count = movie_count + 1,
+                rating_sum = rating_sum + excluded.rating_sum;
+        '''
+        remove_old = f'''
+            UPDATE movie_stats SET movie_count = movie_count - 1, rating_sum = rating_sum - old.rating_num
+            WHERE doulist_id = '{ALL_MOVIES}' AND bucket = {STATS_BUCKET.format(row='old')};
+        '''
+        # 评分变化时，电影所在的每个豆列也要从旧区间移到新区间
+        move_members = f'''
+            UPDATE movie_stats SET movie_count = movie_count - 1, rating_sum = rating_sum - old.rating_num
+            WHERE bucket = {STATS_BUCKET.format(row='old')}
+              AND doulist_id IN (SELECT doulist_id FROM doulist_movies WHERE movie_id = old.id);
+            INSERT INTO movie_stats (doulist_id, bucket, movie_count, rating_sum)
+            SELECT doulist_id, {STATS_BUCKET.format(row='new')}, 1, new.rating_num
+            FROM doulist_movies WHERE movie_id = new.id
+            ON CONFLICT (doulist_id, bucket) DO UPDATE SET
+                movie_count = movie_count + 1,
+                rating_sum = rating_sum + excluded.rating_sum;
+        '''
+        self.cursor.execute(f'CREATE TRIGGER IF NOT EXISTS movie_stats_insert AFTER INSERT ON movies BEGIN {add_new} END')
+        self.cursor.execute(f'CREATE TRIGGER IF NOT EXISTS movie_stats_delete AFTER DELETE ON movies BEGIN {remove_old} END')
+        self.cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS movie_stats_update AFTER UPDATE OF rating_num ON movies '
+            f'BEGIN {remove_old} {add_new} {move_members} END'
+        )
+
+        # 各豆列：随 doulist_movies 的加入和移出增减
+        self.cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS movie_stats_member_insert AFTER INSERT ON doulist_movies BEGIN
+            INSERT INTO movie_stats (doulist_id, bucket, movie_count, rating_sum)
+            SELECT new.doulist_id, {STATS_BUCKET.format(row='movies')}, 1, movies.rating_num
+            FROM movies WHERE movies.id = new.movie_id
+            ON CONFLICT (doulist_id, bucket) DO UPDATE SET
+                movie_count = movie_count + 1,
+                rating_sum = rating_sum + excluded.rating_sum;
+        END
+        ''')
+        self.cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS movie_stats_member_delete AFTER DELETE ON doulist_movies BEGIN
+            UPDATE movie_stats SET
+                movie_count = movie_count - 1,
+                rating_sum = rating_sum - (SELECT rating_num FROM movies WHERE id = old.movie_id)
+            WHERE doulist_id = old.doulist_id
+              AND bucket = (SELECT {STATS_BUCKET.format(row='movies')} FROM movies WHERE movies.id = old.movie_id);
+        END
+        ''')
+
+    @timed(DB_QUERY_SECONDS)
+    def get_stats(self):
+        """读取统计表：电影总数、平均评分、评分分布以及每个豆列的电影数和平均评分"""
+        if not self.conn:
+            if not self.connect():
+                return None
+
+        try:
+            self.cursor.execute('''
+            SELECT s.doulist_id, d.title, s.bucket, s.movie_count, s.rating_sum
+            FROM movie_stats s
+            LEFT JOIN doulists d ON d.doulist_id = s.doulist_id
+            WHERE s.movie_count > 0
+            ORDER BY s.doulist_id, s.bucket
+            ''')
+            rows = self.cursor.fetchall()
+
+            histogram = {}
+            doulists = {}
+            total_count = rated_count = 0
+            rating_sum = 0.0
+            for doulist_id, title, bucket, movie_count, bucket_sum in rows:
+                # 全部电影的汇总行：每部电影只计一次
+                if doulist_id == ALL_MOVIES:
+                    total_count += movie_count
+                    key = 'unrated' if bucket < 0 else str(bucket)
+                    histogram[key] = histogram.get(key, 0) + movie_count
+                    if bucket >= 0:
+                        rated_count += movie_count
+                        rating_sum += bucket_sum
+                    continue
+
+                stats = doulists.setdefault(doulist_id, {'doulist_id': doulist_id, 'title': title, 'count': 0, 'rated': 0, 'rating_sum': 0.0})
+                stats['count'] += movie_count
+                if bucket >= 0:
+                    stats['rated'] += movie_count
+                    stats['rating_sum'] += bucket_sum
+
+            return {
+                'total_count': total_count,
+                'average_rating': round(rating_sum / rated_count, 2) if rated_count else None,
+                'rating_histogram': histogram,
+                'doulists': [
+                    {
+                        'doulist_id': stats['doulist_id'],
+                        'title': stats['title'],
+                        'count': stats['count'],
+                        'average_rating': round(stats['rating_sum'] / stats['rated'], 2) if stats['rated'] else None
+                    }
+                    for stats in doulists.values()
+                ]
+            }
+        except sqlite3.Error as e:
+            logger.error('查询统计数据错误: %s', e)
+            return None
+
+    @timed(DB_QUERY_SECONDS)
+    def get_doulists(self):
+        """获取全部豆列的元数据、最近一次爬取的状态和电影数"""
+        if not self.conn:
+            if not self.connect():
+                return []
+
+        try:
+            self.cursor.execute('''
+            SELECT d.doulist_id, d.title, d.url, d.total_pages,
+                   d.last_crawl_started, d.last_crawl_finished, d.last_crawl_status, d.last_crawl_saved, d.last_crawl_error,
+                   (SELECT COALESCE(SUM(movie_count), 0) FROM movie_stats s WHERE s.doulist_id = d.doulist_id)
+            FROM doulists d
+            ORDER BY d.created_at, d.doulist_id
+            ''')
+            columns = ('doulist_id', 'title', 'url', 'total_pages',
+                       'last_crawl_started', 'last_crawl_finished', 'last_crawl_status', 'last_crawl_saved', 'last_crawl_error',
+                       'movie_count')
+            return [dict(zip(columns, row)) for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error('查询豆列错误: %s', e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    def start_crawl(self, doulist_id, url=None):
+        """登记豆列并记录开始爬取；上一次爬取的结果保留到本次结束时才覆盖"""
+        if not self.conn:
+            if not self.connect():
+                return False
+
+        try:
+            self.cursor.execute('''
+            INSERT INTO doulists (doulist_id, url, last_crawl_started, last_crawl_status)
+            VALUES (?, ?, CURRENT_TIMESTAMP, 'running')
+            ON CONFLICT (doulist_id) DO UPDATE SET
+                url = COALESCE(excluded.url, url),
+                last_crawl_started = excluded.last_crawl_started,
+                last_crawl_status = excluded.last_crawl_status
+            ''', (doulist_id, url))
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error('更新豆列错误: %s', e)
+            return False
+
+    @timed(DB_QUERY_SECONDS)
+    def finish_crawl(self, doulist_id, status, saved=0, error=None, title=None, total_pages=None):
+        """记录豆列爬取结束：状态（ok / failed）、保存条数、错误信息，以及页面上解析到的标题和页数"""
+        if not self.conn:
+            if not self.connect():
+                return False
+
+        try:
+            self.cursor.execute('''
+            INSERT INTO doulists (doulist_id, title, total_pages, last_crawl_finished, last_crawl_status, last_crawl_saved, last_crawl_error)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?)
+            ON CONFLICT (doulist_id) DO UPDATE SET
+                title = COALESCE(excluded.title, title),
+                total_pages = COALESCE(excluded.total_pages, total_pages),
+                last_crawl_finished = excluded.last_crawl_finished,
+                last_crawl_status = excluded.last_crawl_status,
+                last_crawl_saved = excluded.last_crawl_saved,
+                last_crawl_error = excluded.last_crawl_error
+            ''', (doulist_id, title, total_pages, status, saved, error))
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error('更新豆列错误: %s', e)
+            return False
+
+    def defer_indexes(self):
+        """批量写入前删除非唯一的二级索引、派生表及维护它们的触发器，写完后调用 create_table() 一次性重建
+
+        唯一索引（按条目 ID upsert 依赖它）、关联表和数据版本触发器保留，写入逻辑不受影响。
+        """
+        if not self.conn:
+            if not self.connect():
+                return False
+
+        try:
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%'")
+            indexes = [row[0] for row in self.cursor.fetchall()]
+            self.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            triggers = [name for (name,) in self.cursor.fetchall() if name.startswith(tuple(f'{t}_' for t in DERIVED_TABLES))]
+
+            for name in indexes:
+                self.cursor.execute(f'DROP INDEX IF EXISTS {name}')
+            for name in triggers:
+                self.cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            for table in DERIVED_TABLES:
+                self.cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error('删除索引错误: %s', e)
+            return False
+
     def drop_table(self):
         """删除电影信息表"""
         if not self.conn:
@@ -57,13 +1030,19 @@ class MovieDatabase:
                 return False
                 
         try:
+            self.cursor.execute('DROP TABLE IF EXISTS movies_fts')
+            self.cursor.execute('DROP TABLE IF EXISTS movie_stats')
+            self.cursor.execute('DROP TABLE IF EXISTS doulist_movies')
+            for table in ('facet_stats', 'movie_people', 'movie_genres', 'movie_countries', 'people', 'genres', 'countries'):
+                self.cursor.execute(f'DROP TABLE IF EXISTS {table}')
             self.cursor.execute('DROP TABLE IF EXISTS movies')
             self.conn.commit()
             return True
         except sqlite3.Error as e:
-            print(f"删除表错误: {e}")
+            logger.error('删除表错误: %s', e)
             return False
             
+    @timed(DB_QUERY_SECONDS)
     def insert_movie(self, movie_data, doulist_id=None):
         """插入一条电影记录"""
         if not self.conn:
@@ -73,8 +1052,8 @@ class MovieDatabase:
         try:
             # 准备SQL语句和参数
             sql = '''
-            INSERT INTO movies (title, rating, image, abstract, time, doulist_id)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO movies (title, rating, image, abstract, time, doulist_id, rating_num, added_at, year, subject_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             '''
             params = (
                 movie_data.get('title', ''),
@@ -82,16 +1061,142 @@ class MovieDatabase:
                 movie_data.get('image', ''),
                 movie_data.get('abstract', ''),
                 movie_data.get('time', ''),
-                doulist_id
+                doulist_id,
+                parse_rating(movie_data.get('rating')),
+                parse_time(movie_data.get('time')),
+                parse_abstract(movie_data.get('abstract'))['year'],
+                movie_data.get('subject_id')
             )
             
             self.cursor.execute(sql, params)
+            movie_id = self.cursor.lastrowid
+            self._write_metadata([(movie_id, params[3])])
+            if doulist_id is not None:
+                self.cursor.execute(MEMBERSHIP_UPSERT_SQL, (doulist_id, movie_id, params[7]))
             self.conn.commit()
-            return self.cursor.lastrowid
+            return movie_id
         except sqlite3.Error as e:
-            print(f"插入数据错误: {e}")
+            self.conn.rollback()
+            logger.error('插入数据错误: %s', e)
             return False
             
+    def upsert_movie(self, movie_data, doulist_id=None):
+        """按豆瓣条目 ID 插入或更新一条电影记录，返回记录 ID，失败时返回 False（原因已由 insert_movies 记录日志）"""
+        movie_id = self.insert_movies([movie_data], doulist_id)[0][0]
+        return movie_id if movie_id is not None else False
+
+    @timed(DB_QUERY_SECONDS)
+    def insert_movies(self, movies_data, doulist_id=None):
+        """批量写入电影记录（按豆瓣条目 ID upsert），整批只提交一次事务
+
+        返回 (ids, failures)：ids 与输入一一对应，写入失败的行为 None；
+        failures 为 [(下标, 错误信息)]，单行失败不会中断整批写入。
+        """
+        ids = [None] * len(movies_data)
+        failures = []
+
+        if not self.conn:
+            if not self.connect():
+                return ids, [(i, '数据库连接失败') for i in range(len(movies_data))]
+
+        rows = []
+        for i, movie_data in enumerate(movies_data):
+            if not movie_data.get('title'):
+                failures.append((i, '缺少标题'))
+                continue
+            rows.append((i, (
+                movie_data.get('title', ''),
+                movie_data.get('rating', ''),
+                movie_data.get('image', ''),
+                movie_data.get('abstract', ''),
+                movie_data.get('time', ''),
+                doulist_id,
+                parse_rating(movie_data.get('rating')),
+                parse_time(movie_data.get('time')),
+                parse_abstract(movie_data.get('abstract'))['year'],
+                movie_data.get('subject_id') or None
+            )))
+
+        # 有条目 ID 的行走 executemany 快速路径，其余逐行写入以取得自增 ID
+        keyed = [(i, params) for i, params in rows if params[-1]]
+        pending = [(i, params) for i, params in rows if not params[-1]]
+
+        try:
+            # 立即取得写锁：多个豆列并发写入时在 busy timeout 内排队，而不是在读后升级写锁时失败
+            if not self.conn.in_transaction:
+                self.cursor.execute('BEGIN IMMEDIATE')
+
+            if keyed:
+                # 认领迁移前没有条目 ID 的旧记录，避免重复插入；条目 ID 已被认领过时不再认领同名的其他旧记录
+                self.cursor.executemany('''
+                UPDATE movies SET subject_id = ?
+                WHERE id = (
+                    SELECT id FROM movies
+                    WHERE subject_id IS NULL AND title = ? AND doulist_id IS ?
+                    LIMIT 1
+                )
+                AND NOT EXISTS (SELECT 1 FROM movies WHERE subject_id = ?)
+                ''', [(params[-1], params[0], doulist_id, params[-1]) for _, params in keyed])
+
+                self.cursor.execute('SAVEPOINT bulk_upsert')
+                try:
+                    self.cursor.executemany(UPSERT_SQL, [params for _, params in keyed])
+                    self.cursor.execute('RELEASE bulk_upsert')
+                    self._fill_ids_by_subject(keyed, ids)
+                except sqlite3.Error:
+                    # 整批失败时撤销这一批，改为逐行写入以定位出错的行
+                    self.cursor.execute('ROLLBACK TO bulk_upsert')
+                    self.cursor.execute('RELEASE bulk_upsert')
+                    pending = keyed + pending
+
+            for i, params in pending:
+                self.cursor.execute('SAVEPOINT row_upsert')
+                try:
+                    self.cursor.execute(UPSERT_SQL + ' RETURNING id', params)
+                    ids[i] = self.cursor.fetchone()[0]
+                    self.cursor.execute('RELEASE row_upsert')
+                except sqlite3.Error as e:
+                    self.cursor.execute('ROLLBACK TO row_upsert')
+                    self.cursor.execute('RELEASE row_upsert')
+                    failures.append((i, str(e)))
+
+            # 在同一事务中按简介更新导演、演员、类型和地区关联
+            abstracts = {i: params[3] for i, params in rows}
+            self._write_metadata([(movie_id, abstracts[i]) for i, movie_id in enumerate(ids) if movie_id is not None])
+
+            # 在同一事务中登记豆列关联，同一部电影在多个豆列中只存一行
+            if doulist_id is not None:
+                added_at = {i: params[7] for i, params in rows}
+                self.cursor.executemany(MEMBERSHIP_UPSERT_SQL, [
+                    (doulist_id, movie_id, added_at[i]) for i, movie_id in enumerate(ids) if movie_id is not None
+                ])
+
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error('批量写入数据错误: %s', e)
+            return [None] * len(movies_data), [(i, str(e)) for i in range(len(movies_data))]
+
+        for i, message in failures:
+            logger.error('写入数据错误: %s - %s', movies_data[i].get('title'), message)
+        return ids, sorted(failures)
+
+    def _fill_ids_by_subject(self, keyed, ids):
+        """按条目 ID 查回批量写入的记录 ID"""
+        positions = {params[-1]: i for i, params in keyed}
+        subject_ids = list(positions)
+        # 分块查询，避免超过 SQLite 的参数数量上限
+        for start in range(0, len(subject_ids), 500):
+            chunk = subject_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            self.cursor.execute(f'SELECT subject_id, id FROM movies WHERE subject_id IN ({placeholders})', chunk)
+            for subject_id, movie_id in self.cursor.fetchall():
+                ids[positions[subject_id]] = movie_id
+        # 同一批中重复出现的条目 ID 指向同一条记录
+        for i, params in keyed:
+            ids[i] = ids[positions[params[-1]]]
+
+    @timed(DB_QUERY_SECONDS)
     def update_movie(self, movie_id, movie_data):
         """更新电影记录"""
         if not self.conn:
@@ -102,7 +1207,7 @@ class MovieDatabase:
             # 准备SQL语句和参数
             sql = '''
             UPDATE movies
-            SET title = ?, rating = ?, image = ?, abstract = ?, time = ?
+            SET title = ?, rating = ?, image = ?, abstract = ?, time = ?, rating_num = ?, added_at = ?, year = ?
             WHERE id = ?
             '''
             params = (
@@ -111,16 +1216,24 @@ class MovieDatabase:
                 movie_data.get('image', ''),
                 movie_data.get('abstract', ''),
                 movie_data.get('time', ''),
+                parse_rating(movie_data.get('rating')),
+                parse_time(movie_data.get('time')),
+                parse_abstract(movie_data.get('abstract'))['year'],
                 movie_id
             )
             
             self.cursor.execute(sql, params)
+            updated = self.cursor.rowcount > 0
+            if updated:
+                self._write_metadata([(movie_id, params[3])])
             self.conn.commit()
-            return self.cursor.rowcount > 0
+            return updated
         except sqlite3.Error as e:
-            print(f"更新数据错误: {e}")
+            self.conn.rollback()
+            logger.error('更新数据错误: %s', e)
             return False
             
+    @timed(DB_QUERY_SECONDS)
     def delete_movie(self, movie_id):
         """删除电影记录"""
         if not self.conn:
@@ -132,9 +1245,10 @@ class MovieDatabase:
             self.conn.commit()
             return self.cursor.rowcount > 0
         except sqlite3.Error as e:
-            print(f"删除数据错误: {e}")
+            logger.error('删除数据错误: %s', e)
             return False
             
+    @timed(DB_QUERY_SECONDS)
     def get_movie_by_id(self, movie_id):
         """根据ID获取电影信息"""
         if not self.conn:
@@ -142,30 +1256,53 @@ class MovieDatabase:
                 return None
                 
         try:
-            self.cursor.execute('''
-            SELECT id, title, rating, image, abstract, time, doulist_id, created_at
+            self.cursor.execute(f'''
+            SELECT {MOVIE_SELECT}
             FROM movies
             WHERE id = ?
             ''', (movie_id,))
             
             row = self.cursor.fetchone()
             if row:
-                return {
-                    'id': row[0],
-                    'title': row[1],
-                    'rating': row[2],
-                    'image': row[3],
-                    'abstract': row[4],
-                    'time': row[5],
-                    'doulist_id': row[6],
-                    'created_at': row[7]
-                }
+                return dict(zip(MOVIE_COLUMNS, row))
             return None
         except sqlite3.Error as e:
-            print(f"查询数据错误: {e}")
+            logger.error('查询数据错误: %s', e)
             return None
             
-    def get_movies_by_doulist(self, doulist_id):
+    @timed(DB_QUERY_SECONDS)
+    def get_movies_by_ids(self, movie_ids, columns=MOVIE_COLUMNS):
+        """一次查询获取多部电影，按传入 ID 的顺序返回，不存在的 ID 会被跳过
+
+        ID 超过 ID_BATCH_SIZE 个时分批查询；columns 同 get_sorted_movies（第一列须为 id，见 project_columns）。
+        """
+        if not self.conn:
+            if not self.connect():
+                return []
+
+        if not movie_ids:
+            return []
+
+        try:
+            movie_ids = list(movie_ids)
+            found = {}
+            for start in range(0, len(movie_ids), ID_BATCH_SIZE):
+                batch = movie_ids[start:start + ID_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                self.cursor.execute(f'''
+                SELECT {', '.join(columns)}
+                FROM movies
+                WHERE id IN ({placeholders})
+                ''', batch)
+                found.update((row[0], dict(zip(columns, row))) for row in self.cursor.fetchall())
+
+            return [found[movie_id] for movie_id in movie_ids if movie_id in found]
+        except sqlite3.Error as e:
+            logger.error('查询数据错误: %s', e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    def get_movies_by_doulist(self, doulist_id, row_format='dict'):
         """获取指定豆列的所有电影"""
         if not self.conn:
             if not self.connect():
@@ -173,168 +1310,541 @@ class MovieDatabase:
                 
         try:
             self.cursor.execute('''
-            SELECT id, title, rating, image, abstract, time, doulist_id, created_at
-            FROM movies
-            WHERE doulist_id = ?
-            ORDER BY time DESC
+            SELECT m.id, m.title, m.rating, m.image, m.abstract, m.time, m.doulist_id, m.created_at
+            FROM doulist_movies dm
+            JOIN movies m ON dm.movie_id = m.id
+            WHERE dm.doulist_id = ?
+            ORDER BY dm.added_at DESC, m.id DESC
             ''', (doulist_id,))
             
-            movies = []
-            for row in self.cursor.fetchall():
-                movies.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'rating': row[2],
-                    'image': row[3],
-                    'abstract': row[4],
-                    'time': row[5],
-                    'doulist_id': row[6],
-                    'created_at': row[7]
-                })
-            return movies
+            return decode_rows(self.cursor.fetchall(), MOVIE_COLUMNS, row_format)
         except sqlite3.Error as e:
-            print(f"查询数据错误: {e}")
+            logger.error('查询数据错误: %s', e)
             return []
             
-    def get_all_movies(self, limit=100, offset=0):
+    @timed(DB_QUERY_SECONDS)
+    def get_all_movies(self, limit=100, offset=0, row_format='dict'):
         """获取所有电影，支持分页"""
         if not self.conn:
             if not self.connect():
                 return []
                 
         try:
-            self.cursor.execute('''
-            SELECT id, title, rating, image, abstract, time, doulist_id, created_at
+            self.cursor.execute(f'''
+            SELECT {MOVIE_SELECT}
             FROM movies
             ORDER BY created_at DESC
             LIMIT ? OFFSET ?
             ''', (limit, offset))
             
-            movies = []
-            for row in self.cursor.fetchall():
-                movies.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'rating': row[2],
-                    'image': row[3],
-                    'abstract': row[4],
-                    'time': row[5],
-                    'doulist_id': row[6],
-                    'created_at': row[7]
-                })
-            return movies
+            return decode_rows(self.cursor.fetchall(), MOVIE_COLUMNS, row_format)
         except sqlite3.Error as e:
-            print(f"查询数据错误: {e}")
+            logger.error('查询数据错误: %s', e)
             return []
             
-    def search_movies(self, keyword):
-        """搜索电影"""
+    @timed(DB_QUERY_SECONDS)
+    def search_movies(self, keyword, limit=100, offset=0, row_format='dict', doulist_id=None):
+        """在标题和简介中搜索电影，按相关度排序，支持分页，可限定在某个豆列中搜索
+
+        每条结果额外带有 title_highlight（标题高亮）和 snippet（简介中命中的片段），命中部分用 <mark> 标出。
+        """
         if not self.conn:
             if not self.connect():
                 return []
                 
         try:
-            # 在标题和简介中搜索关键词
-            self.cursor.execute('''
-            SELECT id, title, rating, image, abstract, time, doulist_id, created_at
-            FROM movies
-            WHERE title LIKE ? OR abstract LIKE ?
-            ORDER BY created_at DESC
-            ''', (f'%{keyword}%', f'%{keyword}%'))
+            terms = split_search_terms(keyword)
+            if not terms:
+                return []
+            
+            scope, scope_params = doulist_scope(doulist_id, 'm.id')
+            if all(len(term) >= 3 for term in terms):
+                # 三元组全文索引：按 bm25 相关度排序，标题权重高于简介
+                self.cursor.execute(f'''
+                SELECT m.id, m.title, m.rating, m.image, m.abstract, m.time, m.doulist_id, m.created_at,
+                       highlight(movies_fts, 0, '<mark>', '</mark>'),
+                       snippet(movies_fts, 1, '<mark>', '</mark>', '…', 24)
+                FROM movies_fts
+                JOIN movies m ON m.id = movies_fts.rowid
+                WHERE movies_fts MATCH ? {scope}
+                ORDER BY bm25(movies_fts, 10.0, 1.0), m.id
+                LIMIT ? OFFSET ?
+                ''', [fts_query(terms)] + scope_params + [limit, offset])
+                rows = self.cursor.fetchall()
+            else:
+                # 少于三个字的词无法使用三元组索引，退回逐行匹配
+                where, params = like_clause(terms)
+                self.cursor.execute(f'''
+                SELECT {MOVIE_SELECT}
+                FROM movies m
+                WHERE {where} {scope}
+                ORDER BY added_at DESC, id DESC
+                LIMIT ? OFFSET ?
+                ''', params + scope_params + [limit, offset])
+                rows = [
+                    row + (highlight_terms(row[1], terms), highlight_terms(snippet_around(row[4] or '', terms), terms))
+                    for row in self.cursor.fetchall()
+                ]
             
-            movies = []
-            for row in self.cursor.fetchall():
-                movies.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'rating': row[2],
-                    'image': row[3],
-                    'abstract': row[4],
-                    'time': row[5],
-                    'doulist_id': row[6],
-                    'created_at': row[7]
-                })
-            return movies
+            return decode_rows(rows, SEARCH_COLUMNS, row_format)
         except sqlite3.Error as e:
-            print(f"搜索数据错误: {e}")
+            logger.error('搜索数据错误: %s', e)
             return []
+
+    @timed(DB_QUERY_SECONDS)
+    def count_search_results(self, keyword, doulist_id=None):
+        """统计搜索结果总数，可限定在某个豆列中"""
+        if not self.conn:
+            if not self.connect():
+                return 0
+
+        try:
+            terms = split_search_terms(keyword)
+            if not terms:
+                return 0
+
+            scope, scope_params = doulist_scope(doulist_id, 'movies_fts.rowid')
+            if all(len(term) >= 3 for term in terms):
+                self.cursor.execute(
+                    f'SELECT COUNT(*) FROM movies_fts WHERE movies_fts MATCH ? {scope}',
+                    [fts_query(terms)] + scope_params
+                )
+            else:
+                where, params = like_clause(terms)
+                scope, scope_params = doulist_scope(doulist_id, 'm.id')
+                self.cursor.execute(f'SELECT COUNT(*) FROM movies m WHERE {where} {scope}', params + scope_params)
+            return self.cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error('搜索数据错误: %s', e)
+            return 0
             
-    def count_movies(self):
-        """统计电影总数"""
+    @timed(DB_QUERY_SECONDS)
+    def count_movies(self, doulist_id=None, **filters):
+        """统计电影总数，可按豆列、年份范围和分面（见 MOVIE_FILTERS）统计
+
+        没有年份和分面筛选时读取统计表；只有一个筛选集合时直接数关联表的索引，不回表。
+        """
         if not self.conn:
             if not self.connect():
                 return 0
                 
         try:
-            self.cursor.execute('SELECT COUNT(*) FROM movies')
+            if all(value is None for value in filters.values()):
+                self.cursor.execute(
+                    'SELECT COALESCE(SUM(movie_count), 0) FROM movie_stats WHERE doulist_id = ?',
+                    (ALL_MOVIES if doulist_id is None else doulist_id,)
+                )
+                return self.cursor.fetchone()[0]
+
+            movie_filters = self._movie_filters(doulist_id, **filters)
+            if len(movie_filters) == 1:
+                count_sql, _, _, params = movie_filters[0]
+                self.cursor.execute(f'SELECT COUNT(*) FROM ({count_sql})', params)
+            else:
+                conditions, params = self._filter_conditions(doulist_id=doulist_id, **filters)
+                self.cursor.execute(f"SELECT COUNT(*) FROM movies WHERE {' AND '.join(conditions)}", params)
             return self.cursor.fetchone()[0]
         except sqlite3.Error as e:
-            print(f"统计数据错误: {e}")
+            logger.error('统计数据错误: %s', e)
             return 0
 
-    def get_sorted_movies(self, sort_by='time', order='desc', limit=100, offset=0):
-        """获取排序后的电影列表，支持分页"""
+    def _movie_filters(self, doulist_id=None, year_from=None, year_to=None, **facets):
+        """把豆列、年份范围和分面筛选整理为 [(列出集合的 SQL, 逐行探测的条件, 先取出集合的条件, 参数)]
+
+        条件中的电影表不带别名（movies）；未知的筛选参数抛出 TypeError。
+        """
+        unknown = set(facets) - set(FACETS)
+        if unknown:
+            raise TypeError(f"未知的筛选参数: {', '.join(sorted(unknown))}")
+
+        filters = []
+        if doulist_id is not None:
+            filters.append((
+                'SELECT movie_id FROM doulist_movies WHERE doulist_id = ?',
+                DOULIST_PROBE.format(column='movies.id'),
+                DOULIST_FILTER.format(column='movies.id'),
+                [doulist_id]
+            ))
+
+        bounds = [(op, year) for op, year in (('>=', year_from), ('<=', year_to)) if year is not None]
+        if bounds:
+            # 逐行探测时用 +year 让 SQLite 不走年份索引，而是沿排序索引扫描
+            filters.append((
+                f"SELECT id FROM movies WHERE {' AND '.join(f'year {op} ?' for op, _ in bounds)}",
+                ' AND '.join(f'+year {op} ?' for op, _ in bounds),
+                ' AND '.join(f'year {op} ?' for op, _ in bounds),
+                [year for _, year in bounds]
+            ))
+
+        for name, value in facets.items():
+            if value is None:
+                continue
+            dim, link, key, role = FACETS[name]
+            lookup = f'{key} = (SELECT id FROM {dim} WHERE name = ?) {role_condition(role)}'
+            filters.append((
+                f'SELECT movie_id FROM {link} WHERE {lookup}',
+                f'EXISTS (SELECT 1 FROM {link} WHERE movie_id = movies.id AND {lookup})',
+                f'movies.id IN (SELECT movie_id FROM {link} WHERE {lookup})',
+                [value]
+            ))
+        return filters
+
+    def _filter_conditions(self, rows=None, doulist_id=None, **filters):
+        """筛选条件的 SQL 条件列表和参数
+
+        给出 rows（按排序需要读取的行数）且只有一个筛选条件时，按集合大小选择执行方式：集合较大时沿排序索引扫描、
+        逐行探测，读够 rows 行即停止；集合较小时先取出集合再排序（见 _probe_threshold）。
+        多个条件同时筛选时交给 SQLite 从最小的集合出发。
+        """
+        movie_filters = self._movie_filters(doulist_id, **filters)
+        probe = False
+        if rows is not None and len(movie_filters) == 1:
+            threshold = self._probe_threshold(rows)
+            count_sql, _, _, params = movie_filters[0]
+            # 最多数到 threshold + 1 行，大集合也不必数完
+            self.cursor.execute(f'SELECT COUNT(*) FROM ({count_sql} LIMIT ?)', params + [threshold + 1])
+            probe = self.cursor.fetchone()[0] > threshold
+
+        conditions = [probe_condition if probe else filter_condition for _, probe_condition, filter_condition, _ in movie_filters]
+        params = [param for *_, filter_params in movie_filters for param in filter_params]
+        return conditions, params
+
+    def _probe_threshold(self, rows):
+        """筛选集合大于该电影数时，沿排序索引扫描并逐行探测比先取出集合再排序更快
+
+        沿排序索引扫描约需探测 rows * 总数 / 集合大小 行，先取出集合再排序约需处理集合大小行
+        （每行开销按 FILTER_SORT_COST 次探测计），两者相等时集合大小为 sqrt(rows * 总数 / FILTER_SORT_COST)。
+        """
+        self.cursor.execute('SELECT COALESCE(SUM(movie_count), 0) FROM movie_stats WHERE doulist_id = ?', (ALL_MOVIES,))
+        return math.isqrt(rows * self.cursor.fetchone()[0] // FILTER_SORT_COST)
+
+    @timed(DB_QUERY_SECONDS)
+    def get_facet_counts(self, doulist_id=None, limit=FACET_LIMIT, **filters):
+        """在当前筛选结果中统计各分面（类型、地区、导演、演员）电影数最多的 limit 个选项，以及每个年份的电影数
+
+        每个分面自身的筛选条件不参与它的计数，便于在选项之间切换；
+        没有其他筛选条件的分面直接读取分面统计表。
+        """
+        if not self.conn:
+            if not self.connect():
+                return {}
+
+        try:
+            facets = {}
+            for name, (dim, link, key, role) in FACETS.items():
+                conditions, params = self._filter_conditions(doulist_id=doulist_id, **dict(filters, **{name: None}))
+                if conditions:
+                    # 从筛选结果出发，逐部电影查关联表
+                    self.cursor.execute(f'''
+                    SELECT d.name, COUNT(*)
+                    FROM (SELECT id FROM movies WHERE {' AND '.join(conditions)}) f
+                    JOIN {link} l ON l.movie_id = f.id {role_condition(role, 'l.role')}
+                    JOIN {dim} d ON d.id = l.{key}
+                    GROUP BY l.{key}
+                    ORDER BY 2 DESC, d.name
+                    LIMIT ?
+                    ''', params + [limit])
+                else:
+                    self.cursor.execute(f'''
+                    SELECT d.name, s.movie_count
+                    FROM facet_stats s
+                    JOIN {dim} d ON d.id = s.value_id
+                    WHERE s.facet = ? AND s.movie_count > 0
+                    ORDER BY 2 DESC, d.name
+                    LIMIT ?
+                    ''', (name, limit))
+                facets[name] = [{'name': value, 'count': count} for value, count in self.cursor.fetchall()]
+
+            conditions, params = self._filter_conditions(doulist_id=doulist_id, **dict(filters, year_from=None, year_to=None))
+            if conditions:
+                self.cursor.execute(f'''
+                SELECT year, COUNT(*)
+                FROM movies
+                WHERE year IS NOT NULL AND {' AND '.join(conditions)}
+                GROUP BY year
+                ORDER BY year DESC
+                ''', params)
+            else:
+                self.cursor.execute('''
+                SELECT value_id, movie_count
+                FROM facet_stats
+                WHERE facet = 'year' AND movie_count > 0
+                ORDER BY value_id DESC
+                ''')
+            facets['year'] = [{'year': year, 'count': count} for year, count in self.cursor.fetchall()]
+            return facets
+        except sqlite3.Error as e:
+            logger.error('统计分面错误: %s', e)
+            return {}
+
+    @timed(DB_QUERY_SECONDS)
+    def get_sorted_movies(self, sort_by='time', order='desc', limit=100, offset=0, row_format='dict', doulist_id=None,
+                          columns=MOVIE_COLUMNS, **filters):
+        """获取排序后的电影列表，支持分页，可按豆列、年份范围和分面筛选（见 MOVIE_FILTERS）；
+        row_format 可选 dict、record 或 tuple（见 row_decoder），columns 为只查询的列（MOVIE_COLUMNS 的子集，见 project_columns）
+        """
         if not self.conn:
             if not self.connect():
                 return []
             
         try:
             # 验证排序字段
-            if sort_by not in ['time', 'rating', 'title']:
+            if sort_by not in SORT_KEYS:
                 sort_by = 'time'
             
             # 验证排序方向
             if order not in ['asc', 'desc']:
                 order = 'desc'
             
-            # 特殊处理评分排序（需要转换为数值）
-            if sort_by == 'rating':
-                # 使用CAST将评分转换为数值进行排序
-                self.cursor.execute(f'''
-                SELECT id, title, rating, image, abstract, time, doulist_id, created_at
-                FROM movies
-                ORDER BY CAST(rating AS REAL) {order}, time DESC
-                LIMIT ? OFFSET ?
-                ''', (limit, offset))
-            else:
-                # 其他字段正常排序
-                self.cursor.execute(f'''
-                SELECT id, title, rating, image, abstract, time, doulist_id, created_at
-                FROM movies
-                ORDER BY {sort_by} {order}
-                LIMIT ? OFFSET ?
-                ''', (limit, offset))
+            # 数值评分与时间戳列都有对应的复合索引，排序无需全表扫描
+            key = SORT_KEYS[sort_by]
+            conditions, params = self._filter_conditions(limit + offset, doulist_id, **filters)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            self.cursor.execute(f'''
+            SELECT {', '.join(columns)}
+            FROM movies
+            {where}
+            ORDER BY {key} {order}, id {order}
+            LIMIT ? OFFSET ?
+            ''', params + [limit, offset])
             
-            movies = []
-            for row in self.cursor.fetchall():
-                movies.append({
-                    'id': row[0],
-                    'title': row[1],
-                    'rating': row[2],
-                    'image': row[3],
-                    'abstract': row[4],
-                    'time': row[5],
-                    'doulist_id': row[6],
-                    'created_at': row[7]
-                })
-            return movies
+            return decode_rows(self.cursor.fetchall(), columns, row_format)
+        except sqlite3.Error as e:
+            logger.error('查询数据错误: %s', e)
+            return []
+
+    @timed(DB_QUERY_SECONDS)
+    def get_sorted_movies_after(self, sort_by='time', order='desc', after_key=None, after_id=None, limit=100, row_format='dict',
+                                doulist_id=None, columns=MOVIE_COLUMNS, **filters):
+        """游标分页：从 (after_key, after_id) 之后开始读取，借助复合索引直接定位而不是跳过前面的行；筛选条件和 columns 同 get_sorted_movies"""
+        if not self.conn:
+            if not self.connect():
+                return []
+
+        try:
+            # 验证排序字段
+            if sort_by not in SORT_KEYS:
+                sort_by = 'time'
+
+            # 验证排序方向
+            if order not in ['asc', 'desc']:
+                order = 'desc'
+
+            key = SORT_KEYS[sort_by]
+
+            # 没有游标时就是第一页，直接按索引顺序读取
+            conditions = []
+            params = []
+            if after_id is not None:
+                op = '<' if order == 'desc' else '>'
+                # 额外的单列条件保证 SQLite 用索引直接定位到起点
+                conditions.append(f'{key} {op}= ? AND ({key}, id) {op} (?, ?)')
+                params = [after_key, after_key, after_id]
+            filter_conditions, filter_params = self._filter_conditions(limit, doulist_id, **filters)
+            conditions += filter_conditions
+            params += filter_params
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+            self.cursor.execute(f'''
+            SELECT {', '.join(columns)}
+            FROM movies
+            {where}
+            ORDER BY {key} {order}, id {order}
+            LIMIT ?
+            ''', params + [limit])
+
+            return decode_rows(self.cursor.fetchall(), columns, row_format)
         except sqlite3.Error as e:
-            print(f"查询数据错误: {e}")
+            logger.error('查询数据错误: %s', e)
             return []
 
-    def get_all_movie_ids(self):
-        """获取所有电影ID列表"""
+    def iter_rows(self, sql, params=(), columns=MOVIE_COLUMNS, row_format='tuple', batch_size=FETCH_BATCH_SIZE):
+        """执行查询并以生成器逐行产出结果，每次用 fetchmany 读取一批
+
+        使用独立的游标，迭代期间同一连接上的其他查询不受影响；
+        连接池中的连接要在迭代结束后再 close()。
+        查询出错时记录日志后抛出 sqlite3.Error：导出等流式响应会因此中断，而不是发出被截断的完整响应。
+        """
+        if not self.conn:
+            if not self.connect():
+                return
+
+        decoder = row_decoder(columns, row_format)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if decoder is None:
+                    yield from rows
+                else:
+                    yield from map(decoder, rows)
+        except sqlite3.Error as e:
+            logger.error('查询数据错误: %s', e)
+            raise
+        finally:
+            cursor.close()
+
+    def iter_movies(self, doulist_id=None, sort_by='time', order='desc', row_format='record', batch_size=FETCH_BATCH_SIZE, **filters):
+        """按排序方式逐批产出全部电影（可按豆列、年份范围和分面筛选），用于导出等大结果集，内存占用与总行数无关"""
+        if sort_by not in SORT_KEYS:
+            sort_by = 'time'
+        if order not in ['asc', 'desc']:
+            order = 'desc'
+
+        key = SORT_KEYS[sort_by]
+        # 导出全部结果，不需要按集合大小选择执行方式，也就不必先连接数据库
+        conditions, params = self._filter_conditions(None, doulist_id, **filters)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return self.iter_rows(f'''
+        SELECT {MOVIE_SELECT}
+        FROM movies
+        {where}
+        ORDER BY {key} {order}, id {order}
+        ''', params, MOVIE_COLUMNS, row_format, batch_size)
+
+    @timed(DB_QUERY_SECONDS)
+    def get_all_movie_ids(self, doulist_id=None, min_rating=None):
+        """获取电影ID列表，可按豆列和最低评分筛选"""
         if not self.conn:
             if not self.connect():
                 return []
             
         try:
-            self.cursor.execute('SELECT id FROM movies')
+            if doulist_id is not None:
+                # 豆列的电影 ID 直接从关联表的覆盖索引读取，有评分条件时再回表
+                if min_rating is None:
+                    self.cursor.execute('SELECT movie_id FROM doulist_movies WHERE doulist_id = ?', (doulist_id,))
+                else:
+                    self.cursor.execute('''
+                    SELECT dm.movie_id
+                    FROM doulist_movies dm
+                    JOIN movies m ON m.id = dm.movie_id
+                    WHERE dm.doulist_id = ? AND m.rating_num >= ?
+                    ''', (doulist_id, min_rating))
+                return [row[0] for row in self.cursor.fetchall()]
+
+            where = ''
+            params = []
+            if min_rating is not None:
+                where = 'WHERE rating_num >= ?'
+                params.append(min_rating)
+            
+            self.cursor.execute(f'SELECT id FROM movies {where}', params)
             return [row[0] for row in self.cursor.fetchall()]
         except sqlite3.Error as e:
-            print(f"获取电影ID错误: {e}")
+            logger.error('获取电影ID错误: %s', e)
             return []
 
+    @timed(DB_QUERY_SECONDS)
+    def get_subject_ids(self, doulist_id):
+        """获取指定豆列中已保存的豆瓣条目 ID 集合"""
+        if not self.conn:
+            if not self.connect():
+                return set()
+
+        try:
+            self.cursor.execute('''
+            SELECT m.subject_id
+            FROM doulist_movies dm
+            JOIN movies m ON m.id = dm.movie_id
+            WHERE dm.doulist_id = ? AND m.subject_id IS NOT NULL
+            ''', (doulist_id,))
+            return {row[0] for row in self.cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error('查询数据错误: %s', e)
+            return set()
+
+    @timed(DB_QUERY_SECONDS)
+    def delete_missing_movies(self, doulist_id, subject_ids):
+        """把不在 subject_ids 里的电影移出豆列（已从豆列移除的电影），返回移出条数
+
+        只影响这一个豆列的关联，不再属于任何豆列的电影才会被删除。
+        """
+        if not self.conn:
+            if not self.connect():
+                return 0
+
+        try:
+            if not self.conn.in_transaction:
+                self.cursor.execute('BEGIN IMMEDIATE')
+            self.cursor.execute('CREATE TEMP TABLE IF NOT EXISTS seen_subjects (subject_id TEXT PRIMARY KEY)')
+            self.cursor.execute('DELETE FROM seen_subjects')
+            self.cursor.executemany(
+                'INSERT OR IGNORE INTO seen_subjects (subject_id) VALUES (?)',
+                [(subject_id,) for subject_id in subject_ids]
+            )
+            self.cursor.execute('CREATE TEMP TABLE IF NOT EXISTS removed_movies (movie_id INTEGER PRIMARY KEY)')
+            self.cursor.execute('DELETE FROM removed_movies')
+            self.cursor.execute('''
+            INSERT INTO removed_movies (movie_id)
+            SELECT dm.movie_id
+            FROM doulist_movies dm
+            JOIN movies m ON m.id = dm.movie_id
+            WHERE dm.doulist_id = ?
+              AND (m.subject_id IS NULL OR m.subject_id NOT IN (SELECT subject_id FROM seen_subjects))
+            ''', (doulist_id,))
+            self.cursor.execute('''
+            DELETE FROM doulist_movies
+            WHERE doulist_id = ? AND movie_id IN (SELECT movie_id FROM removed_movies)
+            ''', (doulist_id,))
+            deleted = self.cursor.rowcount
+            # 清理不再属于任何豆列的电影
+            self.cursor.execute('''
+            DELETE FROM movies
+            WHERE id IN (SELECT movie_id FROM removed_movies)
+              AND NOT EXISTS (SELECT 1 FROM doulist_movies WHERE movie_id = movies.id)
+            ''')
+            self.conn.commit()
+            return deleted
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error('删除数据错误: %s', e)
+            return 0
+
+    @timed(DB_QUERY_SECONDS)
+    def backfill_metadata(self, batch_size=FETCH_BATCH_SIZE):
+        """重新解析已有电影的简介，更新年份以及人物、类型、地区关联；每批一个事务，返回处理的电影数"""
+        if not self.conn:
+            if not self.connect():
+                return 0
+
+        processed = 0
+        last_id = 0
+        try:
+            while True:
+                self.cursor.execute(
+                    'SELECT id, abstract, year FROM movies WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, batch_size)
+                )
+                batch = self.cursor.fetchall()
+                if not batch:
+                    break
+
+                updates = []
+                for movie_id, abstract, year in batch:
+                    parsed_year = parse_abstract(abstract)['year']
+                    if parsed_year != year:
+                        updates.append((parsed_year, movie_id))
+
+                if not self.conn.in_transaction:
+                    self.cursor.execute('BEGIN IMMEDIATE')
+                self.cursor.executemany('UPDATE movies SET year = ? WHERE id = ?', updates)
+                self._write_metadata([(movie_id, abstract) for movie_id, abstract, _ in batch])
+                # 关联表的变化不经过 movies 表的触发器，手动让响应缓存失效
+                self.cursor.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+                self.conn.commit()
+
+                processed += len(batch)
+                last_id = batch[-1][0]
+            return processed
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error('回填简介字段错误: %s', e)
+            return processed
+
 # 简单测试代码
 if __name__ == "__main__":
     # 创建数据库实例
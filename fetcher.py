@@ -0,0 +1,134 @@
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+# 爬虫各阶段耗时：fetch 下载一个页面（含重试），parse 解析一页，insert 写入一页
+CRAWL_SECONDS = histogram('doulie_crawl_seconds', '爬虫各阶段耗时（秒）', ('stage',))
+
+# 默认请求头，模拟浏览器请求
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+}
+
+# 下载豆瓣图片时使用的请求头（图片服务器会检查 Referer）
+IMAGE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://movie.douban.com/',
+    'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+}
+
+# 需要退避重试的状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class RateLimiter:
+    """线程安全的令牌桶限速器：平均每秒 rate 个请求，最多允许 burst 个突发请求"""
+    def __init__(self, rate=0.5, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class PageFetcher:
+    """并发页面下载器：共享 keep-alive 会话，令牌桶限速，429/5xx 时指数退避重试"""
+    def __init__(self, rate=0.5, burst=1, max_workers=4, max_retries=3, backoff=1.0, timeout=10, headers=None):
+        self.limiter = RateLimiter(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # 所有线程共用一个会话，复用 TCP/TLS 连接
+        self.session = requests.Session()
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def fetch(self, url):
+        """下载一个页面并返回文本，重试用尽后抛出异常"""
+        with CRAWL_SECONDS.time('fetch'):
+            response = self._get(url)
+        response.encoding = 'utf-8'
+        return response.text
+
+    def fetch_content(self, url):
+        """下载一个文件（如图片）并返回字节内容，重试用尽后抛出异常"""
+        return self._get(url).content
+
+    def _get(self, url):
+        """带限速和退避重试的 GET 请求"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+
+            if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                self._sleep_before_retry(attempt, response.headers.get('Retry-After'))
+                continue
+
+            response.raise_for_status()
+            return response
+
+    def fetch_all(self, urls, content=False, window=None):
+        """并发下载多个地址，按 urls 的顺序逐个产出页面文本（content=True 时为字节内容）
+
+        window 为同时提交的下载数（None 表示一次全部提交）：消费者每取走一页，才补充提交下一个地址；
+        生成器被关闭（消费者提前停止）或下载出错时，取消尚未开始的下载。
+        """
+        func = self.fetch_content if content else self.fetch
+        urls = iter(urls)
+        pending = deque(self.executor.submit(func, url) for url in itertools.islice(urls, window))
+        try:
+            while pending:
+                yield pending.popleft().result()
+                pending.extend(self.executor.submit(func, url) for url in itertools.islice(urls, 1))
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        """关闭线程池和会话"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        """等待重试：优先遵循 Retry-After，否则指数退避并加入随机抖动"""
+        if retry_after and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            delay = self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+        logger.warning('请求失败，%.1f 秒后重试 (第 %d 次)', delay, attempt + 1)
+        time.sleep(delay)
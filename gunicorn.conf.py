@@ -0,0 +1,30 @@
+import multiprocessing
+import os
+
+# 生产环境启动：gunicorn -c gunicorn.conf.py wsgi:app
+# 以下配置均可用环境变量覆盖
+
+# 监听地址
+bind = os.environ.get('DOULIE_BIND', '0.0.0.0:8080')
+
+# 工作进程数（默认每个 CPU 核一个）和每个进程的线程数；线程数不要超过 app.py 中的 READ_POOL_SIZE
+workers = int(os.environ.get('DOULIE_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('DOULIE_THREADS', 4))
+worker_class = 'gthread'
+
+# 在主进程中导入应用（只执行一次表结构迁移），再 fork 出工作进程；
+# 数据库连接池和图片缓存索引在子进程中首次使用时重新打开，不会共用父进程的连接
+preload_app = True
+
+# 请求超时、收到 SIGTERM 后等待进行中请求完成的时间，以及 keep-alive 时长（秒）
+timeout = int(os.environ.get('DOULIE_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('DOULIE_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = os.environ.get('DOULIE_ACCESS_LOG')
+errorlog = '-'
+
+def worker_exit(server, worker):
+    """工作进程退出前关闭数据库连接和图片缓存索引"""
+    from wsgi import shutdown
+    shutdown()
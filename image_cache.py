@@ -0,0 +1,197 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# 流式传输时每块的大小
+CHUNK_SIZE = 64 * 1024
+
+class CacheEntry:
+    """一条已缓存图片的元数据"""
+    def __init__(self, url, digest, path, size, content_type, etag, last_modified, checked_at, ttl):
+        self.url = url
+        self.digest = digest
+        self.path = path
+        self.size = size
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = checked_at
+        self.ttl = ttl
+
+    @property
+    def fresh(self):
+        """是否仍在有效期内，过期后需要向源站重新验证"""
+        return time.time() - self.checked_at < self.ttl
+
+    def conditional_headers(self):
+        """向源站重新验证时使用的条件请求头"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class ImageCache:
+    """按内容哈希存储的图片磁盘缓存，总大小超过上限时按最近最少使用淘汰
+
+    图片文件以内容的 SHA-256 命名，不同地址的同一张图片（如豆瓣的 img1/img9 镜像）只存一份；
+    地址到文件的映射、源站的 ETag/Last-Modified 和访问时间记录在缓存目录下的 index.db 中。
+    """
+    _fork_lock = threading.Lock()
+
+    def __init__(self, cache_dir='image_cache', max_bytes=512 * 1024 * 1024, ttl=7 * 24 * 3600):
+        # 使用绝对路径，send_file 不会相对应用目录解析
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._open()
+
+    def _open(self):
+        """打开索引数据库（每个进程各自打开一次）"""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(self.cache_dir, 'index.db'), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+        ''')
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS urls (
+            url TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            content_type TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            checked_at REAL NOT NULL
+        )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_blobs_accessed ON blobs (accessed_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_urls_digest ON urls (digest)')
+
+    def _check_fork(self):
+        """fork 出的子进程不能使用父进程打开的连接，重新打开索引数据库"""
+        if self._pid != os.getpid():
+            with self._fork_lock:
+                if self._pid != os.getpid():
+                    # 保留父进程连接的引用，避免在子进程中被回收关闭
+                    self._inherited = self._conn
+                    self._open()
+
+    def close(self):
+        """关闭索引数据库（fork 后尚未重新打开时，连接属于父进程，不做处理）"""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._conn.close()
+
+    def blob_path(self, digest):
+        """内容哈希对应的文件路径（按前两位分目录）"""
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def get(self, url):
+        """查找地址对应的缓存，命中时刷新访问时间；文件丢失时视为未命中"""
+        self._check_fork()
+        with self._lock:
+            row = self._conn.execute('''
+            SELECT u.digest, b.size, u.content_type, u.etag, u.last_modified, u.checked_at
+            FROM urls u JOIN blobs b ON b.digest = u.digest
+            WHERE u.url = ?
+            ''', (url,)).fetchone()
+            if not row:
+                return None
+
+            digest, size, content_type, etag, last_modified, checked_at = row
+            path = self.blob_path(digest)
+            if not os.path.exists(path):
+                self._delete_blob(digest)
+                return None
+
+            self._conn.execute('UPDATE blobs SET accessed_at = ? WHERE digest = ?', (time.time(), digest))
+            return CacheEntry(url, digest, path, size, content_type, etag, last_modified, checked_at, self.ttl)
+
+    def mark_validated(self, entry, etag=None, last_modified=None):
+        """源站返回 304 后更新验证时间（以及源站给出的新校验值）"""
+        self._check_fork()
+        with self._lock:
+            self._conn.execute('''
+            UPDATE urls SET checked_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+            WHERE url = ?
+            ''', (time.time(), etag, last_modified, entry.url))
+
+    def stream_and_store(self, url, response):
+        """把源站响应按块转发给客户端，同时写入临时文件；完整读完后再放入缓存
+
+        客户端中途断开或源站出错时丢弃临时文件，不会留下不完整的缓存。
+        """
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    tmp.write(chunk)
+                    hasher.update(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            response.close()
+            if completed:
+                self._store(url, tmp_path, hasher.hexdigest(), response.headers)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _store(self, url, tmp_path, digest, headers):
+        """把下载完成的临时文件放入缓存并登记，然后按需淘汰"""
+        self._check_fork()
+        path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(tmp_path)
+        # 同名文件内容必然相同，直接原子替换
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('''
+            INSERT INTO blobs (digest, size, accessed_at) VALUES (?, ?, ?)
+            ON CONFLICT (digest) DO UPDATE SET accessed_at = excluded.accessed_at
+            ''', (digest, size, now))
+            self._conn.execute('''
+            INSERT OR REPLACE INTO urls (url, digest, content_type, etag, last_modified, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (url, digest, headers.get('content-type', 'image/jpeg'), headers.get('ETag'), headers.get('Last-Modified'), now))
+            self._conn.execute('COMMIT')
+            self._evict()
+
+    def _evict(self):
+        """总大小超过上限时，从最久未访问的文件开始删除（调用方需持有锁）"""
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for digest, size in self._conn.execute('SELECT digest, size FROM blobs ORDER BY accessed_at').fetchall():
+            if total <= self.max_bytes:
+                break
+            self._delete_blob(digest)
+            total -= size
+
+    def _delete_blob(self, digest):
+        """删除一个缓存文件及指向它的所有地址（调用方需持有锁）"""
+        self._conn.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+        self._conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+        try:
+            os.remove(self.blob_path(digest))
+        except FileNotFoundError:
+            pass
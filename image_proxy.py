@@ -0,0 +1,59 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+class UpstreamBusy(Exception):
+    """等待访问源站的并发名额超时"""
+
+class ImageProxy:
+    """访问图片源站的客户端：共享 keep-alive 连接池，连接/读取分别超时，限制同时进行的下载数
+
+    同一地址同时只允许一个请求（领头者）访问源站，其余请求等待领头者把图片写入缓存后直接读取缓存。
+    """
+    def __init__(self, headers, max_connections=32, max_concurrency=16, connect_timeout=3, read_timeout=10, wait_timeout=15):
+        self.timeout = (connect_timeout, read_timeout)
+        self.wait_timeout = wait_timeout
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._inflight = {}  # 地址 -> 领头者完成时触发的事件
+        self._lock = threading.Lock()
+
+    def begin(self, url):
+        """登记为该地址的领头者并返回 True；已有领头者时等待其完成（最多 wait_timeout 秒）后返回 False"""
+        with self._lock:
+            event = self._inflight.get(url)
+            if event is None:
+                self._inflight[url] = threading.Event()
+                return True
+        event.wait(self.wait_timeout)
+        return False
+
+    def get(self, url, headers=None):
+        """占用一个并发名额后以流式方式请求源站；名额等待超时抛出 UpstreamBusy"""
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise UpstreamBusy('图片下载并发数已满')
+        try:
+            return self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def finish(self, url, response=None):
+        """领头者结束：关闭源站响应、归还并发名额（传入 response 时），并唤醒等待同一地址的请求"""
+        if response is not None:
+            response.close()
+            self._slots.release()
+        with self._lock:
+            event = self._inflight.pop(url, None)
+        if event is not None:
+            event.set()
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
@@ -0,0 +1,51 @@
+import json
+import os
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def stdlib_dumps(obj, default):
+    """标准库 json 编码：紧凑格式，中文不转义"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=default).encode('utf-8')
+
+def orjson_dumps(obj, default):
+    """orjson 编码（C 实现，直接输出 UTF-8 字节）；日期交给 default 处理，与 Flask 默认格式一致"""
+    return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+# 可选的 JSON 编码后端：名称 -> 编码函数(对象, default) -> bytes
+JSON_ENCODERS = {'stdlib': stdlib_dumps}
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = orjson_dumps
+
+# 设置环境变量 DOULIE_JSON 选择编码后端，默认在安装了 orjson 时使用 orjson
+JSON_BACKEND = os.environ.get('DOULIE_JSON', 'orjson' if orjson is not None else 'stdlib')
+
+class FastJSONProvider(DefaultJSONProvider):
+    """用 JSON_ENCODERS 中的后端编码接口响应，jsonify 和响应缓存都经过这里
+
+    输出紧凑、不转义中文、不排序键；带额外参数调用 dumps 时退回 Flask 默认实现。
+    """
+    def __init__(self, app, backend=JSON_BACKEND):
+        super().__init__(app)
+        if backend not in JSON_ENCODERS:
+            raise ValueError(f'不支持的 JSON 编码后端: {backend}（可选 {", ".join(JSON_ENCODERS)}）')
+        self.backend = backend
+        self._encode = JSON_ENCODERS[backend]
+
+    def dumps_bytes(self, obj):
+        """编码为 UTF-8 字节"""
+        return self._encode(obj, self.default)
+
+    def dumps(self, obj, **kwargs):
+        """编码为字符串"""
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        """jsonify 使用的响应构造，直接以字节作为响应体"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
@@ -1,7 +1,48 @@
-import requests
-from bs4 import BeautifulSoup
+import html as html_lib
+import logging
+import re
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
 from database import MovieDatabase
+from fetcher import PageFetcher, CRAWL_SECONDS
+from snapshot import snapshot_lock, stage_snapshot, finish_snapshot, validate_snapshot, publish_snapshot, discard_snapshot
+from thumbnails import generate_thumbnails
+from similarity import build_index
+
+logger = logging.getLogger(__name__)
+
+# 快速解析优先使用 lxml，未安装时退回标准库解析器
+try:
+    import lxml  # noqa: F401
+    FAST_TREE_BUILDER = 'lxml'
+except ImportError:
+    FAST_TREE_BUILDER = 'html.parser'
+
+# 快速解析只构建电影条目和分页器两类子树，页面其余部分直接跳过
+PAGE_STRAINER = SoupStrainer('div', class_=['doulist-item', 'paginator'])
+
+# 从条目链接中提取豆瓣条目 ID，例如 https://movie.douban.com/subject/1292052/
+SUBJECT_ID_PATTERN = re.compile(r'/subject/(\d+)')
+
+# 豆列页面的 <title>，即豆列名称（快速解析只保留条目子树，因此直接从页面文本中提取）
+TITLE_PATTERN = re.compile(r'<title>\s*(.*?)\s*</title>', re.S)
+
+# 同时刷新的豆列数（各豆列共享下载器的限速，页面下载总并发不变）
+MAX_CONCURRENT_DOULISTS = 4
+
+# 豆列页面地址前缀（测试时可替换为本地服务器地址）
+DOULIST_BASE_URL = 'https://www.douban.com/doulist/'
+
+# 豆列每页条目数
+PAGE_SIZE = 25
+
+# 后端读取的数据库文件
+DB_FILE = 'movies.db'
+
+# 增量刷新时同时下载的页面数（1 表示处理完一页才下载下一页）
+INCREMENTAL_PAGE_WINDOW = 1
 
 def parse_movie_item(item):
     """解析单个电影条目的详细信息"""
@@ -12,6 +53,11 @@ def parse_movie_item(item):
         title_div = item.find('div', class_='title')
         if title_div and title_div.a:
             movie_info['title'] = title_div.a.text.strip()
+            
+            # 条目链接中的豆瓣 ID 作为自然键
+            match = SUBJECT_ID_PATTERN.search(title_div.a.get('href', ''))
+            if match:
+                movie_info['subject_id'] = match.group(1)
         
         # 获取评分 (直接查找 rating_nums class)
         rating = item.find('span', class_='rating_nums')
@@ -28,80 +74,326 @@ def parse_movie_item(item):
         if abstract:
             movie_info['abstract'] = abstract.get_text(strip=True, separator='\n')
         
-        # 获取时间 (在 actions div 下的 time 标签)
-        time_tag = item.find('div', class_='actions').find('time', class_='time')
+        # 获取时间 (在 actions div 下的 time 标签，条目可能没有 actions div)
+        actions = item.find('div', class_='actions')
+        time_tag = actions.find('time', class_='time') if actions else None
         if time_tag:
             movie_info['time'] = time_tag.text.strip()
 
         return movie_info
         
     except Exception as e:
-        print(f'解析电影信息时发生错误: {e}')
+        logger.warning('解析电影信息时发生错误: %s', e)
         return None
 
-def fetch_doulist_movies(doulist_id, max_pages=10):
-    """获取豆列中的所有电影信息并存储到数据库"""
-    # 初始化数据库
-    db = MovieDatabase()
+def extract_movie_fields(item):
+    """单次遍历条目子树提取全部字段，结果与 parse_movie_item 相同"""
+    movie_info = {}
+    
+    try:
+        # 一次遍历记下每类目标标签第一次出现的位置
+        title_div = rating = post_div = abstract = actions = None
+        for tag in item.find_all(True):
+            classes = tag.get('class') or ()
+            if tag.name == 'div':
+                if title_div is None and 'title' in classes:
+                    title_div = tag
+                if post_div is None and 'post' in classes:
+                    post_div = tag
+                if abstract is None and 'abstract' in classes:
+                    abstract = tag
+                if actions is None and 'actions' in classes:
+                    actions = tag
+            elif tag.name == 'span' and rating is None and 'rating_nums' in classes:
+                rating = tag
+        
+        if title_div and title_div.a:
+            movie_info['title'] = title_div.a.text.strip()
+            match = SUBJECT_ID_PATTERN.search(title_div.a.get('href', ''))
+            if match:
+                movie_info['subject_id'] = match.group(1)
+        
+        if rating:
+            movie_info['rating'] = rating.text.strip()
+        
+        if post_div and post_div.img:
+            movie_info['image'] = post_div.img['src']
+        
+        if abstract:
+            movie_info['abstract'] = abstract.get_text(strip=True, separator='\n')
+        
+        time_tag = actions.find('time', class_='time') if actions else None
+        if time_tag:
+            movie_info['time'] = time_tag.text.strip()
+        
+        return movie_info
     
-    # 重建表（先删除再创建）
-    db.drop_table()
-    db.create_table()
+    except Exception as e:
+        logger.warning('解析电影信息时发生错误: %s', e)
+        return None
+
+def parse_page_bs4(html):
+    """完整解析整个页面后逐条目查找字段，返回 (条目解析结果列表, 总页数)"""
+    soup = BeautifulSoup(html, 'html.parser')
+    items = soup.find_all('div', class_='doulist-item')
+    return [parse_movie_item(item) for item in items], parse_total_pages(soup)
+
+def parse_page_fast(html):
+    """只构建条目和分页器子树，并单次遍历提取字段，返回 (条目解析结果列表, 总页数)"""
+    soup = BeautifulSoup(html, FAST_TREE_BUILDER, parse_only=PAGE_STRAINER)
+    items = soup.find_all('div', class_='doulist-item')
+    return [extract_movie_fields(item) for item in items], parse_total_pages(soup)
+
+# 可选的页面解析后端
+PARSER_BACKENDS = {
+    'bs4': parse_page_bs4,
+    'fast': parse_page_fast,
+}
+
+def build_page_url(doulist_id, page, base_url=DOULIST_BASE_URL):
+    """构建豆列第 page 页（从 0 开始）的地址"""
+    return f'{base_url}{doulist_id}/?start={page * PAGE_SIZE}&sort=time&playable=0&sub_type='
+
+def parse_doulist_title(html):
+    """从豆列页面中提取豆列名称，没有时返回 None"""
+    match = TITLE_PATTERN.search(html)
+    if not match:
+        return None
+    return html_lib.unescape(match.group(1)) or None
+
+def parse_total_pages(soup):
+    """从页面分页器中读取总页数，没有分页器时视为只有一页"""
+    paginator = soup.find('div', class_='paginator')
+    if not paginator:
+        return 1
     
-    # 设置请求头
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-    }
+    this_page = paginator.find('span', class_='thispage')
+    if this_page and this_page.get('data-total-page', '').isdigit():
+        return int(this_page['data-total-page'])
     
-    base_url = f'https://www.douban.com/doulist/{doulist_id}/'
+    # 没有 data-total-page 属性时，取分页链接和当前页中最大的页码（在最后一页时当前页就是总页数）
+    tags = paginator.find_all('a') + ([this_page] if this_page else [])
+    pages = [int(tag.text) for tag in tags if tag.text.strip().isdigit()]
+    return max(pages + [1])
+
+def record_stage(timings, stage, start):
+    """记录爬虫某一阶段从 start 开始的耗时，同时计入指标和本次爬取的汇总"""
+    elapsed = time.perf_counter() - start
+    CRAWL_SECONDS.observe(elapsed, stage)
+    timings[stage] = timings.get(stage, 0) + elapsed
+
+def fetch_doulist_movies(doulist_id, max_pages=10, incremental=True, fetcher=None, base_url=DOULIST_BASE_URL, parser='fast',
+                         db_file=DB_FILE, staging=False):
+    """获取豆列中的电影信息并写入数据库（按豆瓣条目 ID upsert，不清空旧数据）
+
+    先下载第一页并从分页器得到总页数，其余页面交给 fetcher 并发下载、按页序写入。
+    parser 为 PARSER_BACKENDS 中的解析后端名称。
+    incremental=True 时，豆列按时间倒序排列，遇到已保存的条目后处理完当前页即停止；
+    否则爬取全部页面，并删除已从豆列中移除的电影。
+    staging=True 表示 db_file 是 fetch_many_doulists 准备好的暂存快照，以批量写入设置写入，不再建表。
+    """
+    db = MovieDatabase(db_file, bulk=staging)
+    if not staging:
+        # 初始化数据库（建表或迁移旧表，已有数据保留，接口读取不受影响）
+        db.create_table()
+    
+    known_ids = db.get_subject_ids(doulist_id) if incremental else set()
+    seen_ids = set()
+    reached_end = False
+    title = total_pages = error = pages = None
+    
+    # 记录本次爬取开始，结束时写入结果（成功与否都保留在 doulists 表中）
+    db.start_crawl(doulist_id, f'{base_url}{doulist_id}/')
+    
+    # 未传入下载器时自行创建，用完关闭
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = PageFetcher()
+    
+    parse_page = PARSER_BACKENDS[parser]
     total_movies = 0
+    timings = {}
+    crawl_start = time.perf_counter()
     
     try:
-        for page in range(max_pages):
-            # 构建当前页面的URL
-            url = f'{base_url}?start={page * 25}&sort=time&playable=0&sub_type='
-            print(f'正在获取第 {page + 1} 页...')
-            
-            # 添加延时避免请求过快
-            time.sleep(2)
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            response.encoding = 'utf-8'
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            items = soup.find_all('div', class_='doulist-item')
-            
+        logger.info('正在获取豆列 %s 第 1 页...', doulist_id)
+        html = fetcher.fetch(build_page_url(doulist_id, 0, base_url))
+        start = time.perf_counter()
+        first_items, discovered_pages = parse_page(html)
+        title = parse_doulist_title(html)
+        record_stage(timings, 'parse', start)
+        total_pages = min(discovered_pages, max_pages)
+        logger.info('豆列 %s 共 %d 页，本次最多获取 %d 页', doulist_id, discovered_pages, total_pages)
+        
+        # 增量刷新通常在前一两页就追上上次的位置，逐页下载，不预先提交后面的页面；
+        # 全量爬取或第一次爬取（没有已保存的条目）时一次提交全部页面并发下载
+        window = INCREMENTAL_PAGE_WINDOW if known_ids else None
+        
+        def iter_pages():
+            """按页序产出各页条目的解析结果，第一页之后的页面在首次需要时才开始下载"""
+            yield 0, first_items
+            urls = [build_page_url(doulist_id, page, base_url) for page in range(1, total_pages)]
+            downloads = fetcher.fetch_all(urls, window=window)
+            try:
+                for page, html in enumerate(downloads, start=1):
+                    start = time.perf_counter()
+                    items = parse_page(html)[0]
+                    record_stage(timings, 'parse', start)
+                    yield page, items
+            finally:
+                # 提前停止翻页时取消尚未开始的下载
+                downloads.close()
+        
+        pages = iter_pages()
+        for page, items in pages:
             # 如果没有找到电影条目，说明已经到达最后一页
             if not items:
-                print('没有更多电影了')
+                logger.info('没有更多电影了')
+                reached_end = True
                 break
             
-            # 处理当前页面的每个电影条目
-            for item in items:
-                movie_info = parse_movie_item(item)
+            # 收集当前页面解析成功的电影条目，整页缓冲后批量写入
+            reached_known = False
+            page_movies = []
+            for movie_info in items:
                 if movie_info:
-                    # 将电影信息存入数据库
-                    movie_id = db.insert_movie(movie_info, doulist_id)
-                    if movie_id:
-                        total_movies += 1
-                        print(f"已保存: {movie_info.get('title')} (ID: {movie_id})")
+                    subject_id = movie_info.get('subject_id')
+                    if not subject_id:
+                        # 没有条目链接的条目无法按条目 ID upsert，写入的话每次爬取都会重复插入一行，跳过
+                        logger.warning('豆列 %s 的条目 %s 没有豆瓣条目链接，已跳过', doulist_id, movie_info.get('title'))
+                        continue
+                    seen_ids.add(subject_id)
+                    if subject_id in known_ids:
+                        reached_known = True
+                    page_movies.append(movie_info)
+            
+            # 一页一个事务写入数据库（已存在则更新评分、简介等），单条失败不影响其他条目
+            start = time.perf_counter()
+            movie_ids, failures = db.insert_movies(page_movies, doulist_id)
+            record_stage(timings, 'insert', start)
+            for movie_info, movie_id in zip(page_movies, movie_ids):
+                if movie_id:
+                    total_movies += 1
+                    logger.debug('已保存: %s (ID: %s)', movie_info.get('title'), movie_id)
             
-            print(f'第 {page + 1} 页处理完成')
+            logger.info('豆列 %s 第 %d 页处理完成', doulist_id, page + 1)
+            
+            # 增量模式：已经追上上次爬取的位置
+            if reached_known:
+                logger.info('豆列 %s 已到达上次爬取的位置，停止翻页', doulist_id)
+                break
+        else:
+            # 所有页面都处理完，且没有被 max_pages 截断
+            reached_end = discovered_pages <= max_pages
             
     except Exception as e:
-        print(f'获取电影列表时发生错误: {e}')
+        error = str(e)
+        logger.error('获取豆列 %s 时发生错误: %s', doulist_id, e)
     finally:
+        if pages is not None:
+            pages.close()
+        
+        # 全量模式完整翻到最后一页后，把已从豆列中移除的电影移出这个豆列（其他豆列不受影响）
+        if reached_end and not incremental and seen_ids:
+            removed = db.delete_missing_movies(doulist_id, seen_ids)
+            logger.info('已从豆列 %s 移出 %d 部电影', doulist_id, removed)
+        
+        db.finish_crawl(doulist_id, 'failed' if error else 'ok', total_movies, error, title, total_pages)
+        
         # 输出统计信息
-        print(f'爬取完成，共保存 {total_movies} 部电影')
+        logger.info(
+            '豆列 %s 爬取完成，共保存 %d 部电影，耗时 %.2f 秒（解析 %.2f 秒，写入 %.2f 秒）',
+            doulist_id, total_movies, time.perf_counter() - crawl_start, timings.get('parse', 0), timings.get('insert', 0)
+        )
         
-        # 关闭数据库连接
+        # 关闭数据库连接和自建的下载器
         db.close()
+        if own_fetcher:
+            fetcher.close()
         
         return total_movies
 
+def fetch_many_doulists(doulist_ids, max_pages=10, incremental=True, base_url=DOULIST_BASE_URL, parser='fast',
+                        max_concurrent=MAX_CONCURRENT_DOULISTS, db_file=DB_FILE, snapshot=True, **fetcher_options):
+    """并发刷新多个豆列，返回 {豆列ID: 保存数量}
+
+    每个豆列使用自己的数据库连接，只更新自己的关联，不影响其他豆列；
+    所有豆列共享同一个下载器（会话、限速和线程池），对豆瓣的总请求速率不变。
+    snapshot=True 时写入当前数据库的暂存快照，全部豆列爬取成功并通过检查后才原子地发布，
+    任何一个豆列失败时丢弃快照，后端继续使用原来的数据；snapshot=False 时直接写入 db_file。
+    """
+    doulist_ids = list(dict.fromkeys(doulist_ids))
+    
+    def crawl(target, staging):
+        """用共享的下载器并发爬取全部豆列，写入 target"""
+        fetcher = PageFetcher(**fetcher_options)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_concurrent, len(doulist_ids)))) as executor:
+                counts = executor.map(
+                    lambda doulist_id: fetch_doulist_movies(doulist_id, max_pages, incremental, fetcher, base_url, parser,
+                                                            target, staging),
+                    doulist_ids
+                )
+                return dict(zip(doulist_ids, counts))
+        finally:
+            fetcher.close()
+    
+    if not snapshot:
+        # 先在当前线程完成建表和迁移，各豆列线程中再调用 create_table 时已无事可做
+        db = MovieDatabase(db_file)
+        db.create_table()
+        db.close()
+        return crawl(db_file, False)
+    
+    with snapshot_lock(db_file):
+        staging = stage_snapshot(db_file)
+        try:
+            counts = crawl(staging, True)
+            finish_snapshot(staging)
+            
+            db = MovieDatabase(staging, bulk=True)
+            try:
+                failed = [d for d in db.get_doulists() if d['doulist_id'] in doulist_ids and d['last_crawl_status'] != 'ok']
+            finally:
+                db.close()
+            problem = validate_snapshot(staging, db_file) if not failed else None
+        except BaseException:
+            discard_snapshot(staging)
+            raise
+        
+        if failed or problem:
+            logger.error('快照未发布，后端继续使用原有数据: %s',
+                         problem or '; '.join(f"豆列 {d['doulist_id']}: {d['last_crawl_error']}" for d in failed))
+            discard_snapshot(staging)
+            record_failures(db_file, failed)
+        else:
+            publish_snapshot(staging, db_file)
+        return counts
+
+def record_failures(db_file, failed):
+    """快照未发布时，把失败豆列的爬取状态直接记到当前数据库，/api/doulists 中可以看到"""
+    if not failed:
+        return
+    db = MovieDatabase(db_file)
+    try:
+        db.create_table()
+        for doulist in failed:
+            db.finish_crawl(doulist['doulist_id'], 'failed', 0, doulist['last_crawl_error'])
+    finally:
+        db.close()
+
+def backfill_metadata():
+    """重新解析数据库中全部电影的简介，更新年份以及导演、演员、类型、地区关联"""
+    db = MovieDatabase()
+    try:
+        db.create_table()
+        start = time.perf_counter()
+        count = db.backfill_metadata()
+        logger.info('已重新解析 %d 部电影的简介，耗时 %.2f 秒', count, time.perf_counter() - start)
+        return count
+    finally:
+        db.close()
+
 def display_movies_from_db(doulist_id, limit=10):
     """从数据库中读取并显示电影信息"""
     db = MovieDatabase()
@@ -125,15 +417,37 @@ def display_movies_from_db(doulist_id, limit=10):
             print(f"... 还有 {len(movies) - limit} 部电影 ...")
             
     except Exception as e:
-        print(f"显示电影信息时发生错误: {e}")
+        logger.error('显示电影信息时发生错误: %s', e)
     finally:
         db.close()
 
 if __name__ == '__main__':
-    doulist_id = '157902238'  # 豆列ID
+    # 命令行运行时把日志输出到终端；加上 --verbose 时显示每部电影的保存记录
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if '--verbose' in sys.argv:
+        logger.setLevel(logging.DEBUG)
+    
+    # 传入 --backfill 时只重新解析已有电影的简介，不爬取
+    if '--backfill' in sys.argv:
+        backfill_metadata()
+        sys.exit()
+    
+    # 命令行参数中的豆列ID，未指定时使用默认豆列
+    doulist_ids = [arg for arg in sys.argv[1:] if not arg.startswith('--')] or ['157902238']
+    
+    # 默认增量爬取；传入 --full 时爬取全部页面并清理已移除的电影
+    incremental = '--full' not in sys.argv
     
     # 爬取电影信息并存储到数据库
-    fetch_doulist_movies(doulist_id, max_pages=10)  # 限制最多爬取10页
+    fetch_many_doulists(doulist_ids, max_pages=10, incremental=incremental)  # 每个豆列限制最多爬取10页
+    
+    # 为新增的电影更新相似电影索引（也可单独运行 python similarity.py [--full]）
+    build_index()
+    
+    # 传入 --thumbnails 时为新海报生成缩略图（也可单独运行 python thumbnails.py）
+    if '--thumbnails' in sys.argv:
+        generate_thumbnails()
     
     # 从数据库读取并显示电影信息
-    display_movies_from_db(doulist_id)
+    for doulist_id in doulist_ids:
+        display_movies_from_db(doulist_id)
@@ -0,0 +1,192 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+# 设置环境变量 DOULIE_METRICS=0 关闭指标采集，埋点退化为空操作
+METRICS_ENABLED = os.environ.get('DOULIE_METRICS', '1') != '0'
+
+# 耗时直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 关闭采集时 time() 返回的空上下文
+_NULL_TIMER = nullcontext()
+
+def format_labels(names, values):
+    """把标签名和值格式化为 {a="x",b="y"}，没有标签时为空字符串"""
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+def format_value(value):
+    """Prometheus 数值格式"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """只增不减的计数器，按标签值分别计数"""
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """计数加 amount"""
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        """当前计数"""
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self):
+        """输出 Prometheus 文本格式的各行"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}')
+        return lines
+
+class Histogram:
+    """耗时直方图：每组标签值记录各分桶的次数、总和与总次数"""
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签值 -> [各分桶次数..., 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """记录一次观测值"""
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [0] * (len(self.buckets) + 1) + [0.0]
+                self._series[label_values] = series
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *label_values):
+        """用 with 语句计时一段代码"""
+        if not METRICS_ENABLED:
+            return _NULL_TIMER
+        return _Timer(self, label_values)
+
+    def render(self):
+        """输出 Prometheus 文本格式的各行"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                labels = format_labels(self.labels + ('le',), label_values + (format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {format_value(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class _Timer:
+    """Histogram.time() 返回的计时上下文"""
+    __slots__ = ('histogram', 'label_values', 'start')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+class CallbackMetric:
+    """抓取时才计算的指标（kind 为 gauge 或 counter）：callback 返回 [(标签值元组, 数值), ...]"""
+    def __init__(self, name, help_text, labels, callback, kind='gauge'):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        """输出 Prometheus 文本格式的各行"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for label_values, value in self.callback():
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}')
+        return lines
+
+class Registry:
+    """进程内的指标集合，按 Prometheus 文本格式输出"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """登记指标；同名指标只登记一次（模块被重复导入时返回已有的）"""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        """输出全部指标（Prometheus 文本格式）"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+def counter(name, help_text, labels=()):
+    """在默认集合中创建计数器"""
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+def histogram(name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+    """在默认集合中创建直方图"""
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+def gauge(name, help_text, labels, callback):
+    """在默认集合中创建抓取时计算的瞬时值"""
+    return REGISTRY.register(CallbackMetric(name, help_text, labels, callback, 'gauge'))
+
+def callback_counter(name, help_text, labels, callback):
+    """在默认集合中创建抓取时读取的计数（计数由其他对象自行维护）"""
+    return REGISTRY.register(CallbackMetric(name, help_text, labels, callback, 'counter'))
+
+def timed(hist):
+    """方法耗时装饰器，以函数名作为标签值；关闭采集时直接返回原函数，没有额外开销"""
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+        label = func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start, label)
+        return wrapper
+    return decorate
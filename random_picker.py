@@ -0,0 +1,86 @@
+import random
+import threading
+from array import array
+from collections import OrderedDict, deque
+
+class RandomPicker:
+    """随机选取电影：按筛选条件在内存中缓存 ID 数组，抽取为 O(1)
+
+    数据库的数据版本号变化时（爬虫写入后）重新加载对应的 ID 数组；
+    传入会话标识时记住该会话最近看过的电影，同一会话内尽量不重复。
+    """
+    def __init__(self, max_filters=64, max_sessions=1024, history_size=200):
+        self.max_filters = max_filters
+        self.max_sessions = max_sessions
+        self.history_size = history_size
+        self._ids = OrderedDict()  # (doulist_id, min_rating) -> (数据版本, ID 数组)
+        self._history = OrderedDict()  # 会话标识 -> 最近看过的 ID
+        self._lock = threading.Lock()
+
+    def pick(self, db, count=1, doulist_id=None, min_rating=None, session=None):
+        """随机选取至多 count 部不重复的电影，用一次查询取回详情"""
+        ids = self._load_ids(db, doulist_id, min_rating)
+        if not ids:
+            return []
+
+        with self._lock:
+            seen = self._session_history(session) if session else None
+            chosen = sample_ids(ids, count, set(seen) if seen else ())
+            # 该会话已经看完了全部候选电影，从头开始
+            if len(chosen) < min(count, len(ids)) and seen:
+                seen.clear()
+                chosen = sample_ids(ids, count, ())
+            if seen is not None:
+                seen.extend(chosen)
+
+        return db.get_movies_by_ids(chosen)
+
+    def _load_ids(self, db, doulist_id, min_rating):
+        """取出筛选条件对应的 ID 数组，数据版本变化后重新查询"""
+        key = (doulist_id, min_rating)
+        version = db.get_data_version()
+
+        with self._lock:
+            cached = self._ids.get(key)
+            if cached and cached[0] == version:
+                self._ids.move_to_end(key)
+                return cached[1]
+
+        ids = array('q', db.get_all_movie_ids(doulist_id, min_rating))
+
+        with self._lock:
+            self._ids[key] = (version, ids)
+            self._ids.move_to_end(key)
+            while len(self._ids) > self.max_filters:
+                self._ids.popitem(last=False)
+        return ids
+
+    def _session_history(self, session):
+        """取出会话最近看过的电影 ID（调用方需持有锁）"""
+        history = self._history.get(session)
+        if history is None:
+            history = deque(maxlen=self.history_size)
+            self._history[session] = history
+            while len(self._history) > self.max_sessions:
+                self._history.popitem(last=False)
+        self._history.move_to_end(session)
+        return history
+
+def sample_ids(ids, count, exclude):
+    """从 ID 数组中随机取至多 count 个不在 exclude 中的不同 ID"""
+    if len(exclude) * 2 < len(ids):
+        # 排除的数量较少时用拒绝采样，不需要复制数组
+        chosen = []
+        picked = set()
+        attempts = 0
+        while len(chosen) < count and attempts < count * 20:
+            attempts += 1
+            movie_id = ids[random.randrange(len(ids))]
+            if movie_id not in exclude and movie_id not in picked:
+                picked.add(movie_id)
+                chosen.append(movie_id)
+        if len(chosen) == count:
+            return chosen
+
+    candidates = [movie_id for movie_id in ids if movie_id not in exclude]
+    return random.sample(candidates, min(count, len(candidates)))
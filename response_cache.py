@@ -0,0 +1,55 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+class CachedResponse:
+    """一条缓存的响应体及其 ETag"""
+    def __init__(self, body, version, etag, expires_at):
+        self.body = body
+        self.version = version
+        self.etag = etag
+        self.expires_at = expires_at
+        self.encoded = {}  # Content-Encoding -> 压缩后的响应体，首次按该方式发送时生成
+
+class ResponseCache:
+    """进程内响应缓存：有界 LRU，每条记录带 TTL，并绑定生成时的数据版本号
+
+    数据版本号变化（爬虫写入数据库）后，旧版本的记录在下次访问时即视为失效。
+    """
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """取出与当前数据版本一致且未过期的缓存，没有时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version, body):
+        """缓存响应体（bytes），ETag 由数据版本号和内容哈希组成"""
+        etag = f'{version}-{hashlib.sha1(body).hexdigest()[:16]}'
+        entry = CachedResponse(body, version, etag, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock:
+            self._entries.clear()
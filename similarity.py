@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from database import MovieDatabase
+
+logger = logging.getLogger(__name__)
+
+# 相似推荐依赖 numpy，未安装时跳过建索引，接口返回 503
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 索引目录：每次构建写入一个新的版本子目录，current.json 指向当前版本
+SIMILARITY_DIR = 'similarity_index'
+CURRENT_FILE = 'current.json'
+
+# 文本向量的维数（字符二元组按哈希映射到各维，带正负号以抵消碰撞）
+VECTOR_DIM = 256
+
+# 统计文档频率的哈希桶数
+IDF_BUCKETS = 1 << 18
+
+# 每部电影预先计算的相似电影数，也是接口一次最多返回的数量
+NEIGHBORS = 20
+
+# 相似度之外按对方评分加分：评分 10 分加 RATING_WEIGHT，未评分不加
+RATING_WEIGHT = 0.1
+
+# 计算相似度时每批的行数（每批占用 BLOCK_ROWS × 电影数 个 float32）
+BLOCK_ROWS = 128
+
+# 增量加入的电影超过上次全量构建时电影数的该比例后，重新全量构建（刷新文档频率）
+REBUILD_RATIO = 0.2
+
+# 切分词元：连续的字母、数字和汉字
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def char_bigrams(text):
+    """文本中各词元的字符二元组，单字词元保留本身"""
+    grams = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if len(token) == 1:
+            grams.append(token)
+        else:
+            grams.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return grams
+
+def hash_terms(rows):
+    """把每部电影的标题和简介切成二元组并哈希，返回每行的 {哈希值: 次数}"""
+    hashes = {}
+    docs = []
+    for _, title, abstract, _ in rows:
+        counts = Counter()
+        for gram in char_bigrams(f'{title or ""} {abstract or ""}'):
+            h = hashes.get(gram)
+            if h is None:
+                h = hashes[gram] = zlib.crc32(gram.encode('utf-8'))
+            counts[h] += 1
+        docs.append(counts)
+    return docs
+
+def compute_idf(docs):
+    """按哈希桶统计文档频率，返回平滑后的 IDF 数组"""
+    total = sum(len(counts) for counts in docs)
+    hashes = np.fromiter((h for counts in docs for h in counts), dtype=np.uint32, count=total)
+    df = np.bincount(hashes & (IDF_BUCKETS - 1), minlength=IDF_BUCKETS)
+    return (np.log((1 + len(docs)) / (1 + df)) + 1).astype(np.float32)
+
+def vectorize(docs, idf):
+    """TF-IDF（次数取对数）按哈希映射到 VECTOR_DIM 维并做 L2 归一化，返回 float32 矩阵"""
+    lengths = np.fromiter((len(counts) for counts in docs), dtype=np.int64, count=len(docs))
+    total = int(lengths.sum())
+    hashes = np.fromiter((h for counts in docs for h in counts), dtype=np.uint32, count=total)
+    tf = np.fromiter((n for counts in docs for n in counts.values()), dtype=np.float32, count=total)
+    rows = np.repeat(np.arange(len(docs)), lengths)
+
+    # 低 18 位取文档频率，接下来 8 位决定维度，最高位决定正负号
+    weights = (1 + np.log(tf)) * idf[hashes & (IDF_BUCKETS - 1)]
+    weights = np.where(hashes >> 31, weights, -weights)
+    columns = (hashes >> 18) % VECTOR_DIM
+    vectors = np.bincount(rows * VECTOR_DIM + columns, weights, len(docs) * VECTOR_DIM)
+    vectors = vectors.reshape(len(docs), VECTOR_DIM).astype(np.float32)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+def rating_bonus(rows):
+    """各电影作为推荐对象时的评分加分"""
+    return np.fromiter(((rating or 0) / 10 * RATING_WEIGHT for *_, rating in rows), dtype=np.float32, count=len(rows))
+
+def top_neighbors(queries, query_ids, vectors, ids, bonus, k=NEIGHBORS):
+    """批量计算 queries 各行与全部电影的得分（点积 + 评分加分），返回前 k 个 (电影 ID, 得分) 矩阵
+
+    结果按得分降序排列，不足 k 个时以 ID 0 补齐；电影不会推荐自己。
+    """
+    n = len(queries)
+    neighbor_ids = np.zeros((n, k), dtype=np.int64)
+    neighbor_scores = np.full((n, k), -np.inf, dtype=np.float32)
+    take = min(k, len(ids) - 1)
+    if take <= 0:
+        return neighbor_ids, neighbor_scores
+
+    # 各批复用同一块得分缓冲区
+    buffer = np.empty((min(BLOCK_ROWS, n), len(ids)), dtype=np.float32)
+    for start in range(0, n, BLOCK_ROWS):
+        block = slice(start, min(start + BLOCK_ROWS, n))
+        scores = buffer[:block.stop - start]
+        np.matmul(queries[block], vectors.T, out=scores)
+        scores += bonus
+        # 排除自己：ID 数组有序，直接定位自己所在的列
+        own = np.searchsorted(ids, query_ids[block])
+        found = own < len(ids)
+        found[found] = ids[own[found]] == query_ids[block][found]
+        scores[np.nonzero(found)[0], own[found]] = -np.inf
+
+        best = np.argpartition(scores, -take, axis=1)[:, -take:]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        neighbor_ids[block, :take] = ids[np.take_along_axis(best, order, axis=1)]
+        neighbor_scores[block, :take] = np.take_along_axis(best_scores, order, axis=1)
+    return neighbor_ids, neighbor_scores
+
+def merge_neighbors(old_ids, old_scores, new_ids, new_scores, k=NEIGHBORS):
+    """把新候选并入已有的前 k 个相似电影，按得分保留前 k 个"""
+    ids = np.concatenate([old_ids, new_ids], axis=1)
+    scores = np.concatenate([old_scores, new_scores], axis=1)
+    best = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(ids, best, axis=1), np.take_along_axis(scores, best, axis=1)
+
+def load_movies(db, after_id=0):
+    """按 ID 顺序读取 ID 大于 after_id 的电影的 (id, title, abstract, rating_num)"""
+    return list(db.iter_rows(
+        'SELECT id, title, abstract, rating_num FROM movies WHERE id > ? ORDER BY id',
+        (after_id,), ('id', 'title', 'abstract', 'rating_num'), 'tuple'
+    ))
+
+def read_current(index_dir):
+    """读取当前版本的描述，没有索引时返回 None"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def load_arrays(index_dir, current):
+    """以内存映射方式打开某个版本的数组文件"""
+    path = os.path.join(index_dir, current['generation'])
+    return {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+        for name in ('ids', 'vectors', 'bonus', 'neighbors', 'scores', 'idf')
+    }
+
+def publish(index_dir, arrays, base_rows):
+    """把数组写入新的版本目录，再原子地替换 current.json；只保留当前和上一个版本"""
+    generation = f'{time.time_ns():x}'
+    path = os.path.join(index_dir, generation)
+    os.makedirs(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), array)
+
+    ids = arrays['ids']
+    current = {
+        'generation': generation,
+        'rows': len(ids),
+        'max_id': int(ids[-1]) if len(ids) else 0,
+        'base_rows': base_rows,
+        'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    tmp_path = os.path.join(index_dir, f'{CURRENT_FILE}.part')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(current, f)
+    os.replace(tmp_path, os.path.join(index_dir, CURRENT_FILE))
+
+    # 仍在使用旧版本的进程已经映射了文件，删除目录不影响它们读取
+    generations = sorted(name for name in os.listdir(index_dir) if os.path.isdir(os.path.join(index_dir, name)))
+    for old in generations[:-2]:
+        shutil.rmtree(os.path.join(index_dir, old), ignore_errors=True)
+    return current
+
+def build_index(db_file='movies.db', index_dir=SIMILARITY_DIR, full=False):
+    """构建或增量更新相似电影索引，返回本次加入索引的电影数
+
+    增量模式只为上次构建之后新增的电影（ID 更大）计算向量和相似电影，
+    并把它们作为候选并入已有电影的前 NEIGHBORS 个相似电影；
+    新增电影过多、或 full=True 时重新全量构建。
+    """
+    if np is None:
+        logger.warning('未安装 numpy，跳过相似电影索引')
+        return 0
+
+    os.makedirs(index_dir, exist_ok=True)
+    current = None if full else read_current(index_dir)
+
+    db = MovieDatabase(db_file)
+    try:
+        db.create_table()
+        new_rows = load_movies(db, current['max_id'] if current else 0)
+    finally:
+        db.close()
+
+    if current and not new_rows:
+        logger.info('相似电影索引已是最新（%d 部电影）', current['rows'])
+        return 0
+
+    start = time.perf_counter()
+    if current and current['rows'] + len(new_rows) <= current['base_rows'] * (1 + REBUILD_RATIO):
+        old = load_arrays(index_dir, current)
+        query_ids = np.fromiter((row[0] for row in new_rows), dtype=np.int64, count=len(new_rows))
+        queries = vectorize(hash_terms(new_rows), old['idf'])
+        ids = np.concatenate([old['ids'], query_ids])
+        vectors = np.concatenate([old['vectors'], queries])
+        bonus = np.concatenate([old['bonus'], rating_bonus(new_rows)])
+
+        # 新电影与全部电影比较；已有电影只需与新电影比较，再并入原有结果
+        new_neighbors, new_scores = top_neighbors(queries, query_ids, vectors, ids, bonus)
+        neighbors = np.empty((len(ids), NEIGHBORS), dtype=np.int64)
+        scores = np.empty((len(ids), NEIGHBORS), dtype=np.float32)
+        for block_start in range(0, len(old['ids']), BLOCK_ROWS):
+            block = slice(block_start, min(block_start + BLOCK_ROWS, len(old['ids'])))
+            candidates = old['vectors'][block] @ queries.T + bonus[len(old['ids']):]
+            candidate_ids = np.broadcast_to(query_ids, candidates.shape)
+            neighbors[block], scores[block] = merge_neighbors(
+                old['neighbors'][block], old['scores'][block], candidate_ids, candidates)
+        neighbors[len(old['ids']):] = new_neighbors
+        scores[len(old['ids']):] = new_scores
+
+        published = publish(index_dir, {
+            'ids': ids, 'vectors': vectors, 'bonus': bonus, 'neighbors': neighbors, 'scores': scores, 'idf': old['idf'],
+        }, current['base_rows'])
+        logger.info('相似电影索引增量加入 %d 部电影（共 %d 部），耗时 %.2f 秒',
+                    len(new_rows), published['rows'], time.perf_counter() - start)
+        return len(new_rows)
+
+    # 全量构建：读取全部电影重新统计文档频率
+    if current:
+        db = MovieDatabase(db_file)
+        try:
+            rows = load_movies(db)
+        finally:
+            db.close()
+    else:
+        rows = new_rows
+
+    docs = hash_terms(rows)
+    idf = compute_idf(docs)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    vectors = vectorize(docs, idf)
+    bonus = rating_bonus(rows)
+    neighbors, scores = top_neighbors(vectors, ids, vectors, ids, bonus)
+    publish(index_dir, {
+        'ids': ids, 'vectors': vectors, 'bonus': bonus, 'neighbors': neighbors, 'scores': scores, 'idf': idf,
+    }, len(rows))
+    logger.info('相似电影索引全量构建完成，共 %d 部电影，耗时 %.2f 秒', len(rows), time.perf_counter() - start)
+    return len(rows)
+
+class SimilarityIndex:
+    """接口使用的只读索引：以内存映射打开当前版本的相似电影表，查询只需一次二分查找
+
+    爬虫更新索引（替换 current.json）后，下一次查询时自动切换到新版本。
+    """
+    def __init__(self, index_dir=SIMILARITY_DIR):
+        self.index_dir = index_dir
+        self.generation = None
+        self._arrays = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        """索引是否可用（已安装 numpy 且已经构建过）"""
+        return self._refresh() is not None
+
+    def _refresh(self):
+        """current.json 变化时重新映射数组文件，返回当前数组"""
+        if np is None:
+            return None
+        try:
+            mtime = os.stat(os.path.join(self.index_dir, CURRENT_FILE)).st_mtime_ns
+        except OSError:
+            return None
+        if mtime == self._mtime:
+            return self._arrays
+
+        with self._lock:
+            if mtime != self._mtime:
+                current = read_current(self.index_dir)
+                try:
+                    self._arrays = load_arrays(self.index_dir, current) if current else None
+                    self.generation = current['generation'] if current else None
+                except (OSError, ValueError) as e:
+                    logger.warning('加载相似电影索引失败: %s', e)
+                    return self._arrays
+                self._mtime = mtime
+            return self._arrays
+
+    def neighbors(self, movie_id, limit=NEIGHBORS):
+        """电影的相似电影 [(电影 ID, 得分), ...]，按得分降序；电影尚未加入索引时返回空列表"""
+        arrays = self._refresh()
+        if arrays is None:
+            return []
+        ids = arrays['ids']
+        row = int(np.searchsorted(ids, movie_id))
+        if row >= len(ids) or ids[row] != movie_id:
+            return []
+        return [
+            (int(neighbor_id), float(score))
+            for neighbor_id, score in zip(arrays['neighbors'][row, :limit].tolist(), arrays['scores'][row, :limit].tolist())
+            if neighbor_id
+        ]
+
+if __name__ == '__main__':
+    # python similarity.py [--full]：为 movies.db 中新增的电影更新相似电影索引
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    build_index(full='--full' in sys.argv)
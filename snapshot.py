@@ -0,0 +1,154 @@
+import fcntl
+import glob
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from database import MovieDatabase, ALL_MOVIES
+
+logger = logging.getLogger(__name__)
+
+# 快照文件所在的目录（与数据库文件同级），数据库文件本身是指向当前快照的符号链接
+SNAPSHOT_DIR = 'snapshots'
+
+# 保留的快照文件数（当前快照和上一个，正在读取上一个快照的请求不受影响）
+KEEP_SNAPSHOTS = 2
+
+# 新快照的电影数少于当前数据库的该比例时拒绝发布（页面结构变化导致解析不到电影等情况）
+MIN_SNAPSHOT_RATIO = 0.5
+
+def snapshot_dir(db_file):
+    """数据库文件对应的快照目录"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_file)), SNAPSHOT_DIR)
+
+def snapshot_files(db_file):
+    """快照目录中的全部快照文件，按创建先后排序"""
+    stem = os.path.splitext(os.path.basename(db_file))[0]
+    return sorted(glob.glob(os.path.join(snapshot_dir(db_file), f'{stem}-*.db')))
+
+@contextmanager
+def snapshot_lock(db_file):
+    """同一时间只允许一个进程准备和发布快照，后来的进程等待前一个完成"""
+    with open(f'{os.path.abspath(db_file)}.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def stage_snapshot(db_file):
+    """用 SQLite 备份 API 把当前数据库复制为暂存快照，返回暂存文件路径
+
+    复制期间读取端照常访问当前数据库；暂存快照建好表结构后供爬虫以批量写入设置写入。
+    当前数据库还没有电影时（第一次爬取），先删掉二级索引和派生表，写完后再一次性重建。
+    """
+    directory = snapshot_dir(db_file)
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_file))[0]
+    path = os.path.join(directory, f'{stem}-{time.time_ns():x}.db')
+
+    start = time.perf_counter()
+    if os.path.exists(db_file):
+        source = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+            # 复制来的是 WAL 模式，暂存期间改用内存日志
+            target.execute('PRAGMA journal_mode=MEMORY')
+        finally:
+            target.close()
+            source.close()
+
+    db = MovieDatabase(path, bulk=True)
+    try:
+        db.create_table()
+        db.cursor.execute('SELECT EXISTS (SELECT 1 FROM movies)')
+        if not db.cursor.fetchone()[0]:
+            db.defer_indexes()
+    finally:
+        db.close()
+    logger.info('已创建暂存快照 %s，耗时 %.2f 秒', path, time.perf_counter() - start)
+    return path
+
+def finish_snapshot(path):
+    """写入完成后重建暂存快照中被推迟的索引和派生表（没有推迟时什么也不做）"""
+    db = MovieDatabase(path, bulk=True)
+    try:
+        return db.create_table()
+    finally:
+        db.close()
+
+def validate_snapshot(path, db_file):
+    """发布前检查暂存快照，返回问题描述，没有问题时返回 None
+
+    检查数据库完整性、统计表与电影表是否一致，以及电影数是否比当前数据库少太多。
+    """
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+        if result != 'ok':
+            return f'完整性检查失败: {result}'
+        count = conn.execute('SELECT COUNT(*) FROM movies').fetchone()[0]
+        stats_count = conn.execute(
+            'SELECT COALESCE(SUM(movie_count), 0) FROM movie_stats WHERE doulist_id = ?', (ALL_MOVIES,)
+        ).fetchone()[0]
+        if stats_count != count:
+            return f'统计表的电影数 {stats_count} 与电影表 {count} 不一致'
+    except sqlite3.Error as e:
+        return f'检查快照出错: {e}'
+    finally:
+        conn.close()
+
+    if os.path.exists(db_file):
+        live = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True)
+        try:
+            live_count = live.execute('SELECT COUNT(*) FROM movies').fetchone()[0]
+        except sqlite3.Error:
+            live_count = 0
+        finally:
+            live.close()
+        if count < live_count * MIN_SNAPSHOT_RATIO:
+            return f'电影数从 {live_count} 减少到 {count}'
+    return None
+
+def fsync_path(path):
+    """把文件或目录落盘"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def publish_snapshot(path, db_file):
+    """把暂存快照发布为当前数据库
+
+    快照先转为 WAL 模式并落盘，再用 rename 把 db_file 原子地替换为指向它的符号链接。
+    后端正在使用的连接继续读取旧快照直到请求结束，之后借出的连接打开新快照，读取端不会等待写入。
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+    finally:
+        conn.close()
+    fsync_path(path)
+
+    link_path = f'{os.path.abspath(db_file)}.{os.getpid()}.link'
+    os.symlink(os.path.relpath(path, os.path.dirname(os.path.abspath(db_file))), link_path)
+    os.replace(link_path, db_file)
+    fsync_path(os.path.dirname(os.path.abspath(db_file)))
+    logger.info('已发布快照 %s', path)
+
+    # 只保留最近的快照；已删除快照上未结束的读取仍持有文件句柄，不受影响
+    current = os.path.realpath(db_file)
+    older = [name for name in snapshot_files(db_file) if name != current]
+    for name in older[:max(len(older) - (KEEP_SNAPSHOTS - 1), 0)]:
+        discard_snapshot(name)
+
+def discard_snapshot(path):
+    """删除快照文件及其日志文件"""
+    for name in (path, f'{path}-journal', f'{path}-wal', f'{path}-shm'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
@@ -1,9 +1,16 @@
 const API_BASE_URL = 'http://localhost:8080/api';
 
+// 通过后端代理加载海报，指定 width 时使用预生成的缩略图
+export const proxyImageUrl = (url, width) =>
+  `${API_BASE_URL}/proxy-image?url=${encodeURIComponent(url)}${width ? `&w=${width}` : ''}`;
+
+// 列表卡片用到的字段，列表接口只返回这些字段（简介等在详情接口中获取）
+const LIST_FIELDS = 'id,title,rating,image,time';
+
 export const fetchMovies = async (page = 1, perPage = 10, sortBy = 'time', order = 'desc') => {
   try {
     const response = await fetch(
-      `${API_BASE_URL}/movies?page=${page}&per_page=${perPage}&sort_by=${sortBy}&order=${order}`
+      `${API_BASE_URL}/movies?page=${page}&per_page=${perPage}&sort_by=${sortBy}&order=${order}&fields=${LIST_FIELDS}`
     );
     if (!response.ok) {
       throw new Error('获取电影列表失败');
@@ -28,9 +35,31 @@ export const fetchMovieDetail = async (movieId) => {
   }
 };
 
+// 一次请求获取多部电影（按传入顺序返回，notFound 为不存在的 ID），代替逐部请求详情接口
+export const fetchMoviesByIds = async (ids, fields) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/movies/batch${fields ? `?fields=${fields}` : ''}`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ ids })
+    });
+    if (!response.ok) {
+      throw new Error('批量获取电影失败');
+    }
+    const data = await response.json();
+    return { movies: data.movies, notFound: data.not_found };
+  } catch (error) {
+    console.error('API错误:', error);
+    throw error;
+  }
+};
+
+// 本次页面会话的标识，后端据此避免重复推荐同一部电影
+const RANDOM_SESSION = Math.random().toString(36).slice(2);
+
 export const fetchRandomMovie = async () => {
   try {
-    const response = await fetch(`${API_BASE_URL}/movies/random`);
+    const response = await fetch(`${API_BASE_URL}/movies/random?session=${RANDOM_SESSION}`);
     if (!response.ok) {
       throw new Error('获取随机电影失败');
     }
@@ -8,6 +8,7 @@ import {
   Stack,
   Rating
 } from '@fluentui/react';
+import { proxyImageUrl } from '../api';
 
 const MovieCard = ({ movie, onClick }) => {
   return (
@@ -26,7 +27,7 @@ const MovieCard = ({ movie, onClick }) => {
       <DocumentCardImage 
         height={180} 
         imageFit="cover"
-        imageSrc={movie.image || 'https://via.placeholder.com/300x180?text=无图片'}
+        imageSrc={movie.image ? proxyImageUrl(movie.image, 320) : 'https://via.placeholder.com/300x180?text=无图片'}
       />
       <DocumentCardDetails>
         <DocumentCardTitle 
@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from benchmark import synthetic_doulist_page
+from database import MovieDatabase, ConnectionPool
+from random_picker import RandomPicker
+from response_cache import ResponseCache
+
+DOULIST_ID = '1000'
+
+# 接口测试使用的电影：评分、时间各不相同，简介中带导演、类型等信息
+SAMPLE_MOVIES = [
+    {
+        'title': f'电影{i:02d}',
+        'rating': f'{5 + i % 5}.{i % 10}',
+        'image': f'https://img.example.com/{i}.jpg',
+        'abstract': f'导演: 导演{i % 3}\n类型: {"剧情" if i % 2 else "喜剧"}\n制片国家/地区: 中国大陆\n年份: {2000 + i}',
+        'time': f'2024-01-{i + 1:02d} 12:00:00',
+        'subject_id': str(100 + i),
+    }
+    for i in range(25)
+]
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """在临时目录中导入 app，启动时创建的数据库和图片缓存目录不会落在仓库里"""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+@pytest.fixture
+def db_path(tmp_path):
+    """写入 SAMPLE_MOVIES 的临时数据库"""
+    path = str(tmp_path / 'movies.db')
+    db = MovieDatabase(path)
+    try:
+        db.create_table()
+        db.insert_movies(SAMPLE_MOVIES, DOULIST_ID)
+    finally:
+        db.close()
+    return path
+
+@pytest.fixture
+def client(app_module, db_path, monkeypatch):
+    """读取临时数据库的测试客户端，每个测试使用新的连接池和缓存"""
+    pool = ConnectionPool(db_path, size=2, readonly=True)
+    monkeypatch.setattr(app_module, 'read_pool', pool)
+    monkeypatch.setattr(app_module, 'response_cache', ResponseCache())
+    monkeypatch.setattr(app_module, 'random_picker', RandomPicker())
+    yield app_module.app.test_client()
+    pool.close_all()
+
+class StubDoulist:
+    """桩服务器的豆列内容：offset 之后的合成电影按页返回，failures 为各页依次返回的错误状态码，rewrite 用于改写页面"""
+    def __init__(self, total_pages):
+        self.total_pages = total_pages
+        self.offset = 0
+        self.failures = {}
+        self.rewrite = None
+        self.hits = []
+        self.lock = threading.Lock()
+
+    def respond(self, start):
+        """返回 (状态码, 页面)"""
+        with self.lock:
+            self.hits.append(start)
+            statuses = self.failures.get(start)
+            if statuses:
+                return statuses.pop(0), ''
+        html = synthetic_doulist_page(self.offset + start, main.PAGE_SIZE, self.total_pages)
+        return 200, self.rewrite(start, html) if self.rewrite else html
+
+@pytest.fixture
+def stub():
+    """在随机端口启动桩服务器，返回 (豆列内容, base_url)"""
+    doulist = StubDoulist(total_pages=4)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            status, html = doulist.respond(int(query.get('start', ['0'])[0]))
+            body = html.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield doulist, f'http://127.0.0.1:{server.server_port}/doulist/'
+    server.shutdown()
+    server.server_close()
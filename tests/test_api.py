@@ -0,0 +1,205 @@
+"""接口测试：用测试客户端请求 conftest 中的临时数据库"""
+import base64
+import json
+
+import pytest
+
+from conftest import DOULIST_ID, SAMPLE_MOVIES
+from database import MovieDatabase
+
+def get_json(client, url):
+    """发送 GET 请求，返回 (状态码, JSON)"""
+    response = client.get(url)
+    try:
+        return response.status_code, response.get_json()
+    finally:
+        response.close()
+
+def forge_cursor(payload):
+    """按 encode_cursor 的格式编码任意内容"""
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+@pytest.mark.parametrize('sort_by, order', [('time', 'desc'), ('rating', 'asc'), ('rating', 'desc'), ('title', 'asc')])
+def test_cursor_pages_cover_every_movie_once(client, sort_by, order):
+    _, first = get_json(client, f'/api/movies?sort_by={sort_by}&order={order}&per_page=100')
+    expected = [movie['id'] for movie in first['movies']]
+
+    seen = []
+    cursor = ''
+    while cursor is not None:
+        status, data = get_json(client, f'/api/movies?sort_by={sort_by}&order={order}&per_page=7&cursor={cursor}')
+        assert status == 200
+        seen += [movie['id'] for movie in data['movies']]
+        cursor = data['pagination']['next_cursor']
+    assert seen == expected
+    assert len(seen) == len(SAMPLE_MOVIES)
+
+@pytest.mark.parametrize('payload', [
+    ['time', 'desc', 1, 2 ** 70],
+    ['time', 'desc', 2 ** 70, 5],
+    ['time', 'desc', 1, -1],
+    ['time', 'desc', 1, True],
+    ['time', 'desc', 1.5, 5],
+    ['time', 'desc', [1], 5],
+    ['rating', 'asc', float('inf'), 5],
+    ['rating', 'asc', '8.0', 5],
+    ['title', 'asc', {'a': 1}, 5],
+    ['bogus', 'desc', 1, 5],
+    [['time'], 'desc', 1, 5],
+    ['time', 'sideways', 1, 5],
+    ['time', 'desc', 1],
+    {'sort_by': 'time'},
+])
+def test_tampered_cursor_is_rejected(client, payload):
+    status, data = get_json(client, f'/api/movies?cursor={forge_cursor(payload)}')
+    assert status == 400
+    assert data['error'] == '无效的分页游标'
+
+def test_garbage_cursor_is_rejected(client):
+    status, _ = get_json(client, '/api/movies?cursor=not-base64!')
+    assert status == 400
+
+@pytest.mark.parametrize('count, expected', [('abc', 1), ('0', 1), ('-5', 1), ('3', 3), ('1000', len(SAMPLE_MOVIES))])
+def test_random_count_is_parsed_and_clamped(client, count, expected):
+    status, data = get_json(client, f'/api/movies/random?count={count}')
+    assert status == 200
+    assert len(data['movies']) == expected
+    assert len({movie['id'] for movie in data['movies']}) == expected
+
+def test_matching_etag_gets_304(client):
+    response = client.get('/api/movies?per_page=5')
+    etag = response.headers['ETag']
+    response.close()
+
+    response = client.get('/api/movies?per_page=5', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    response.close()
+
+    response = client.get('/api/movies?per_page=5', headers={'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    response.close()
+
+def test_write_invalidates_cached_response(client, db_path):
+    response = client.get('/api/movies?per_page=5')
+    etag = response.headers['ETag']
+    before = response.get_json()
+    response.close()
+
+    db = MovieDatabase(db_path)
+    try:
+        db.insert_movies([{'title': '新电影', 'rating': '9.9', 'time': '2025-01-01 00:00:00', 'subject_id': '999'}], DOULIST_ID)
+    finally:
+        db.close()
+
+    # 数据版本号变化后旧 ETag 不再匹配，返回包含新电影的新内容
+    response = client.get('/api/movies?per_page=5', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    data = response.get_json()
+    response.close()
+    assert data['movies'][0]['title'] == '新电影'
+    assert data['pagination']['total_count'] == before['pagination']['total_count'] + 1
+
+def post_json(client, url, body):
+    """发送 JSON 请求体的 POST 请求，返回 (状态码, JSON)"""
+    response = client.post(url, json=body)
+    try:
+        return response.status_code, response.get_json()
+    finally:
+        response.close()
+
+def sample_ids(client):
+    _, data = get_json(client, '/api/movies?per_page=100&fields=id')
+    return [movie['id'] for movie in data['movies']]
+
+def test_batch_returns_movies_in_request_order(client):
+    ids = sample_ids(client)
+    wanted = [ids[5], ids[0], 10 ** 9, ids[12], ids[0]]
+
+    status, data = post_json(client, '/api/movies/batch', {'ids': wanted})
+    assert status == 200
+    assert [movie['id'] for movie in data['movies']] == [ids[5], ids[0], ids[12]]
+    assert data['not_found'] == [10 ** 9]
+
+    status, data = get_json(client, f'/api/movies/batch?ids={ids[3]},{ids[1]}&fields=id,title')
+    assert status == 200
+    assert [sorted(movie) for movie in data['movies']] == [['id', 'title']] * 2
+    assert [movie['id'] for movie in data['movies']] == [ids[3], ids[1]]
+
+@pytest.mark.parametrize('ids', [
+    [],
+    '',
+    [1, 'abc'],
+    [1, 2.5],
+    [True],
+    [{'id': 1}],
+    'not-a-list',
+    [2 ** 63],
+    [-1],
+    ['99999999999999999999'],
+])
+def test_batch_rejects_invalid_ids(client, ids):
+    status, data = post_json(client, '/api/movies/batch', {'ids': ids})
+    assert status == 400
+    assert 'error' in data
+
+def test_batch_rejects_too_many_ids(client, app_module):
+    status, _ = post_json(client, '/api/movies/batch', {'ids': list(range(1, app_module.MAX_BATCH_IDS + 2))})
+    assert status == 400
+    status, _ = post_json(client, '/api/movies/batch', {'ids': list(range(1, app_module.MAX_BATCH_IDS + 1))})
+    assert status == 200
+
+def test_batch_get_rejects_out_of_range_ids(client):
+    status, _ = get_json(client, f'/api/movies/batch?ids=1,{2 ** 63}')
+    assert status == 400
+
+def matching_titles(*terms):
+    """SAMPLE_MOVIES 中标题或简介包含全部搜索词的电影标题"""
+    return {movie['title'] for movie in SAMPLE_MOVIES if all(term in movie['title'] + movie['abstract'] for term in terms)}
+
+@pytest.mark.parametrize('terms', [
+    ('电影07',),
+    ('导演1', '中国大陆'),
+    ('剧情',),
+    ('7',),
+    ('导演2', '喜剧'),
+])
+def test_search_matches_title_and_abstract(client, terms):
+    # 三个字及以上的词走三元组全文索引，更短的词退回 LIKE 匹配
+    status, data = get_json(client, f"/api/search?q={' '.join(terms)}&per_page=100")
+    assert status == 200
+    titles = {movie['title'] for movie in data['movies']}
+    assert titles == matching_titles(*terms)
+    assert data['pagination']['total_count'] == len(titles)
+    for movie in data['movies']:
+        assert '<mark>' in movie['title_highlight'] + movie['snippet']
+
+def test_search_ranks_title_hits_first(client):
+    status, data = get_json(client, '/api/search?q=电影07')
+    assert status == 200
+    assert data['movies'][0]['title_highlight'] == '<mark>电影07</mark>'
+
+@pytest.mark.parametrize('query, page, per_page', [
+    ('page=abc&per_page=xyz', 1, 10),
+    ('page=0&per_page=0', 1, 1),
+    ('page=-3&per_page=-5', 1, 1),
+    ('page=2&per_page=5', 2, 5),
+])
+def test_search_pagination_is_bounded(client, query, page, per_page):
+    status, data = get_json(client, f'/api/search?q=电影&{query}')
+    assert status == 200
+    assert data['pagination']['current_page'] == page
+    assert data['pagination']['per_page'] == per_page
+    assert data['pagination']['total_pages'] == -(-len(SAMPLE_MOVIES) // per_page)
+    assert len(data['movies']) == min(per_page, len(SAMPLE_MOVIES) - (page - 1) * per_page)
+
+def test_search_per_page_is_capped(client, app_module):
+    status, data = get_json(client, f'/api/search?q=电影&per_page={app_module.MAX_SEARCH_PER_PAGE + 1}')
+    assert status == 200
+    assert data['pagination']['per_page'] == app_module.MAX_SEARCH_PER_PAGE
+
+def test_search_pages_do_not_overlap(client):
+    pages = [get_json(client, f'/api/search?q=导演0&page={page}&per_page=3')[1]['movies'] for page in (1, 2, 3)]
+    ids = [movie['id'] for movies in pages for movie in movies]
+    assert len(ids) == len(set(ids)) == len(matching_titles('导演0'))
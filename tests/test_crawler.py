@@ -0,0 +1,89 @@
+"""用本地桩服务器测试爬虫：分页发现、429/5xx 重试和增量刷新提前停止"""
+import pytest
+
+import main
+from conftest import DOULIST_ID
+from database import MovieDatabase
+from fetcher import PageFetcher
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'movies.db')
+
+def crawl(base_url, db_file, incremental):
+    """不限速地爬取一次桩服务器上的豆列，返回保存的电影数"""
+    fetcher = PageFetcher(rate=1000, burst=1000, backoff=0.01)
+    try:
+        return main.fetch_doulist_movies(DOULIST_ID, incremental=incremental, fetcher=fetcher, base_url=base_url, db_file=db_file)
+    finally:
+        fetcher.close()
+
+def doulist_status(db_file):
+    db = MovieDatabase(db_file)
+    try:
+        return {doulist['doulist_id']: doulist for doulist in db.get_doulists()}[DOULIST_ID]
+    finally:
+        db.close()
+
+def test_discovers_pages_from_paginator(stub, db_file):
+    doulist, base_url = stub
+
+    assert crawl(base_url, db_file, incremental=False) == 4 * main.PAGE_SIZE
+    assert sorted(doulist.hits) == [0, 25, 50, 75]
+    status = doulist_status(db_file)
+    assert status['last_crawl_status'] == 'ok'
+    assert status['total_pages'] == 4
+
+def test_retries_rate_limited_and_server_errors(stub, db_file):
+    doulist, base_url = stub
+    doulist.failures = {0: [503], 25: [429, 502]}
+
+    assert crawl(base_url, db_file, incremental=False) == 4 * main.PAGE_SIZE
+    assert doulist.hits.count(0) == 2
+    assert doulist.hits.count(25) == 3
+    assert doulist_status(db_file)['last_crawl_status'] == 'ok'
+
+def test_gives_up_after_max_retries(stub, db_file):
+    doulist, base_url = stub
+    doulist.failures = {25: [500] * 10}
+
+    crawl(base_url, db_file, incremental=False)
+    # 首次请求加 max_retries（默认 3）次重试
+    assert doulist.hits.count(25) == 4
+    assert doulist_status(db_file)['last_crawl_status'] == 'failed'
+
+def test_incremental_refresh_stops_at_known_page(stub, db_file):
+    doulist, base_url = stub
+    # 第一次爬取时豆列从第 30 部开始；之后在前面新增 30 部，第 2 页出现已保存的电影
+    doulist.offset = 30
+    crawl(base_url, db_file, incremental=False)
+    doulist.offset = 0
+    doulist.hits.clear()
+
+    assert crawl(base_url, db_file, incremental=True) == 2 * main.PAGE_SIZE
+    assert doulist.hits == [0, 25]
+
+def test_incremental_refresh_with_nothing_new_fetches_one_page(stub, db_file):
+    doulist, base_url = stub
+    crawl(base_url, db_file, incremental=False)
+    doulist.hits.clear()
+
+    crawl(base_url, db_file, incremental=True)
+    assert doulist.hits == [0]
+
+def test_items_without_subject_link_are_not_duplicated(stub, db_file):
+    doulist, base_url = stub
+    # 第一页的第一个条目没有豆瓣条目链接（海报和标题两处）
+    doulist.rewrite = lambda start, html: html.replace('https://movie.douban.com/subject/', 'https://example.com/', 2) if start == 0 else html
+
+    assert crawl(base_url, db_file, incremental=False) == 4 * main.PAGE_SIZE - 1
+    crawl(base_url, db_file, incremental=True)
+    crawl(base_url, db_file, incremental=True)
+
+    db = MovieDatabase(db_file)
+    try:
+        db.connect()
+        db.cursor.execute('SELECT COUNT(*), COUNT(subject_id) FROM movies')
+        assert db.cursor.fetchone() == (4 * main.PAGE_SIZE - 1, 4 * main.PAGE_SIZE - 1)
+    finally:
+        db.close()
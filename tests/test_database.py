@@ -0,0 +1,166 @@
+"""数据库写入的回归测试"""
+import sqlite3
+
+import pytest
+
+from database import MovieDatabase, ALL_MOVIES, FACETS, SORT_KEYS, STATS_BUCKET
+
+def test_claiming_legacy_rows_does_not_abort_batch(tmp_path):
+    db = MovieDatabase(str(tmp_path / 'movies.db'))
+    try:
+        db.create_table()
+        # 迁移前没有条目 ID 的两条同名旧记录，第一条被条目 1 认领
+        db.insert_movies([{'title': 'T'}, {'title': 'T'}], 'd')
+        claimed, _ = db.insert_movies([{'title': 'T', 'subject_id': '1'}], 'd')
+
+        ids, failures = db.insert_movies([{'title': 'T', 'subject_id': '1'}, {'title': 'U', 'subject_id': '2'}], 'd')
+        assert failures == []
+        assert ids[0] == claimed[0]
+        assert ids[1] is not None
+    finally:
+        db.close()
+
+def test_iter_rows_raises_when_query_fails_midway(tmp_path):
+    db = MovieDatabase(str(tmp_path / 'movies.db'))
+    try:
+        db.create_table()
+        db.insert_movies([{'title': f'T{i}', 'subject_id': str(i)} for i in range(5)], 'd')
+
+        def check(movie_id):
+            if movie_id > 3:
+                raise RuntimeError('磁盘错误')
+            return movie_id
+        db.conn.create_function('check_row', 1, check)
+
+        rows = []
+        with pytest.raises(sqlite3.Error):
+            for row in db.iter_rows('SELECT check_row(id) FROM movies ORDER BY id', columns=('id',), batch_size=1):
+                rows.append(row)
+        # 出错前已经产出了部分行，随后抛出而不是悄悄结束
+        assert rows and len(rows) < 5
+    finally:
+        db.close()
+
+def stats_rows(db):
+    """统计表中计数不为 0 的行：(movie_stats, facet_stats)"""
+    db.cursor.execute('SELECT doulist_id, bucket, movie_count, ROUND(rating_sum, 6) FROM movie_stats WHERE movie_count != 0')
+    movie_stats = set(db.cursor.fetchall())
+    db.cursor.execute('SELECT facet, value_id, movie_count FROM facet_stats WHERE movie_count != 0')
+    return movie_stats, set(db.cursor.fetchall())
+
+def expected_stats_rows(db):
+    """直接从电影表和关联表汇总出统计表应有的内容"""
+    bucket = STATS_BUCKET.format(row='m')
+    db.cursor.execute(f'''
+    SELECT ?, {bucket}, COUNT(*), ROUND(SUM(m.rating_num), 6) FROM movies m GROUP BY 2
+    UNION ALL
+    SELECT dm.doulist_id, {bucket}, COUNT(*), ROUND(SUM(m.rating_num), 6)
+    FROM doulist_movies dm JOIN movies m ON m.id = dm.movie_id GROUP BY 1, 2
+    ''', (ALL_MOVIES,))
+    movie_stats = set(db.cursor.fetchall())
+    facet_stats = set()
+    for name, (_, link, key, role) in FACETS.items():
+        where = f"WHERE role = '{role}'" if role else ''
+        db.cursor.execute(f'SELECT ?, {key}, COUNT(*) FROM {link} {where} GROUP BY {key}', (name,))
+        facet_stats.update(db.cursor.fetchall())
+    db.cursor.execute("SELECT 'year', year, COUNT(*) FROM movies WHERE year IS NOT NULL GROUP BY year")
+    facet_stats.update(db.cursor.fetchall())
+    return movie_stats, facet_stats
+
+def assert_stats_consistent(db):
+    assert stats_rows(db) == expected_stats_rows(db)
+    assert db.count_movies() == db.conn.execute('SELECT COUNT(*) FROM movies').fetchone()[0]
+    for doulist_id in ('a', 'b'):
+        count = db.conn.execute('SELECT COUNT(*) FROM doulist_movies WHERE doulist_id = ?', (doulist_id,)).fetchone()[0]
+        assert db.count_movies(doulist_id) == count
+
+def stats_movie(i, rating, year):
+    return {
+        'title': f'T{i}',
+        'rating': rating,
+        'abstract': f'导演: 导演{i % 2}\n主演: 演员{i % 3} / 演员{i % 4}\n类型: 类型{i % 3}\n制片国家/地区: 地区{i % 2}\n年份: {year}',
+        'time': f'2024-01-{i + 1:02d} 00:00:00',
+        'subject_id': str(i),
+    }
+
+def test_stats_tables_follow_every_write(tmp_path):
+    db = MovieDatabase(str(tmp_path / 'movies.db'))
+    try:
+        db.create_table()
+        db.insert_movies([stats_movie(i, f'{6 + i % 4}.5', 2000 + i % 3) for i in range(8)] + [stats_movie(8, '', 2001)], 'a')
+        assert_stats_consistent(db)
+
+        # upsert：评分跨区间、年份和简介变化
+        db.insert_movies([stats_movie(i, f'{3 + i % 2}.0', 1990 + i) for i in range(4)], 'a')
+        assert_stats_consistent(db)
+
+        # 同一批电影加入第二个豆列
+        db.insert_movies([stats_movie(i, f'{3 + i % 2}.0', 1990 + i) for i in range(2, 6)], 'b')
+        assert_stats_consistent(db)
+
+        # 豆列 a 只剩前 3 部：其余移出，不再属于任何豆列的电影被删除
+        db.delete_missing_movies('a', [str(i) for i in range(3)])
+        assert_stats_consistent(db)
+
+        db.cursor.execute("SELECT id FROM movies WHERE subject_id = '0'")
+        assert db.delete_movie(db.cursor.fetchone()[0])
+        assert_stats_consistent(db)
+    finally:
+        db.close()
+
+# 最初版本的电影表（没有数值列、条目 ID 和任何索引）
+BASELINE_SCHEMA = '''
+CREATE TABLE movies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    rating TEXT,
+    image TEXT,
+    abstract TEXT,
+    time TEXT,
+    doulist_id TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+'''
+
+def test_migrates_baseline_database_in_place(tmp_path):
+    path = str(tmp_path / 'movies.db')
+    legacy = [
+        ('旧电影一', '8.5', 'https://img.example.com/1.jpg', '导演: 甲\n类型: 剧情\n年份: 1994', '2023-05-01 10:00:00', 'a'),
+        ('旧电影二', '', 'https://img.example.com/2.jpg', '类型: 喜剧', '2023-05-02 10:00:00', 'b'),
+        ('旧电影三', '7.0', '', '', 'bad time', 'a'),
+    ]
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_SCHEMA)
+    conn.executemany('INSERT INTO movies (title, rating, image, abstract, time, doulist_id) VALUES (?, ?, ?, ?, ?, ?)', legacy)
+    conn.commit()
+    conn.close()
+
+    db = MovieDatabase(path)
+    try:
+        assert db.create_table()
+        # 再次启动时没有需要迁移的内容
+        assert db.create_table()
+
+        columns = {row[1] for row in db.conn.execute('PRAGMA table_info(movies)')}
+        assert {'rating_num', 'added_at', 'subject_id', 'year'} <= columns
+        indexes = {row[0] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'movies'")}
+        assert {f'idx_movies_sort_{sort_by}' for sort_by in SORT_KEYS} | {'idx_movies_subject', 'idx_movies_year'} <= indexes
+
+        rows = db.conn.execute(
+            'SELECT title, rating, image, abstract, time, doulist_id, rating_num, added_at, year, subject_id FROM movies ORDER BY id'
+        ).fetchall()
+        assert [row[:6] for row in rows] == legacy
+        assert [row[6:] for row in rows] == [
+            (8.5, 1682935200, 1994, None),
+            (0.0, 1683021600, None, None),
+            (7.0, 0, None, None),
+        ]
+
+        # 旧的豆列字段迁移到关联表，统计表、分面和全文索引按已有数据建好
+        assert db.count_movies('a') == 2
+        assert db.count_movies('b') == 1
+        assert_stats_consistent(db)
+        assert [movie['title'] for movie in db.get_sorted_movies('rating', 'desc')] == ['旧电影一', '旧电影三', '旧电影二']
+        assert [movie['title'] for movie in db.search_movies('旧电影二')] == ['旧电影二']
+    finally:
+        db.close()
@@ -0,0 +1,48 @@
+"""页面解析的黄金文件测试：两种解析后端在保存的豆列页面上的结果与 tests/fixtures/*.json 一致"""
+import glob
+import json
+import os
+
+import pytest
+
+import main
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+PAGES = sorted(os.path.basename(path)[:-len('.html')] for path in glob.glob(os.path.join(FIXTURE_DIR, '*.html')))
+
+# 快速解析可用的树构建器（未安装 lxml 时跳过）
+BUILDERS = [pytest.param('lxml', marks=pytest.mark.skipif(main.FAST_TREE_BUILDER != 'lxml', reason='未安装 lxml')), 'html.parser']
+
+def load_page(name):
+    with open(os.path.join(FIXTURE_DIR, f'{name}.html'), encoding='utf-8') as f:
+        html = f.read()
+    with open(os.path.join(FIXTURE_DIR, f'{name}.json'), encoding='utf-8') as f:
+        golden = json.load(f)
+    return html, (golden['items'], golden['total_pages'])
+
+@pytest.mark.parametrize('name', PAGES)
+def test_bs4_parser_matches_golden(name):
+    html, golden = load_page(name)
+    assert main.parse_page_bs4(html) == golden
+
+@pytest.mark.parametrize('builder', BUILDERS)
+@pytest.mark.parametrize('name', PAGES)
+def test_fast_parser_matches_bs4(name, builder, monkeypatch):
+    monkeypatch.setattr(main, 'FAST_TREE_BUILDER', builder)
+    html, golden = load_page(name)
+    assert main.parse_page_fast(html) == main.parse_page_bs4(html) == golden
+
+@pytest.mark.parametrize('builder', BUILDERS)
+def test_item_without_actions_has_no_time(builder, monkeypatch):
+    monkeypatch.setattr(main, 'FAST_TREE_BUILDER', builder)
+    html, _ = load_page('doulist_first_page')
+    items, _ = main.parse_page_fast(html)
+    without_actions = [item for item in items if item.get('subject_id') == '1295644']
+    assert len(without_actions) == 1
+    assert 'time' not in without_actions[0]
+    assert without_actions[0]['title'] == "这个杀手不太冷 L'Éon"
+
+def test_doulist_title():
+    html, _ = load_page('doulist_single_page')
+    assert main.parse_doulist_title(html) == '小豆列 & 测试'
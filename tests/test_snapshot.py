@@ -0,0 +1,125 @@
+"""快照发布测试：连接池切换、发布前检查和旧快照清理"""
+import os
+
+import pytest
+
+import main
+import snapshot
+from conftest import DOULIST_ID
+from database import MovieDatabase, ConnectionPool
+
+def movies(start, count):
+    return [{'title': f'电影{i}', 'subject_id': str(i)} for i in range(start, start + count)]
+
+def publish(db_file, rows):
+    """暂存当前数据库、写入 rows 后发布，返回快照文件路径"""
+    staging = snapshot.stage_snapshot(db_file)
+    db = MovieDatabase(staging, bulk=True)
+    try:
+        db.insert_movies(rows, DOULIST_ID)
+    finally:
+        db.close()
+    snapshot.finish_snapshot(staging)
+    assert snapshot.validate_snapshot(staging, db_file) is None
+    snapshot.publish_snapshot(staging, db_file)
+    return staging
+
+def count_movies(db):
+    if not db.conn:
+        db.connect()
+    db.cursor.execute('SELECT COUNT(*) FROM movies')
+    return db.cursor.fetchone()[0]
+
+def crawl_all(base_url, db_file):
+    """全量爬取桩服务器上的豆列并以快照发布"""
+    return main.fetch_many_doulists([DOULIST_ID], incremental=False, base_url=base_url, db_file=db_file,
+                                    rate=1000, burst=1000, backoff=0.01)
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'movies.db')
+
+def test_pool_switches_to_published_snapshot(db_file):
+    first = publish(db_file, movies(0, 4))
+    assert os.path.realpath(db_file) == first
+    pool = ConnectionPool(db_file, size=2, readonly=True)
+    try:
+        held = MovieDatabase(pool=pool)
+        assert count_movies(held) == 4
+
+        second = publish(db_file, movies(4, 2))
+        assert os.path.realpath(db_file) == second
+
+        # 发布后借出的连接读新快照，发布前借出的连接继续读旧快照
+        fresh = MovieDatabase(pool=pool)
+        assert count_movies(fresh) == 6
+        assert count_movies(held) == 4
+        fresh.close()
+
+        # 连着旧快照的连接归还时关闭，不再回到池中
+        held.close()
+        assert pool.open_count == 1
+        assert pool.idle_count == 1
+    finally:
+        pool.close_all()
+
+def test_keeps_only_recent_snapshots(db_file):
+    published = [publish(db_file, movies(i, 1)) for i in range(4)]
+    assert snapshot.snapshot_files(db_file) == published[-snapshot.KEEP_SNAPSHOTS:]
+    assert os.path.realpath(db_file) == published[-1]
+
+def test_corrupt_snapshot_is_discarded(stub, db_file, monkeypatch):
+    _, base_url = stub
+    crawl_all(base_url, db_file)
+    live = os.path.realpath(db_file)
+
+    def finish_and_corrupt(path):
+        # 写坏电影表的根页
+        result = snapshot.finish_snapshot(path)
+        db = MovieDatabase(path)
+        try:
+            db.connect()
+            db.cursor.execute("SELECT rootpage FROM sqlite_master WHERE name = 'movies'")
+            root = db.cursor.fetchone()[0]
+            db.cursor.execute('PRAGMA page_size')
+            page_size = db.cursor.fetchone()[0]
+        finally:
+            db.close()
+        with open(path, 'r+b') as f:
+            f.seek((root - 1) * page_size)
+            f.write(b'\xff' * page_size)
+        return result
+    monkeypatch.setattr(main, 'finish_snapshot', finish_and_corrupt)
+
+    problems = []
+    def record_problem(path, live_file):
+        problems.append(snapshot.validate_snapshot(path, live_file))
+        return problems[-1]
+    monkeypatch.setattr(main, 'validate_snapshot', record_problem)
+    crawl_all(base_url, db_file)
+
+    assert len(problems) == 1 and problems[0] is not None
+    assert os.path.realpath(db_file) == live
+    assert snapshot.snapshot_files(db_file) == [live]
+    db = MovieDatabase(db_file)
+    try:
+        assert count_movies(db) == 4 * main.PAGE_SIZE
+    finally:
+        db.close()
+
+def test_snapshot_losing_too_many_movies_is_discarded(stub, db_file):
+    doulist, base_url = stub
+    crawl_all(base_url, db_file)
+    live = os.path.realpath(db_file)
+
+    # 豆列只剩 1 页：全量爬取删掉其余电影后不足原来的 MIN_SNAPSHOT_RATIO
+    doulist.total_pages = 1
+    crawl_all(base_url, db_file)
+
+    assert os.path.realpath(db_file) == live
+    assert snapshot.snapshot_files(db_file) == [live]
+    db = MovieDatabase(db_file)
+    try:
+        assert count_movies(db) == 4 * main.PAGE_SIZE
+    finally:
+        db.close()
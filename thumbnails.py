@@ -0,0 +1,141 @@
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fetcher import PageFetcher, IMAGE_HEADERS
+
+logger = logging.getLogger(__name__)
+
+# 缩略图依赖 Pillow，未安装时跳过生成，接口退回代理原图
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 缩略图目录、预生成的宽度和编码格式
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_WIDTHS = (160, 320, 640)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+def variant_base(url, thumbnail_dir=THUMBNAIL_DIR):
+    """图片地址对应的缩略图文件路径前缀（按地址哈希分目录）"""
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(os.path.abspath(thumbnail_dir), digest[:2], digest)
+
+def variant_path(url, width, ext, thumbnail_dir=THUMBNAIL_DIR):
+    """某个宽度和格式的缩略图文件路径"""
+    return f'{variant_base(url, thumbnail_dir)}_{width}.{ext}'
+
+def find_variant(url, width, accept_webp=True, thumbnail_dir=THUMBNAIL_DIR):
+    """按请求宽度选择已生成的缩略图，返回 (文件路径, MIME 类型)，没有时返回 None
+
+    选择不小于请求宽度的最小尺寸，请求宽度超过所有尺寸时使用最大的一档；
+    客户端支持 WebP 时优先返回 WebP。
+    """
+    candidates = [w for w in THUMBNAIL_WIDTHS if w >= width] or [THUMBNAIL_WIDTHS[-1]]
+    chosen = min(candidates)
+    for ext in (('webp', 'jpg') if accept_webp else ('jpg',)):
+        path = variant_path(url, chosen, ext, thumbnail_dir)
+        if os.path.exists(path):
+            return path, THUMBNAIL_FORMATS[ext][1]
+    return None
+
+def has_all_variants(url, thumbnail_dir=THUMBNAIL_DIR):
+    """是否已经生成了该图片的全部缩略图"""
+    return all(
+        os.path.exists(variant_path(url, width, ext, thumbnail_dir))
+        for width in THUMBNAIL_WIDTHS
+        for ext in THUMBNAIL_FORMATS
+    )
+
+def render_variants(data, base_path):
+    """把原图缩放为各个宽度并编码为所有格式（在子进程中运行），返回生成的文件数"""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    os.makedirs(os.path.dirname(base_path), exist_ok=True)
+    count = 0
+    for width in THUMBNAIL_WIDTHS:
+        # 原图不够宽时不放大
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+        else:
+            resized = image
+
+        for ext, (fmt, _, options) in THUMBNAIL_FORMATS.items():
+            path = f'{base_path}_{width}.{ext}'
+            # 先写临时文件再替换，接口不会读到写了一半的文件
+            tmp_path = f'{path}.part'
+            resized.save(tmp_path, fmt, **options)
+            os.replace(tmp_path, path)
+            count += 1
+    return count
+
+def _download(fetcher, url):
+    """下载一张原图，失败时返回 None 而不是中断整批"""
+    try:
+        return fetcher.fetch_content(url)
+    except Exception as e:
+        logger.warning('下载图片失败: %s - %s', url, e)
+        return None
+
+def generate_thumbnails(db_file='movies.db', thumbnail_dir=THUMBNAIL_DIR, workers=None, rate=5, force=False):
+    """为数据库中所有电影海报生成缩略图，返回处理成功的图片数
+
+    原图由线程池并发下载（每张只下载一次），缩放和编码交给进程池并行完成；
+    已生成全部尺寸的图片会被跳过，除非 force=True。
+    """
+    if Image is None:
+        logger.warning('未安装 Pillow，跳过缩略图生成')
+        return 0
+
+    conn = sqlite3.connect(db_file)
+    try:
+        urls = [row[0] for row in conn.execute("SELECT DISTINCT image FROM movies WHERE image IS NOT NULL AND image != ''")]
+    finally:
+        conn.close()
+
+    if not force:
+        urls = [url for url in urls if not has_all_variants(url, thumbnail_dir)]
+    logger.info('需要生成缩略图的海报: %d 张', len(urls))
+    if not urls:
+        return 0
+
+    fetcher = PageFetcher(rate=rate, burst=rate, headers=IMAGE_HEADERS)
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            downloads = {fetcher.executor.submit(_download, fetcher, url): url for url in urls}
+            renders = {}
+            # 每张图下载完成后立即交给进程池处理
+            for future in as_completed(downloads):
+                url = downloads[future]
+                data = future.result()
+                if data:
+                    renders[pool.submit(render_variants, data, variant_base(url, thumbnail_dir))] = url
+
+            for future in as_completed(renders):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as e:
+                    logger.warning('生成缩略图失败: %s - %s', renders[future], e)
+    finally:
+        fetcher.close()
+
+    logger.info('缩略图生成完成，共处理 %d 张海报', done)
+    return done
+
+if __name__ == '__main__':
+    # python thumbnails.py [--force]：为 movies.db 中的海报生成缩略图
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    generate_thumbnails(force='--force' in sys.argv)
@@ -0,0 +1,8 @@
+"""生产环境的 WSGI 入口：gunicorn -c gunicorn.conf.py wsgi:app（其他 WSGI 服务器同样使用 wsgi:app）"""
+from app import app, read_pool, image_cache, image_proxy
+
+def shutdown():
+    """关闭本进程的数据库连接池、图片缓存索引和源站连接，由服务器在工作进程退出时调用"""
+    read_pool.close_all()
+    image_cache.close()
+    image_proxy.close()